@@ -0,0 +1,5 @@
+"""
+Benchmarks for ctproc, run from the repository root, e.g.
+
+    python -m benchmarks.bench_field_plan
+"""
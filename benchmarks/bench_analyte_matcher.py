@@ -0,0 +1,79 @@
+"""
+Analyte matching time as the dictionary grows: the regex alternation lab.patterns used to
+compile vs. the trie AnalyteMatcher, over the eligibility criteria of the test documents.
+The dictionary is the built-in lab test names and aliases plus made-up analyte names, up
+to --scales times as many.
+
+    python -m benchmarks.bench_analyte_matcher --scales 1 10 100
+"""
+import argparse
+import random
+import re
+import string
+import time
+
+from benchmarks.synth import DocPools
+from ctproc.lab.matcher import AnalyteMatcher
+from ctproc.lab.patterns import _analyte_names
+
+
+def make_names(n, seed=0):
+    rng = random.Random(seed)
+    syllables = ["ami", "no", "lase", "glo", "bin", "pro", "tein", "chol", "ester", "ol", "tri", "gly", "cer", "ide",
+                 "fer", "rit", "in", "hapto", "uro", "bili", "cal", "ci", "tonin", "thyro", "xine", "lact", "ate"]
+    names = set()
+    while len(names) < n:
+        word = "".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).capitalize()
+        if rng.random() < 0.3:
+            word += " " + "".join(rng.choice(syllables) for _ in range(rng.randint(1, 3)))
+        if rng.random() < 0.2:
+            word = "".join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(3, 5)))
+        names.add(word)
+    return names
+
+
+def build_pattern(names):
+    alternation = "|".join(sorted(map(re.escape, names), key=len, reverse=True))
+    return re.compile(rf"(?<![a-zA-Z])({alternation})(?![a-zA-Z])", re.IGNORECASE)
+
+
+def run(scales, repeat):
+    texts = [" - ".join(DocPools().criteria)] * 5
+    n_chars = sum(len(text) for text in texts)
+    base_names = _analyte_names()
+    print(f"{n_chars} chars of criteria, {len(base_names)} built-in names")
+    for scale in scales:
+        names = base_names | make_names(len(base_names) * (scale - 1))
+
+        t0 = time.perf_counter()
+        pattern = build_pattern(names)
+        t_compile = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        matcher = AnalyteMatcher(names)
+        t_build = time.perf_counter() - t0
+
+        regex_spans = [m.span(1) for text in texts for m in pattern.finditer(text)]
+        assert regex_spans == [span for text in texts for span in matcher.finditer(text)]
+
+        timings = {}
+        for label, func in [("regex", lambda text: [m.span(1) for m in pattern.finditer(text)]),
+                            ("trie", lambda text: list(matcher.finditer(text)))]:
+            times = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                for text in texts:
+                    func(text)
+                times.append(time.perf_counter() - t0)
+            timings[label] = min(times)
+
+        print(f"{scale:>4}x {len(names):>7} names: regex {n_chars / timings['regex'] / 1e6:6.2f} M chars/sec "
+              f"(compile {t_compile:.2f} s)   trie {n_chars / timings['trie'] / 1e6:6.2f} M chars/sec "
+              f"(build {t_build:.2f} s)   {len(regex_spans)} matches")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.scales, args.repeat)
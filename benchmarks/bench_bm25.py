@@ -0,0 +1,70 @@
+"""
+BM25 search of many topics over synthetic trials (criteria recombined from the test documents):
+BM25Index.search_batch, one sparse product per batch of topics, vs. BM25Index.search one topic
+at a time, as scripts/indexing.py's get_top_N calls it, and the python loop scorer of the tests
+(tests.test_retrieval.loop_bm25) checks the scores of a few topics on the first 2000 docs.
+
+    python -m benchmarks.bench_bm25 --n-docs 100000 --n-topics 75
+"""
+import argparse
+import random
+import tempfile
+import time
+
+from benchmarks.synth import DocPools, make_topic_texts
+from ctproc.retrieval import BM25Index
+from tests.test_retrieval import loop_bm25
+
+
+def make_texts(n_docs, seed=0):
+    rng = random.Random(seed)
+    criteria = DocPools().criteria
+    return [" ".join(rng.sample(criteria, rng.randint(3, 20))) for _ in range(n_docs)]
+
+
+def best_of(repeat, func):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(args):
+    texts = make_texts(args.n_docs)
+    ids = [f"NCT{i:08d}" for i in range(args.n_docs)]
+    topics = make_topic_texts(args.n_topics)
+
+    check_texts = texts[:2000]
+    check_index = BM25Index.build([str(i) for i in range(len(check_texts))], check_texts)
+    for topic, hits in zip(topics[:args.n_check], check_index.search_batch(topics[:args.n_check], k=len(check_texts))):
+        expected = loop_bm25(check_texts, topic)
+        assert len(hits) == len(expected)
+        assert all(abs(hit.score - expected[int(hit.docid)]) <= 1e-5 * expected[int(hit.docid)] for hit in hits)
+
+    t0 = time.perf_counter()
+    index = BM25Index.build(ids, texts)
+    print(f"{args.n_docs} docs, {len(index.terms)} terms, {index.postings.nnz} postings, built in {time.perf_counter() - t0:.2f} s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index.save(tmp)
+        t0 = time.perf_counter()
+        index = BM25Index.load(tmp)
+        print(f"memory mapped in {time.perf_counter() - t0:.3f} s")
+
+        batch = best_of(args.repeat, lambda: index.search_batch(topics, k=args.k))
+        single = best_of(args.repeat, lambda: [index.search(topic, k=args.k) for topic in topics])
+    print(f"  batch: {batch:8.3f} s for {args.n_topics} topics, top {args.k}")
+    print(f" single: {single:8.3f} s for {args.n_topics} topics, top {args.k}")
+    print(f"speedup: {single / batch:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-docs", type=int, default=100000)
+    parser.add_argument("--n-topics", type=int, default=75)
+    parser.add_argument("--k", type=int, default=1500, help="hits per topic, get_top_N's search_max")
+    parser.add_argument("--n-check", type=int, default=3, help="topics checked against the python loop")
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
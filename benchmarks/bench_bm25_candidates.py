@@ -0,0 +1,73 @@
+"""
+BM25 search limited to candidate trials, over synthetic trials: BM25Index.search_batch with
+candidates vs. searching the whole index to a fixed depth and filtering the hits after, as
+scripts/indexing.py's get_top_N did (search_max=1500), for two kinds of candidate sets: the age
+and gender prefilter (prefilter.DemographicIndex) of each topic, top --k of them, and small
+sets like the judged trials of a topic, all of them ranked.
+
+    python -m benchmarks.bench_bm25_candidates --n-docs 100000 --n-topics 75
+"""
+import argparse
+import random
+
+from benchmarks.bench_bm25 import best_of, make_texts
+from benchmarks.synth import make_topic_texts
+from ctproc.prefilter import DemographicIndex
+from ctproc.retrieval import BM25Index
+from tests.test_prefilter import random_docs_and_topics
+
+
+def over_fetch(index, topics, candidates, k, depth):
+    results = []
+    for topic, candidate_ids in zip(topics, candidates):
+        candidate_ids = set(candidate_ids)
+        hits = index.search(topic, depth)
+        results.append([hit for hit in hits if hit.docid in candidate_ids][:k])
+    return results
+
+
+def main(args):
+    texts = make_texts(args.n_docs)
+    ids = [f"NCT{i:08d}" for i in range(args.n_docs)]
+    topics = make_topic_texts(args.n_topics)
+    index = BM25Index.build(ids, texts)
+
+    docs, demographics = random_docs_and_topics(args.n_docs, args.n_topics)
+    for doc, doc_id in zip(docs, ids):
+        doc['id'] = doc_id
+    eligible = DemographicIndex.from_docs(docs).query_topics(demographics)
+    rng = random.Random(0)
+    candidate_sets = {
+        'prefilter': [eligible[topic['id']] for topic in demographics],
+        'judged': [rng.sample(ids, args.n_judged) for _ in topics],
+    }
+
+    for name, candidates in candidate_sets.items():
+        k = args.k if name == 'prefilter' else args.n_judged
+        exact = index.search_batch(topics, k=args.n_docs)
+        expected = []
+        for hits, candidate_ids in zip(exact, candidates):
+            candidate_ids = set(candidate_ids)
+            expected.append([hit for hit in hits if hit.docid in candidate_ids][:k])
+        found = index.search_batch(topics, k=k, candidates=candidates)
+        assert found == expected
+        lost = sum(len(e) - len(f) for e, f in zip(expected, over_fetch(index, topics, candidates, k, args.depth)))
+
+        pushdown = best_of(args.repeat, lambda: index.search_batch(topics, k=k, candidates=candidates))
+        after = best_of(args.repeat, lambda: over_fetch(index, topics, candidates, k, args.depth))
+        mean_size = sum(len(c) for c in candidates) / len(candidates)
+        print(f"{name}: {mean_size:.0f} candidates per topic on average, top {k}")
+        print(f"  candidates: {pushdown:8.3f} s for {args.n_topics} topics")
+        print(f"  over-fetch: {after:8.3f} s for {args.n_topics} topics, {lost} candidate hits lost past the depth")
+        print(f"     speedup: {after / pushdown:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-docs", type=int, default=100000)
+    parser.add_argument("--n-topics", type=int, default=75)
+    parser.add_argument("--k", type=int, default=1000, help="hits per topic of the prefilter candidates")
+    parser.add_argument("--n-judged", type=int, default=1000, help="size of the small candidate sets")
+    parser.add_argument("--depth", type=int, default=1500, help="hits searched before filtering, get_top_N's search_max")
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
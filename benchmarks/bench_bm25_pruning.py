@@ -0,0 +1,142 @@
+"""
+BM25 search of long topics with maxscore vs. the exhaustive sparse product of BM25Index.search_batch,
+for raw topics and topics expanded with aliases, as CTTopic.expand_with_aliases does. maxscore is not
+part of BM25Index: it was slower than the exhaustive search on both (0.4x-0.8x on 50k-100k trials),
+so it lives here, as a reference to reproduce that with.
+
+the criteria of the test documents have a few hundred distinct words, too few to prune anything, so
+the trials and topics are drawn from a zipf vocabulary, and aliases are words of the vocabulary's
+middle and tail, rarer than the words of the raw topic. the hits of maxscore are checked to be those
+of the exhaustive search.
+
+    python -m benchmarks.bench_bm25_pruning --n-docs 100000 --n-topics 50
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+from scipy import sparse
+
+from benchmarks.bench_bm25 import best_of
+from ctproc.retrieval import BM25Index
+
+
+# the threshold is seeded with the k best postings of this many of the query's terms
+SEED_TERMS = 8
+
+# the threshold is lowered by this much, relative, so float32 rounding never prunes a document that ties it
+THRESHOLD_SLACK = 1e-5
+
+
+def zipf_texts(n_texts, n_words, vocab, seed=0, a=1.1):
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(n_words // 4, n_words, n_texts)
+    words = rng.zipf(a, lengths.sum()) % vocab
+    texts, start = [], 0
+    for length in lengths:
+        texts.append(" ".join(f"w{word}" for word in words[start:start + length].tolist()))
+        start += length
+    return texts
+
+
+def expand_with_aliases(topics, n_aliases, vocab, seed=0):
+    rng = random.Random(seed)
+    return [topic + " " + " ".join(f"w{rng.randrange(100, vocab // 5)}" for _ in range(n_aliases)) for topic in topics]
+
+
+class MaxScore:
+    """
+    each term's postings of the index sorted by impact, highest first, searched with maxscore: the best
+    postings of the query's top terms give a threshold theta the k-th hit scores at least, the terms
+    whose bounds (weight times max impact) sum below theta are non-essential, only the postings of the
+    others are summed, and the documents that can still reach theta are scored in full from their rows
+    of doc_postings
+    """
+    def __init__(self, index):
+        self.index = index
+        postings = index.postings
+        rows = np.repeat(np.arange(postings.shape[0]), np.diff(postings.indptr))
+        order = np.lexsort((postings.indices, -postings.data, rows))
+        self.ordered_docs = np.asarray(postings.indices)[order]
+        ordered_impacts = np.asarray(postings.data)[order]
+        self.max_impacts = np.zeros(postings.shape[0], dtype=np.float32)
+        has_postings = index.doc_freqs > 0
+        self.max_impacts[has_postings] = ordered_impacts[postings.indptr[:-1][has_postings]]
+
+    def search_batch(self, queries, k):
+        weights = self.index.query_matrix(queries)
+        return [self.search(weights[row], k) for row in range(len(queries))]
+
+    def search(self, weights, k):
+        index = self.index
+        terms = weights.indices
+        if len(terms) == 0:
+            return []
+        indptr = index.postings.indptr
+        dense = np.zeros(len(index.terms), dtype=np.float32)
+        dense[terms] = weights.data
+        bounds = weights.data.astype(np.float64) * self.max_impacts[terms]
+
+        seed_terms = terms[np.argsort(-bounds, kind='stable')[:SEED_TERMS]]
+        seeds = np.unique(np.concatenate([self.ordered_docs[indptr[t]:min(indptr[t] + k, indptr[t + 1])] for t in seed_terms]))
+        seed_scores = index.doc_postings[seeds] @ dense
+        if np.count_nonzero(seed_scores) < k:
+            return self.exhaustive(weights, k)
+        theta = np.partition(seed_scores, len(seed_scores) - k)[len(seed_scores) - k] * (1 - THRESHOLD_SLACK)
+
+        by_bound = np.argsort(bounds, kind='stable')
+        n_non_essential = int(np.searchsorted(np.cumsum(bounds[by_bound]), theta, side='left'))
+        if n_non_essential == 0:
+            return self.exhaustive(weights, k)
+        essential = np.sort(by_bound[n_non_essential:])
+        essential_weights = sparse.csr_matrix(
+            (weights.data[essential], terms[essential], np.array([0, len(essential)], dtype=indptr.dtype)),
+            shape=weights.shape,
+        )
+        partial = (essential_weights @ index.postings).tocsr()
+        # partial scores are lower bounds of the full ones, so their k-th best can raise theta
+        if partial.nnz >= k:
+            theta = max(theta, np.partition(partial.data, partial.nnz - k)[partial.nnz - k] * (1 - THRESHOLD_SLACK))
+        docs = partial.indices[partial.data + bounds[by_bound[:n_non_essential]].sum() >= theta]
+        return index._hits(docs, index.doc_postings[docs] @ dense, k)
+
+    def exhaustive(self, weights, k):
+        scores = (weights @ self.index.postings).tocsr()
+        return self.index._hits(scores.indices, scores.data, k)
+
+
+def main(args):
+    texts = zipf_texts(args.n_docs, args.doc_words, args.vocab)
+    t0 = time.perf_counter()
+    index = BM25Index.build([f"NCT{i:08d}" for i in range(args.n_docs)], texts)
+    print(f"{args.n_docs} docs, {len(index.terms)} terms, {index.postings.nnz} postings, built in {time.perf_counter() - t0:.2f} s")
+    t0 = time.perf_counter()
+    maxscore = MaxScore(index)
+    print(f"impact ordered postings in {time.perf_counter() - t0:.2f} s")
+
+    raw = zipf_texts(args.n_topics, args.topic_words, args.vocab, seed=1)
+    topic_sets = {'raw': raw, 'expanded': expand_with_aliases(raw, args.n_aliases, args.vocab)}
+    for name, topics in topic_sets.items():
+        n_terms = index.query_matrix(topics).getnnz(axis=1).mean()
+        for k in args.k:
+            assert maxscore.search_batch(topics, k) == index.search_batch(topics, k=k)
+            exhaustive = best_of(args.repeat, lambda: index.search_batch(topics, k=k))
+            pruned = best_of(args.repeat, lambda: maxscore.search_batch(topics, k))
+            print(f"{name}: {n_terms:.0f} terms per topic on average, top {k}")
+            print(f"  exhaustive: {exhaustive:8.3f} s for {args.n_topics} topics")
+            print(f"    maxscore: {pruned:8.3f} s for {args.n_topics} topics")
+            print(f"     speedup: {exhaustive / pruned:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-docs", type=int, default=100000)
+    parser.add_argument("--n-topics", type=int, default=50)
+    parser.add_argument("--vocab", type=int, default=100000)
+    parser.add_argument("--doc-words", type=int, default=400, help="most words of a trial, the fewest are a quarter")
+    parser.add_argument("--topic-words", type=int, default=80, help="most words of a raw topic")
+    parser.add_argument("--n-aliases", type=int, default=200, help="alias words added to each topic")
+    parser.add_argument("--k", type=int, nargs="+", default=[10, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,79 @@
+"""
+clean_sentences_batch vs. the per word regex cleaning it replaced, over the criteria fragments
+of synthetic eligibility textblocks (benchmarks.synth). The first repeat starts from an empty
+word cache.
+
+    python -m benchmarks.bench_clean_sentences --n-docs 2000 --repeat 5
+"""
+import argparse
+import random
+import re
+import time
+
+from benchmarks.synth import DocPools, make_criteria_text
+from ctproc import utils
+from ctproc.eligibility import criteria_fragments, split_exc_headers
+from ctproc.skip_crit import SKIP_CRIT
+from ctproc.utils import clean_sentences_batch
+
+
+def legacy_check_word(word, words_to_remove=["criteria", "include", "exclude", "inclusion", "exclusion", "eligibility"]):
+    w = word.strip(":-,")
+    if re.match(r'[A-Z][A-Z][A-Z][A-Z][A-Z][A-Z]+(?: [A-Z]+)?', w):
+        return False
+    if w.lower() in words_to_remove:
+        return False
+    return True
+
+
+def legacy_clean_sentences(sent_list):
+    new_sents = []
+    for sent in sent_list:
+        for s in re.split(r"- ", sent):
+            s = ' '.join([w for w in s.split() if legacy_check_word(w)]).strip('.,;:')
+            m = re.match(r'\d+. *(?P<crit>.*)', s)
+            if m is not None:
+                s = m['crit']
+            if len(s) > 2 and s not in SKIP_CRIT:
+                new_sents.append(s)
+    return new_sents
+
+
+def make_sent_lists(n_docs, seed=0):
+    rng = random.Random(seed)
+    pools = DocPools()
+    sent_lists = []
+    for _ in range(n_docs):
+        chunks = split_exc_headers(make_criteria_text(rng, pools))
+        sent_lists.extend([criteria_fragments(chunks[:1]), criteria_fragments(chunks[1:])])
+    return sent_lists
+
+
+def run(n_docs, repeat):
+    sent_lists = make_sent_lists(n_docs)
+    assert clean_sentences_batch(sent_lists) == [legacy_clean_sentences(sents) for sents in sent_lists]
+
+    timings = {}
+    for label, func in [("per word regex", lambda: [legacy_clean_sentences(sents) for sents in sent_lists]),
+                        ("batch", lambda: clean_sentences_batch(sent_lists))]:
+        utils._word_verdicts.clear()
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - t0)
+        timings[label] = times
+
+    n_sents = sum(len(sents) for sents in sent_lists)
+    for label, times in timings.items():
+        print(f"{label:>16}: {1e6 * min(times) / n_sents:6.2f} us/sentence  (first repeat {1e6 * times[0] / n_sents:.2f})")
+    base, new = (min(times) for times in timings.values())
+    print(f"{'speedup':>16}: {base / new:.2f}x  over {n_sents} sentences")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-docs", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.n_docs, args.repeat)
@@ -0,0 +1,59 @@
+"""
+Concept similarity of every topic to every trial: ConceptMatrices.scores, one sparse product of the
+topics x cuis and cuis x trials matrices, vs. the python overlap of each topic's and each trial's
+cuis (tests.test_concepts.loop_concept_scores), on synthetic trials and topics with skewed cuis.
+also times saving and loading the matrices as .npz, what a rerun of the scoring reads.
+
+    python -m benchmarks.bench_concept_scores --n-trials 100000 --n-topics 75
+"""
+import argparse
+import tempfile
+import time
+
+from benchmarks.bench_bm25 import best_of
+from ctproc.concepts import ConceptMatrices, TopicMatrix
+from tests.test_concepts import loop_concept_scores, make_cuis, random_concept_docs_and_topics
+
+
+def main(args):
+    docs, topics = random_concept_docs_and_topics(args.n_trials, args.n_topics, cuis=make_cuis(args.n_cuis))
+
+    t0 = time.perf_counter()
+    matrices = ConceptMatrices.from_docs(docs)
+    topic_matrix = matrices.topic_matrix(topics)
+    print(f"{args.n_trials} trials, {len(matrices.cuis)} cuis, {matrices.include.nnz + matrices.exclude.nnz} entries, built in {time.perf_counter() - t0:.2f} s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        matrices.save(f"{tmp}/trials")
+        topic_matrix.save(f"{tmp}/topics")
+        saved = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        matrices = ConceptMatrices.load(f"{tmp}/trials")
+        topic_matrix = TopicMatrix.load(f"{tmp}/topics")
+        print(f"  saved in {saved:.2f} s, loaded in {time.perf_counter() - t0:.2f} s")
+
+    matrices.by_cui('include')
+    product = best_of(args.repeat, lambda: matrices.scores(topic_matrix))
+    scores = matrices.scores(topic_matrix)
+    print(f"  sparse product: {product * 1000:8.1f} ms for {args.n_topics} topics, {scores.nnz} topic-trial scores")
+
+    loop_topics = topics[:args.n_loop]
+    t0 = time.perf_counter()
+    expected = loop_concept_scores(docs, loop_topics)
+    loop = (time.perf_counter() - t0) * args.n_topics / len(loop_topics)
+    scores = scores.tocoo()
+    found = {(topic_matrix.topic_ids[row], matrices.trial_ids[col]): score for row, col, score in zip(scores.row, scores.col, scores.data) if row < len(loop_topics)}
+    assert found.keys() == expected.keys() and all(abs(found[key] - score) <= 1e-5 * score for key, score in expected.items())
+    print(f"    python loop: {loop * 1000:8.1f} ms for {args.n_topics} topics (from {len(loop_topics)})")
+    print(f"        speedup: {loop / product:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-trials", type=int, default=100000)
+    parser.add_argument("--n-topics", type=int, default=75)
+    parser.add_argument("--n-cuis", type=int, default=20000)
+    parser.add_argument("--n-loop", type=int, default=2, help="topics timed with the python loop, it is slow")
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
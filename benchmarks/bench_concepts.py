@@ -0,0 +1,69 @@
+"""
+Concept candidates of trials for many topics: ConceptIndex.query_topics (trials whose inclusion
+criteria have any of a topic's cuis, less those whose exclusion criteria have any) vs. scanning the
+space joined include_cuis / exclude_cuis strings of CTDocument.get_filtered_doc_as_dict() for each
+topic, on synthetic trials and topics with skewed cuis.
+
+    python -m benchmarks.bench_concepts --n-trials 400000 --n-topics 75
+"""
+import argparse
+import random
+import time
+
+from benchmarks.bench_bm25 import best_of
+from ctproc.concepts import ConceptIndex, topic_concepts
+from tests.test_concepts import make_cuis, random_concept_docs_and_topics, random_ent_sents
+
+
+def scan_strings(filtered, topics):
+    result = {}
+    for topic in topics:
+        cuis = {concept.cui for concept in topic_concepts(topic)}
+        result[topic['id']] = [
+            doc['nct_id'] for doc in filtered
+            if cuis.intersection(doc['include_cuis'].split()) and not cuis.intersection(doc['exclude_cuis'].split())
+        ]
+    return result
+
+
+def random_filtered_docs(n_trials, cuis, seed=0):
+    # the dicts of get_filtered_doc_as_dict(), much smaller than whole docs with their entities
+    rng = random.Random(seed)
+    return [
+        {'nct_id': f"NCT{i:08d}", **{f'{criteria}_cuis': ' '.join(ent.cui['val'] for sent in random_ent_sents(rng, cuis) for ent in sent) for criteria in ('include', 'exclude')}}
+        for i in range(n_trials)
+    ]
+
+
+def main(args):
+    cuis = make_cuis(args.n_cuis)
+    filtered = random_filtered_docs(args.n_trials, cuis)
+    _, topics = random_concept_docs_and_topics(0, args.n_topics, cuis=cuis)
+
+    t0 = time.perf_counter()
+    index = ConceptIndex.from_docs(filtered)
+    print(f"{args.n_trials} trials, {len(index.cuis)} cuis, {index.include.nnz + index.exclude.nnz} postings, built in {time.perf_counter() - t0:.2f} s")
+
+    for match in ('any', 'all'):
+        found = index.query_topics(topics, match=match)
+        indexed = best_of(args.repeat, lambda: index.query_topics(topics, match=match))
+        mean_size = sum(len(ids) for ids in found.values()) / len(found)
+        print(f"  index, {match}: {indexed * 1000:8.1f} ms for {args.n_topics} topics, {mean_size:.0f} candidates per topic on average")
+
+    scan_topics = topics[:args.n_scan]
+    t0 = time.perf_counter()
+    expected = scan_strings(filtered, scan_topics)
+    scan = (time.perf_counter() - t0) * args.n_topics / len(scan_topics)
+    found = index.query_topics(scan_topics)
+    assert all(list(found[topic_id]) == ids for topic_id, ids in expected.items())
+    print(f"  string scan: {scan * 1000:8.1f} ms for {args.n_topics} topics (from {len(scan_topics)})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-trials", type=int, default=400000)
+    parser.add_argument("--n-topics", type=int, default=75)
+    parser.add_argument("--n-cuis", type=int, default=20000)
+    parser.add_argument("--n-scan", type=int, default=3, help="topics timed with the string scan, it is slow")
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,85 @@
+"""
+process_eligibility_naive vs. the nested re.split version it replaced, on long criteria
+textblocks (--min-chars and up) made by joining the synthetic criteria of benchmarks.synth.
+Timed both for splitting the text into criteria fragments alone and end to end, i.e. with
+clean_sentences, which both versions share.
+
+    python -m benchmarks.bench_eligibility --min-chars 20000 --n-texts 50 --repeat 5
+"""
+import argparse
+import random
+import re
+import time
+
+from benchmarks.synth import DocPools, make_criteria_text
+from ctproc.eligibility import criteria_fragments, process_eligibility_naive, split_exc_headers
+from ctproc.utils import clean_sentences
+
+
+def legacy_fragments(elig_text):
+    inc_crit, exc_crit = [], []
+    for h, chunk in enumerate(re.split(r'(?:[Ee]xclu(?:de|sion) criteria:?)|(?:[Ii]neligibility [Cc]riteria:?)', elig_text, flags=re.IGNORECASE)):
+        for s in re.split(r'\n\n', chunk):
+            for ss in re.split(r'- ', s):
+                ss = re.sub(r'\n   +', ' ', ss).strip()
+                if len(ss) > 0:
+                    if h == 0:
+                        inc_crit.append(ss)
+                    else:
+                        exc_crit.append(ss)
+    return inc_crit, exc_crit
+
+
+def fragments(elig_text):
+    chunks = split_exc_headers(elig_text)
+    return criteria_fragments(chunks[:1]), criteria_fragments(chunks[1:])
+
+
+def legacy_process_eligibility_naive(elig_text):
+    inc_crit, exc_crit = legacy_fragments(elig_text)
+    return clean_sentences(inc_crit), clean_sentences(exc_crit)
+
+
+def make_long_texts(n_texts, min_chars, seed=0):
+    rng = random.Random(seed)
+    pools = DocPools()
+    texts = []
+    for _ in range(n_texts):
+        parts, size = [], 0
+        while size < min_chars:
+            parts.append(make_criteria_text(rng, pools))
+            size += len(parts[-1])
+        texts.append(''.join(parts))
+    return texts
+
+
+def run(n_texts, min_chars, repeat):
+    texts = make_long_texts(n_texts, min_chars)
+    for text in texts:
+        assert process_eligibility_naive(text) == legacy_process_eligibility_naive(text)
+
+    n_chars = repeat * sum(len(text) for text in texts)
+    for stage, (base_func, new_func) in [("fragments", (legacy_fragments, fragments)),
+                                         ("end to end", (legacy_process_eligibility_naive, process_eligibility_naive))]:
+        timings = {}
+        for label, func in [("nested re.split", base_func), ("header search", new_func)]:
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                for text in texts:
+                    func(text)
+            timings[label] = time.perf_counter() - t0
+
+        print(stage)
+        for label, elapsed in timings.items():
+            print(f"{label:>16}: {1e3 * elapsed / (repeat * len(texts)):8.2f} ms/text  {n_chars / elapsed / 1e6:6.2f} M chars/sec")
+        base, new = timings.values()
+        print(f"{'speedup':>16}: {base / new:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-texts", type=int, default=50)
+    parser.add_argument("--min-chars", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.n_texts, args.min_chars, args.repeat)
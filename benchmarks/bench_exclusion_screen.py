@@ -0,0 +1,47 @@
+"""
+Negation aware exclusion screen of trials for many topics: ExclusionScreen.query_topics, one
+boolean sparse product of the topics' and the trials' affirmed cuis, vs. checking each topic
+against each trial's exclusion entities one at a time (tests.test_concepts.loop_screen), on
+synthetic trials and topics with skewed cuis, a fifth of the mentions negated.
+
+    python -m benchmarks.bench_exclusion_screen --n-trials 100000 --n-topics 75
+"""
+import argparse
+import time
+
+from benchmarks.bench_bm25 import best_of
+from ctproc.concepts import ExclusionScreen
+from tests.test_concepts import loop_screen, make_cuis, random_concept_docs_and_topics
+
+
+def main(args):
+    docs, topics = random_concept_docs_and_topics(args.n_trials, args.n_topics, cuis=make_cuis(args.n_cuis))
+
+    t0 = time.perf_counter()
+    screen = ExclusionScreen.from_docs(docs)
+    print(f"{args.n_trials} trials, {len(screen.cuis)} cuis, {screen.affirmed.nnz} affirmed and {screen.negated.nnz} negated, built in {time.perf_counter() - t0:.2f} s")
+
+    found = screen.query_topics(topics)
+    ruled_out = best_of(args.repeat, lambda: screen.ruled_out(topics))
+    passing = best_of(args.repeat, lambda: screen.query_topics(topics))
+    mean_out = sum(args.n_trials - len(ids) for ids in found.values()) / len(found)
+    print(f"  ruled_out: {ruled_out * 1000:8.1f} ms for {args.n_topics} topics, {mean_out:.0f} trials ruled out per topic on average")
+    print(f"  query_topics: {passing * 1000:8.1f} ms for {args.n_topics} topics, with the ids of the trials left")
+
+    loop_topics = topics[:args.n_loop]
+    t0 = time.perf_counter()
+    expected = loop_screen(docs, loop_topics)
+    loop = (time.perf_counter() - t0) * args.n_topics / len(loop_topics)
+    assert all(list(found[topic_id]) == ids for topic_id, ids in expected.items())
+    print(f"  python loop: {loop * 1000:8.1f} ms for {args.n_topics} topics (from {len(loop_topics)})")
+    print(f"      speedup: {loop / passing:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-trials", type=int, default=100000)
+    parser.add_argument("--n-topics", type=int, default=75)
+    parser.add_argument("--n-cuis", type=int, default=20000)
+    parser.add_argument("--n-loop", type=int, default=3, help="topics timed with the python loop, it is slow")
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
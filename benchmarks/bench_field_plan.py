@@ -0,0 +1,57 @@
+"""
+Single pass field plan extraction vs. the per-field etree.parse + find/findall lookups
+process_ct_doc_file used before, over the members of tests/ct_doc_test_data.zip.
+
+    python -m benchmarks.bench_field_plan --repeat 200
+"""
+import argparse
+import time
+from pathlib import Path
+from zipfile import ZipFile
+
+from lxml import etree
+
+from ctproc.field_plan import CT_DOC_FIELDS, FieldExtractor, FieldPlan
+
+
+DEFAULT_ZIP = Path(__file__).parent.parent.joinpath("tests", "ct_doc_test_data.zip")
+
+
+def per_field_lookup(xml_filereader):
+    root = etree.parse(xml_filereader).getroot()
+    result = {}
+    for name, spec in CT_DOC_FIELDS.items():
+        if spec.multi:
+            result[name] = [el.text for el in root.findall(spec.path)]
+        else:
+            el = root.find(spec.path)
+            result[name] = None if el is None else el.text
+    return result
+
+
+def run(zip_path, repeat):
+    extractor = FieldExtractor(FieldPlan())
+    timings = {}
+    with ZipFile(zip_path) as zf:
+        names = [n for n in zf.namelist() if n.endswith('xml')]
+        for label, func in [("per-field find/findall", per_field_lookup), ("field plan", extractor.extract)]:
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                for name in names:
+                    with zf.open(name) as f:
+                        func(f)
+            timings[label] = time.perf_counter() - t0
+
+    n_docs = repeat * len(names)
+    for label, elapsed in timings.items():
+        print(f"{label:>24}: {n_docs / elapsed:10.0f} docs/sec  ({1e6 * elapsed / n_docs:.1f} us/doc)")
+    base, new = timings.values()
+    print(f"{'speedup':>24}: {base / new:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--zip", default=DEFAULT_ZIP)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    run(args.zip, args.repeat)
@@ -0,0 +1,54 @@
+"""
+Import cost of the non-NLP path, measured with `python -X importtime` in fresh interpreters.
+Fails (exit code 1) if importing ctproc.proc pulls in the NLP stack or takes longer than the
+budget, so it can pin the startup of pure XML / eligibility runs.
+
+    python -m benchmarks.bench_import --budget-ms 500
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+
+NLP_MODULES = ('spacy', 'negspacy', 'scispacy', 'thinc', 'tqdm')
+IMPORTTIME_LINE = re.compile(r"import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \|(?P<indent>\s+)(?P<module>\S+)")
+
+
+def import_times(module):
+    """
+    returns:    {module: (self us, cumulative us)} for every module imported by `import module`
+    """
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        check=True, capture_output=True, text=True,
+    )
+    times = {}
+    for m in IMPORTTIME_LINE.finditer(out.stderr):
+        times[m.group('module')] = (int(m.group('self')), int(m.group('cumulative')))
+    return times
+
+
+def run(module, repeat, budget_ms, top):
+    runs = [import_times(module) for _ in range(repeat)]
+    best = min(runs, key=lambda times: times[module][1])
+
+    total_ms = best[module][1] / 1000
+    print(f"import {module}: {total_ms:.1f} ms cumulative (best of {repeat}), budget {budget_ms} ms")
+    for name, (self_us, _) in sorted(best.items(), key=lambda item: -item[1][0])[:top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+    nlp_loaded = sorted(name for name in best if name.split('.')[0] in NLP_MODULES)
+    if nlp_loaded:
+        print(f"NLP modules imported: {nlp_loaded}")
+    return (not nlp_loaded) and (total_ms <= budget_ms)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="ctproc.proc")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=500)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    sys.exit(0 if run(args.module, args.repeat, args.budget_ms, args.top) else 1)
@@ -0,0 +1,74 @@
+"""
+extract_lab_values with the one pass value scanner vs. the filler stripping loop it replaced
+(kept in tests.test_lab_scanner), on criteria heavy text: hematologic, hepatic and renal
+criteria like those of oncology trials, with the fillers, comparators, ranges and ULN
+multiples they are written with. Timed for reading the value after every analyte name
+found, and end to end, i.e. with finding the analyte names.
+
+    python -m benchmarks.bench_lab_extract --n-texts 2000 --repeat 5
+"""
+import argparse
+import random
+import time
+
+from ctproc.lab import extract_lab_values
+from ctproc.lab.extractor import _extract_value
+from ctproc.lab.patterns import get_analyte_matcher
+from ctproc.lab.reference_ranges import get_lab_test
+from tests.test_lab_scanner import legacy_extract_lab_values, legacy_extract_value
+
+
+CRITERIA = [
+    "Hemoglobin {cmp} {v} g/dL", "Absolute neutrophil count (ANC) {cmp} {v},500/mm3", "Platelets {cmp} {v}00,000/mm3",
+    "Total bilirubin {cmp} {v}.5 x ULN", "AST (SGOT) and ALT (SGPT) {cmp} {v} times the upper limit of normal",
+    "Serum creatinine {cmp} {v}.5 mg/dL or creatinine clearance {cmp} {v}0 mL/min",
+    "WBC count of {v},000 - {v}2,000/mm3", "INR {cmp} {v}.5", "Alkaline phosphatase is {cmp} {v} x institutional normal",
+    "HbA1c between {v}.5-{v}0%", "TSH level within normal limits", "no history of elevated creatinine",
+]
+COMPARATORS = ["≥", ">=", "at least", "greater than or equal to", "<", "less than", "no greater than", "of", ":", ""]
+
+
+def make_texts(n_texts, seed=0):
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(n_texts):
+        lines = [rng.choice(CRITERIA).format(cmp=rng.choice(COMPARATORS), v=rng.randint(1, 9)) for _ in range(rng.randint(4, 12))]
+        texts.append("\n\n          -  ".join([""] + lines))
+    return texts
+
+
+def best_of(repeat, func):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def run(n_texts, repeat):
+    texts = make_texts(n_texts)
+    assert [extract_lab_values(t) for t in texts] == [legacy_extract_lab_values(t) for t in texts]
+    hits = [(text, get_lab_test(text[start:end]), start, end) for text in texts for start, end in get_analyte_matcher().finditer(text)]
+    n_values = sum(len(extract_lab_values(t)) for t in texts)
+    print(f"{n_texts} texts, {len(hits)} analyte names, {n_values} values")
+
+    stages = [
+        ("values", "us/name", len(hits),
+         lambda: [legacy_extract_value(t[end:end + 150], lab_test, start, end, t) for t, lab_test, start, end in hits],
+         lambda: [_extract_value(t, lab_test, start, end) for t, lab_test, start, end in hits]),
+        ("end to end", "us/text", n_texts,
+         lambda: [legacy_extract_lab_values(t) for t in texts],
+         lambda: [extract_lab_values(t) for t in texts]),
+    ]
+    for stage, per, n, legacy, new in stages:
+        base, fast = best_of(repeat, legacy), best_of(repeat, new)
+        print(f"{stage:>12}: filler loop {1e6 * base / n:7.2f} {per}   value scanner {1e6 * fast / n:7.2f} {per}   {base / fast:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-texts", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.n_texts, args.repeat)
@@ -0,0 +1,79 @@
+"""
+Screening one patient's lab values against the lab constraints of many trials: LabIndex
+(one vectorized comparison per analyte of the patient) vs. a python loop over the trials
+and their constraints. Trials get 0-6 inclusion and 0-4 exclusion constraints on common
+oncology analytes, patients 5-15 lab values.
+
+    python -m benchmarks.bench_lab_index --n-trials 400000 --n-patients 20
+"""
+import argparse
+import random
+import time
+
+from ctproc.lab import LabConstraint, LabIndex
+from tests.test_lab_index import loop_ruled_out
+
+
+ANALYTES = [
+    "Hemoglobin", "Absolute neutrophil count", "Platelet count", "White blood cells", "Bilirubin", "AST", "ALT",
+    "Alkaline phosphatase", "Creatinine", "Albumin", "INR", "Glucose", "Potassium", "Sodium", "Calcium", "TSH",
+]
+COMPARATORS = ["<", "<=", ">", ">=", "between"]
+
+
+def make_trials(n_trials, seed=0):
+    rng = random.Random(seed)
+
+    def constraint():
+        threshold = rng.uniform(0, 100)
+        return LabConstraint(rng.choice(ANALYTES), rng.choice(COMPARATORS), threshold, threshold + rng.uniform(0, 50))
+
+    return [
+        (f"NCT{i:08d}", [constraint() for _ in range(rng.randint(0, 6))], [constraint() for _ in range(rng.randint(0, 4))])
+        for i in range(n_trials)
+    ]
+
+
+def make_patients(n_patients, seed=1):
+    rng = random.Random(seed)
+    return [{analyte: rng.uniform(0, 150) for analyte in rng.sample(ANALYTES, rng.randint(5, 15))} for _ in range(n_patients)]
+
+
+def main(args):
+    trials = make_trials(args.n_trials)
+    patients = make_patients(args.n_patients)
+
+    t0 = time.perf_counter()
+    index = LabIndex.from_constraints(trials)
+    build = time.perf_counter() - t0
+    print(f"{args.n_trials} trials, {index.n_constraints()} constraints, built in {build:.2f} s")
+
+    for values in patients[:args.n_check]:
+        assert list(index.ruled_out(values)) == loop_ruled_out(trials, values)
+
+    best_index, best_loop = float("inf"), float("inf")
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        for values in patients:
+            index.screen_ids(values)
+        best_index = min(best_index, (time.perf_counter() - t0) / len(patients))
+
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        for values in patients[:args.n_loop]:
+            loop_ruled_out(trials, values)
+        best_loop = min(best_loop, (time.perf_counter() - t0) / args.n_loop)
+
+    print(f"  index: {1000 * best_index:8.2f} ms per patient")
+    print(f"   loop: {1000 * best_loop:8.2f} ms per patient")
+    print(f"speedup: {best_loop / best_index:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-trials", type=int, default=400000)
+    parser.add_argument("--n-patients", type=int, default=20)
+    parser.add_argument("--n-loop", type=int, default=2, help="patients timed with the python loop, it is slow")
+    parser.add_argument("--n-check", type=int, default=2, help="patients checked for the same result both ways")
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,69 @@
+"""
+Normalizing lab values to the canonical unit of their analyte and flagging them against
+the reference ranges: evaluate_values over arrays of values, units and demographics vs.
+to_canonical and reference_range one value at a time (tests.test_lab_units.loop_evaluate).
+
+    python -m benchmarks.bench_lab_units --n-values 1000000 --repeat 3
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from ctproc.lab import evaluate_values
+from tests.test_lab_units import loop_evaluate
+
+
+LABS = [
+    ("Hemoglobin", ["g/dL", "g/L", ""]), ("Platelets", ["/mm3", "x10^9/L", "x 10^3/uL"]), ("WBC", ["/mm3", "x10^9/L"]),
+    ("Creatinine", ["mg/dL", "μmol/L", "umol/L"]), ("Bilirubin", ["mg/dL", "μmol/L"]), ("AST", ["U/L", "IU/L"]),
+    ("Glucose", ["mg/dL", "mmol/L"]), ("Calcium", ["mg/dL", "mmol/L", "mEq/L"]), ("Sodium", ["mEq/L", "mmol/L"]),
+    ("TSH", ["mIU/L", "uIU/mL"]), ("Hct", ["%"]), ("CRP", ["mg/L"]),
+]
+DEMOGRAPHICS = [None, "Male", "Female", "children"]
+
+
+def make_values(n_values, seed=0):
+    rng = random.Random(seed)
+    analytes, units = [], []
+    for _ in range(n_values):
+        analyte, analyte_units = rng.choice(LABS)
+        analytes.append(analyte)
+        units.append(rng.choice(analyte_units))
+    values = [rng.uniform(0, 200) for _ in range(n_values)]
+    demographics = [rng.choice(DEMOGRAPHICS) for _ in range(n_values)]
+    return analytes, values, units, demographics
+
+
+def best_of(repeat, func):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(args):
+    batch = make_values(args.n_values)
+    loop_batch = tuple(column[:args.n_loop] for column in batch)
+
+    normalized, flags = evaluate_values(*loop_batch)
+    loop_normalized, loop_flags = loop_evaluate(*loop_batch)
+    np.testing.assert_array_equal(normalized, loop_normalized)
+    assert list(flags) == loop_flags
+
+    vectorized = best_of(args.repeat, lambda: evaluate_values(*batch)) / args.n_values
+    loop = best_of(args.repeat, lambda: loop_evaluate(*loop_batch)) / args.n_loop
+    print(f"vectorized: {1e9 * vectorized:8.0f} ns per value ({args.n_values} values)")
+    print(f"      loop: {1e9 * loop:8.0f} ns per value ({args.n_loop} values)")
+    print(f"   speedup: {loop / vectorized:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-values", type=int, default=1000000)
+    parser.add_argument("--n-loop", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,53 @@
+"""
+Startup time and peak RSS of building CTProc's NLP pipeline for each config mode. Every mode
+is measured in a fresh interpreter so models already loaded by one mode don't hide the cost of
+the next. Needs the nlp extra and en_core_sci_md installed.
+
+    python -m benchmarks.bench_nlp_startup
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+
+MODES = {
+    'stop words':           dict(add_ents=False, remove_stops=True),
+    'ents, no negation':    dict(add_ents=True, add_negation=False),
+    'ents + negation':      dict(add_ents=True),
+    'ents + expand':        dict(add_ents=True, expand=True),
+    'topics, stop words':   dict(add_ents=False, remove_stops=True, is_topic=True),
+    'topics, ents':         dict(add_ents=True, is_topic=True),
+}
+
+
+CHILD = """
+import json, resource, sys, time
+t0 = time.perf_counter()
+from ctproc.ctconfig import CTConfig
+from ctproc.proc import CTProc
+proc = CTProc(CTConfig('unused.zip', nlp=True, **json.loads(sys.argv[1])))
+elapsed = time.perf_counter() - t0
+print(json.dumps({
+    'seconds': elapsed,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'pipes': proc.nlp_tools.NLP.pipe_names,
+}))
+"""
+
+
+def run(modes):
+    for label in modes:
+        out = subprocess.run(
+            [sys.executable, "-c", CHILD, json.dumps(MODES[label])],
+            check=True, capture_output=True, text=True,
+        )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{label:>20}: {result['seconds']:7.1f} s  {result['max_rss_mb']:8.0f} MB  {result['pipes']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", nargs="*", default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+    run(args.modes)
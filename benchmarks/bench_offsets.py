@@ -0,0 +1,64 @@
+"""
+Reading a few trials out of a processed jsonl: get_processed_data(get_only=...) through the offset
+index written beside it (OffsetIndex, memory mapped, reads only the lines asked for) vs. the full
+scan it does without one (every line read and parsed, then filtered), on synthetic docs of about
+the size of processed trials.
+
+    python -m benchmarks.bench_offsets --n-docs 50000 --k 10
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_bm25 import best_of
+from ctproc.utils import OffsetIndex, OffsetWriter, get_processed_data, offsets_path
+
+
+WORDS = ['patients', 'with', 'type', '2', 'diabetes', 'mellitus', 'HbA1c', '>', '7%', 'history', 'of', 'stroke', 'pregnant', 'or', 'lactating']
+
+
+def write_random_docs(path, n_docs, n_sents, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w") as outfile:
+        writer = OffsetWriter(outfile, path)
+        for i in range(n_docs):
+            crits = [[' '.join(rng.choices(WORDS, k=12)) for _ in range(n_sents)] for _ in range(2)]
+            doc = {
+                'id': f"NCT{i:08d}", 'elig_min_age': 18.0, 'elig_max_age': 65.0, 'elig_gender': 'All',
+                'elig_crit': {'include_criteria': crits[0], 'exclude_criteria': crits[1]},
+                'inc_ents': [[[word, 'ENTITY', 0, len(word), {'val': 'C0011849', 'score': 0.9}, [], False] for word in sent.split()[:3]] for sent in crits[0]],
+            }
+            writer.write(doc['id'], json.dumps(doc))
+        writer.close()
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp, 'out.jsonl')
+        write_random_docs(path, args.n_docs, args.n_sents)
+        print(f"{args.n_docs} docs, {path.stat().st_size / 2 ** 20:.0f} MB, index {offsets_path(path).stat().st_size / 2 ** 20:.1f} MB")
+
+        get_only = {f"NCT{i:08d}" for i in random.Random(1).sample(range(args.n_docs), args.k)}
+        t0 = time.perf_counter()
+        expected = [doc for doc in (json.loads(line) for line in open(path)) if doc['id'] in get_only]
+        scan = time.perf_counter() - t0
+        assert get_processed_data(path, get_only=get_only) == expected
+
+        load = best_of(args.repeat, lambda: OffsetIndex.load(path))
+        index = OffsetIndex.load(path)
+        read = best_of(args.repeat, lambda: index.read(get_only))
+        indexed = best_of(args.repeat, lambda: get_processed_data(path, get_only=get_only))
+        print(f"  full scan:                {scan * 1000:8.1f} ms for {args.k} ids")
+        print(f"  get_processed_data:       {indexed * 1000:8.1f} ms (index load {load * 1000:.1f} ms, read {read * 1000:.2f} ms)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-docs", type=int, default=50000)
+    parser.add_argument("--n-sents", type=int, default=20, help="criteria sentences of each doc, per criteria")
+    parser.add_argument("--k", type=int, default=10, help="ids to read")
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
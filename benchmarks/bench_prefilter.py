@@ -0,0 +1,44 @@
+"""
+Age and gender prefilter of trials for many topics: DemographicIndex.query_topics vs. the
+topics x trials python double loop (tests.test_prefilter.loop_prefilter), on synthetic trials
+with the age limits and genders trials are usually written with.
+
+    python -m benchmarks.bench_prefilter --n-trials 400000 --n-topics 75
+"""
+import argparse
+import time
+
+from ctproc.prefilter import DemographicIndex
+from tests.test_prefilter import loop_prefilter, random_docs_and_topics
+
+
+def main(args):
+    docs, topics = random_docs_and_topics(args.n_trials, args.n_topics)
+
+    t0 = time.perf_counter()
+    index = DemographicIndex.from_docs(docs)
+    print(f"{args.n_trials} trials, index built in {time.perf_counter() - t0:.2f} s")
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        found = index.query_topics(topics)
+        best = min(best, time.perf_counter() - t0)
+    print(f"  index: {best:8.3f} s for {args.n_topics} topics")
+
+    loop_topics = topics[:args.n_loop]
+    t0 = time.perf_counter()
+    expected = loop_prefilter(docs, loop_topics)
+    loop = (time.perf_counter() - t0) * args.n_topics / len(loop_topics)
+    assert all(list(found[topic_id]) == ids for topic_id, ids in expected.items())
+    print(f"   loop: {loop:8.3f} s for {args.n_topics} topics (from {len(loop_topics)})")
+    print(f"speedup: {loop / best:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-trials", type=int, default=400000)
+    parser.add_argument("--n-topics", type=int, default=75)
+    parser.add_argument("--n-loop", type=int, default=5, help="topics timed with the python loop, it is slow")
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
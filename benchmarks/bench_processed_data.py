@@ -0,0 +1,99 @@
+"""
+A full pass over processed docs keeping the fields an eval job needs (id, ages, gender and the
+criteria lists): get_processed_data() (every doc parsed and held in one list) vs.
+iter_processed_data() parsing whole lines one at a time vs. iter_processed_data(fields=...)
+skipping the entities, aliased criteria and raw text unparsed, plain and gzip compressed.
+Time is the best of --repeat, peak memory is traced over one pass.
+
+    python -m benchmarks.bench_processed_data --n-docs 20000
+"""
+import argparse
+import gzip
+import json
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.bench_bm25 import best_of
+from ctproc.utils import get_processed_data, iter_processed_data
+from tests.test_processed_data import EVAL_FIELDS
+
+
+WORDS = ['patients', 'with', 'type', '2', 'diabetes', 'mellitus', 'HbA1c', '>', '7%', 'history', 'of', 'stroke', 'pregnant', 'or', 'lactating']
+
+
+def random_doc(rng, i, n_sents):
+    crits = [[' '.join(rng.choices(WORDS, k=12)) for _ in range(n_sents)] for _ in range(2)]
+    ents = [
+        [[word, 'ENTITY', 0, len(word), {'val': f"C{rng.randrange(10 ** 7):07d}", 'score': rng.random()}, [f"{word} alias"], rng.random() < 0.2] for word in sent.split()[:4]]
+        for sent in crits[0] + crits[1]
+    ]
+    # in the order CTDocument writes its fields, the entities of the nlp pipeline come last
+    return {
+        'id': f"NCT{i:08d}",
+        'brief_summary': ' '.join(rng.choices(WORDS, k=150)),
+        'condition': ['diabetes mellitus, type 2'],
+        'contents': ' '.join(rng.choices(WORDS, k=150)),
+        'detailed_description': ' '.join(rng.choices(WORDS, k=300)),
+        'elig_crit': {
+            'raw_text': '\n'.join(crits[0] + crits[1]), 'include_criteria': crits[0], 'exclude_criteria': crits[1],
+            'inc_aliased_crit': [sent.upper() for sent in crits[0]], 'exc_aliased_crit': [sent.upper() for sent in crits[1]],
+        },
+        'elig_gender': 'All', 'elig_max_age': 65.0, 'elig_min_age': 18.0,
+        'intervention_type': ['Drug'],
+        'inc_ents': ents[:n_sents], 'exc_ents': ents[n_sents:],
+    }
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def consume(docs):
+    for _ in docs:
+        pass
+
+
+def main(args):
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp, 'out.jsonl')
+        with open(path, 'w') as outfile:
+            for i in range(args.n_docs):
+                outfile.write(json.dumps(random_doc(rng, i, args.n_sents)) + '\n')
+        gz_path = Path(tmp, 'out.jsonl.gz')
+        with open(path, 'rb') as infile, gzip.open(gz_path, 'wb', compresslevel=1) as outfile:
+            shutil.copyfileobj(infile, outfile)
+        print(f"{args.n_docs} docs, {path.stat().st_size / 2 ** 20:.0f} MB, gzip {gz_path.stat().st_size / 2 ** 20:.0f} MB")
+
+        assert list(iter_processed_data(path, fields=EVAL_FIELDS)) == [
+            {'id': doc['id'], 'elig_min_age': doc['elig_min_age'], 'elig_max_age': doc['elig_max_age'], 'elig_gender': doc['elig_gender'],
+             'elig_crit': {'include_criteria': doc['elig_crit']['include_criteria'], 'exclude_criteria': doc['elig_crit']['exclude_criteria']}}
+            for doc in get_processed_data(path)
+        ]
+
+        cases = [
+            ('get_processed_data', lambda: get_processed_data(path)),
+            ('iter, whole docs', lambda: consume(iter_processed_data(path))),
+            ('iter, eval fields', lambda: consume(iter_processed_data(path, fields=EVAL_FIELDS))),
+            ('iter, eval fields, gzip', lambda: consume(iter_processed_data(gz_path, fields=EVAL_FIELDS))),
+        ]
+        for name, func in cases:
+            seconds = best_of(args.repeat, func)
+            peak = peak_memory(func)
+            print(f"  {name:24s} {seconds:7.2f} s, peak {peak / 2 ** 20:8.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-docs", type=int, default=20000)
+    parser.add_argument("--n-sents", type=int, default=15, help="criteria sentences of each doc, per criteria")
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
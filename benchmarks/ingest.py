@@ -0,0 +1,118 @@
+"""
+End to end throughput of CTProc.process_data on synthetic corpora (see benchmarks.synth):
+docs/sec, time per stage (from CTConfig.instrument) and peak RSS, for
+
+    doc     trial zips, no nlp
+    nlp     trial zips, with the spaCy pipeline (needs the nlp extra and en_core_sci_md)
+    trec    TREC XML topics
+    kz      KZ pseudo-XML topics
+
+Every (mode, size) run is a fresh interpreter, so peak RSS belongs to that run alone.
+
+    python -m benchmarks.ingest --modes doc trec kz --sizes 1000 10000
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synth import get_corpus
+
+
+MODES = ['doc', 'nlp', 'trec', 'kz']
+
+def run_one(mode, size, data_dir, workers, nlp_batch_size, instrument):
+    from ctproc.ctconfig import CTConfig
+    from ctproc.proc import CTProc
+
+    kind = 'doc' if mode in ('doc', 'nlp') else mode
+    data_path = get_corpus(kind, size, data_dir)
+    with tempfile.TemporaryDirectory() as tmp:
+        config = CTConfig(
+            data_path=data_path,
+            write_file=Path(tmp, 'out.jsonl'),
+            disable_tqdm=True,
+            nlp=(mode == 'nlp'),
+            add_ents=(mode == 'nlp'),
+            is_topic=(kind != 'doc'),
+            trec_or_kz=kind if kind != 'doc' else 'trec',
+            workers=workers,
+            nlp_batch_size=nlp_batch_size,
+            instrument=instrument,
+        )
+
+        t0 = time.perf_counter()
+        proc = CTProc(config)
+        startup = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        n_docs = sum(1 for _ in proc.process_data())
+        elapsed = time.perf_counter() - t0
+
+    # stages in workers overlap, their sum is cpu time across processes rather than wall time
+    stage_times = proc.instrument.stats().seconds
+    if workers == 1 and instrument:
+        stage_times['other'] = elapsed - sum(stage_times.values())
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {
+        'mode': mode,
+        'size': size,
+        'docs': n_docs,
+        'startup_s': startup,
+        'seconds': elapsed,
+        'docs_per_sec': n_docs / elapsed if elapsed > 0 else float('inf'),
+        'stages': stage_times,
+        'max_rss_mb': rss_kb / 1024,
+    }
+
+
+def report(result):
+    print(f"{result['mode']:>5} {result['size']:>7}: {result['docs_per_sec']:9.0f} docs/sec  "
+          f"{result['seconds']:8.2f} s  (+{result['startup_s']:.2f} s startup)  {result['max_rss_mb']:7.0f} MB peak rss")
+    for stage, seconds in result['stages'].items():
+        share = seconds / result['seconds'] if result['seconds'] > 0 else 0.
+        print(f"{'':>16}{stage:>18}: {seconds:8.2f} s  {100 * share:5.1f}%")
+
+
+def main(args):
+    results = []
+    for mode in args.modes:
+        for size in args.sizes:
+            cmd = [
+                sys.executable, "-m", "benchmarks.ingest", "--child",
+                "--modes", mode, "--sizes", str(size), "--data-dir", str(args.data_dir),
+                "--workers", str(args.workers), "--nlp-batch-size", str(args.nlp_batch_size),
+            ] + (["--no-stages"] if args.no_stages else [])
+            out = subprocess.run(cmd, capture_output=True, text=True)
+            if out.returncode != 0:
+                print(f"{mode:>5} {size:>7}: failed\n{out.stderr.strip().splitlines()[-1] if out.stderr.strip() else ''}")
+                continue
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            report(result)
+            results.append(result)
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", nargs="+", default=['doc', 'trec', 'kz'], choices=MODES)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--data-dir", type=Path, default=Path(".bench_data"))
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--nlp-batch-size", type=int, default=256)
+    parser.add_argument("--no-stages", action="store_true", help="run without CTConfig.instrument")
+    parser.add_argument("--json", type=Path, default=None, help="also write the results here")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_one(args.modes[0], args.sizes[0], args.data_dir, args.workers, args.nlp_batch_size, not args.no_stages)))
+    else:
+        main(args)
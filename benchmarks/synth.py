@@ -0,0 +1,152 @@
+"""
+Synthetic ClinicalTrials.gov style corpora, built by recombining the real test documents and
+topics: every synthetic trial takes the structure of one real trial, with a fresh NCT id and
+conditions, eligibility criteria and ages sampled from all of them. Output is deterministic
+for a given seed.
+
+    python -m benchmarks.synth --sizes 1000 10000 100000 --out-dir .bench_data
+"""
+import argparse
+import copy
+import random
+import re
+from pathlib import Path
+from typing import List, Tuple
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from lxml import etree
+
+
+TEST_DIR = Path(__file__).parent.parent.joinpath("tests")
+DEFAULT_DOC_ZIP = TEST_DIR.joinpath("ct_doc_test_data.zip")
+DEFAULT_TOPICS = TEST_DIR.joinpath("ct_topic_test_data.xml")
+
+AGES = ["N/A", "18 Years", "18 Years", "21 Years", "6 Months", "12 Years", "40 Years", "65 Years", "75 Years"]
+CRITERIA_HEADER = re.compile(r"^(in|ex)clusion criteria:?$", re.IGNORECASE)
+
+
+class DocPools:
+    """
+    desc:   the real documents, and the pieces of them that get recombined
+    """
+    def __init__(self, doc_zip: Path = DEFAULT_DOC_ZIP) -> None:
+        self.roots = []
+        self.criteria: List[str] = []
+        self.conditions: List[str] = []
+        with ZipFile(doc_zip) as zf:
+            for name in zf.namelist():
+                if not name.endswith('xml'):
+                    continue
+                root = etree.fromstring(zf.read(name))
+                self.roots.append(root)
+                self.conditions.extend(el.text for el in root.findall('condition'))
+                textblock = root.find('eligibility/criteria/textblock')
+                if textblock is not None:
+                    self.criteria.extend(self.split_criteria(textblock.text))
+
+    @staticmethod
+    def split_criteria(text: str) -> List[str]:
+        items = []
+        for para in re.split(r"\n\s*\n", text):
+            para = ' '.join(para.split())
+            if para.startswith('- '):
+                para = para[2:].strip()
+            if para and not CRITERIA_HEADER.match(para):
+                items.append(para)
+        return items
+
+
+def make_criteria_text(rng: random.Random, pools: DocPools) -> str:
+    inclusion = rng.sample(pools.criteria, min(len(pools.criteria), rng.randint(3, 12)))
+    exclusion = rng.sample(pools.criteria, min(len(pools.criteria), rng.randint(2, 10)))
+    if rng.random() < 0.25:
+        # unstructured, like older records without the inclusion / exclusion headers
+        return "\n        " + "\n\n        ".join(inclusion + exclusion) + "\n      "
+
+    bullets = lambda items: "".join(f"\n\n          -  {item}" for item in items)
+    return f"\n        Inclusion Criteria:{bullets(inclusion)}\n\n        Exclusion Criteria:{bullets(exclusion)}\n      "
+
+
+def make_doc(i: int, rng: random.Random, pools: DocPools) -> Tuple[str, bytes]:
+    root = copy.deepcopy(rng.choice(pools.roots))
+    nct_id = f"NCT9{i:07d}"
+    root.find('id_info/nct_id').text = nct_id
+
+    conditions = root.findall('condition')
+    for el, text in zip(conditions, rng.sample(pools.conditions * 3, len(conditions))):
+        el.text = text
+
+    textblock = root.find('eligibility/criteria/textblock')
+    if textblock is not None:
+        textblock.text = make_criteria_text(rng, pools)
+    for tag in ('minimum_age', 'maximum_age'):
+        el = root.find(f'eligibility/{tag}')
+        if el is not None:
+            el.text = rng.choice(AGES)
+
+    member = f"ClinicalTrials.synthetic/NCT9{i // 10000:03d}xxxx/{nct_id}.xml"
+    return member, etree.tostring(root, xml_declaration=True, encoding='UTF-8')
+
+
+def build_doc_zip(n_docs: int, out: Path, seed: int = 0, doc_zip: Path = DEFAULT_DOC_ZIP) -> Path:
+    rng = random.Random(seed)
+    pools = DocPools(doc_zip)
+    with ZipFile(out, 'w', compression=ZIP_DEFLATED) as zf:
+        for i in range(n_docs):
+            member, xml = make_doc(i, rng, pools)
+            zf.writestr(member, xml)
+    return out
+
+
+def read_topic_texts(topics_path: Path = DEFAULT_TOPICS) -> List[str]:
+    return [topic.text for topic in etree.parse(str(topics_path)).getroot()]
+
+
+def make_topic_texts(n_topics: int, seed: int = 0, topics_path: Path = DEFAULT_TOPICS) -> List[str]:
+    # sentences of the real topics, recombined
+    rng = random.Random(seed)
+    sents = [s for text in read_topic_texts(topics_path) for s in re.split(r"(?<=\.)\s+", text.strip()) if s]
+    return [' ' + ' '.join(rng.sample(sents, min(len(sents), rng.randint(3, 8)))) + ' ' for _ in range(n_topics)]
+
+
+def build_trec_topics(n_topics: int, out: Path, seed: int = 0) -> Path:
+    root = etree.Element('topics', task="synthetic topics")
+    for i, text in enumerate(make_topic_texts(n_topics, seed), start=1):
+        etree.SubElement(root, 'topic', number=str(i)).text = text
+    etree.ElementTree(root).write(str(out), encoding='UTF-8', xml_declaration=True)
+    return out
+
+
+def build_kz_topics(n_topics: int, out: Path, seed: int = 0) -> Path:
+    with open(out, 'w') as f:
+        for i, text in enumerate(make_topic_texts(n_topics, seed), start=1):
+            f.write(f"<TOP>\n<NUM>{i}</NUM>\n<TITLE>{' '.join(text.split())}\n</TOP>\n")
+    return out
+
+
+def get_corpus(kind: str, size: int, out_dir: Path, seed: int = 0) -> Path:
+    """
+    kind:       'doc', 'trec' or 'kz'
+    returns:    path of the synthetic corpus, built on first use and reused afterwards
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    suffix = {'doc': 'zip', 'trec': 'xml', 'kz': 'txt'}[kind]
+    out = out_dir.joinpath(f"synthetic_{kind}_{size}_seed{seed}.{suffix}")
+    if not out.exists():
+        build = {'doc': build_doc_zip, 'trec': build_trec_topics, 'kz': build_kz_topics}[kind]
+        tmp = out.with_suffix('.tmp')
+        build(size, tmp, seed)
+        tmp.rename(out)
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--kinds", nargs="+", default=['doc'], choices=['doc', 'trec', 'kz'])
+    parser.add_argument("--out-dir", type=Path, default=Path(".bench_data"))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for kind in args.kinds:
+        for size in args.sizes:
+            print(get_corpus(kind, size, args.out_dir, args.seed))
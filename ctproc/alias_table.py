@@ -0,0 +1,143 @@
+# ----------------------------------------------------------------------------------------------- #
+# compact table of the first few aliases of every concept in a linker knowledge base, for alias lookups
+# ----------------------------------------------------------------------------------------------- #
+
+
+import mmap
+import logging
+import numpy as np
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__file__)
+
+
+MAGIC = b'CTALIAS1'
+ALIAS_SEP = '\x1f'          # ascii unit separator, never part of an alias
+
+# file layout, every section 8 byte aligned:
+#   header:     magic, number of cuis, width of a cui key in bytes, max_aliases it was built with
+#   keys:       n_cuis fixed width ascii cuis, sorted, so a lookup is a binary search
+#   offsets:    n_cuis + 1 uint64 offsets into the blob
+#   blob:       utf-8 aliases of each cui, joined by ALIAS_SEP
+_HEADER = np.dtype([('magic', 'S8'), ('n_cuis', '<u8'), ('key_width', '<u8'), ('max_aliases', '<u8')])
+
+
+
+def _pad(n: int) -> int:
+    return (-n) % 8
+
+
+
+def build_alias_table(
+    cui_aliases: Iterable[Tuple[str, List[str]]],
+    path: Union[str, Path],
+    max_aliases: int = 2
+) -> int:
+    """
+    cui_aliases:    (cui, aliases) pairs, e.g. from linker.kb.cui_to_entity
+    path:           file to write
+    max_aliases:    only the first max_aliases aliases of each cui are kept, the rest are never read
+    returns:        number of cuis written
+    """
+    rows = sorted((cui.encode('ascii'), ALIAS_SEP.join(aliases[:max_aliases]).encode('utf-8')) for cui, aliases in cui_aliases)
+    keys = np.array([cui for cui, _ in rows], dtype=f"S{max([len(cui) for cui, _ in rows], default=1)}")
+    offsets = np.zeros(len(rows) + 1, dtype='<u8')
+    np.cumsum([len(blob) for _, blob in rows], out=offsets[1:])
+
+    header = np.array([(MAGIC, len(rows), keys.dtype.itemsize, max_aliases)], dtype=_HEADER)
+    with open(path, 'wb') as f:
+        for section in (header.tobytes(), keys.tobytes(), offsets.tobytes()):
+            f.write(section)
+            f.write(b'\0' * _pad(len(section)))
+        for _, blob in rows:
+            f.write(blob)
+    return len(rows)
+
+
+
+class AliasTable:
+    """
+    path:       file written by build_alias_table()
+    desc:       read only view of the alias table. the file is memory mapped and a lookup is a binary
+                search of the keys and a slice of the blob, with no namedtuple or dict built per entity.
+                it only speeds up alias lookups: the scispacy linker still loads its own knowledge base
+                for candidate generation. pickles as its path, each process maps the file itself
+    """
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = np.frombuffer(self._mmap, dtype=_HEADER, count=1)[0]
+        if header['magic'] != MAGIC:
+            raise ValueError(f"{self.path} is not an alias table")
+        n_cuis, key_width = int(header['n_cuis']), int(header['key_width'])
+        self.max_aliases = int(header['max_aliases'])
+
+        pos = _HEADER.itemsize + _pad(_HEADER.itemsize)
+        self.keys = np.frombuffer(self._mmap, dtype=f"S{key_width}", count=n_cuis, offset=pos)
+        pos += n_cuis * key_width + _pad(n_cuis * key_width)
+        self.offsets = np.frombuffer(self._mmap, dtype='<u8', count=n_cuis + 1, offset=pos)
+        self.blob_start = pos + 8 * (n_cuis + 1)
+
+
+    def __reduce__(self):
+        return (AliasTable, (self.path,))
+
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+    def __contains__(self, cui: str) -> bool:
+        return self.index(cui) is not None
+
+
+    def index(self, cui: str) -> Optional[int]:
+        key = cui.encode('ascii')
+        if len(key) > self.keys.dtype.itemsize:
+            return None
+        i = int(np.searchsorted(self.keys, key))
+        if i < len(self.keys) and self.keys[i] == key:
+            return i
+        return None
+
+
+    def get(self, cui: str, max_aliases: Optional[int] = None) -> Optional[List[str]]:
+        """
+        returns:    the first max_aliases aliases of cui (all those stored if None),
+                    None if the cui is not in the table
+        """
+        i = self.index(cui)
+        if i is None:
+            return None
+        start, end = self.blob_start + int(self.offsets[i]), self.blob_start + int(self.offsets[i + 1])
+        if start == end:
+            return []
+        return self._mmap[start:end].decode('utf-8').split(ALIAS_SEP)[:max_aliases]
+
+
+
+def build_from_linker(path: Union[str, Path], max_aliases: int = 2, linker_name: str = 'umls') -> int:
+    """
+    desc:       builds the table from the knowledge base of a scispacy linker (needs the nlp extra)
+    """
+    from scispacy.linking_utils import DEFAULT_KNOWLEDGE_BASES
+
+    kb = DEFAULT_KNOWLEDGE_BASES[linker_name]()
+    return build_alias_table(((cui, ent.aliases) for cui, ent in kb.cui_to_entity.items()), path, max_aliases)
+
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="build an alias table from a scispacy linker knowledge base")
+    parser.add_argument("out", help="path of the table to write")
+    parser.add_argument("--max-aliases", type=int, default=2)
+    parser.add_argument("--linker-name", default='umls')
+    args = parser.parse_args()
+
+    n_cuis = build_from_linker(args.out, args.max_aliases, args.linker_name)
+    print(f"wrote {n_cuis} cuis to {args.out}")
@@ -0,0 +1,4 @@
+from .entities import CRITERIA, Concept, entity_concept, doc_concepts, topic_concepts
+from .index import ConceptIndex
+from .matrix import ConceptMatrices, TopicMatrix
+from .screen import ExclusionScreen, is_negated
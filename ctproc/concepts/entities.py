@@ -0,0 +1,74 @@
+# ----------------------------------------------------------------------------------------------- #
+# the linked umls entities (cuis) of processed trials and topics, in any of the forms they are read in
+# ----------------------------------------------------------------------------------------------- #
+
+
+from typing import Any, Iterable, List, NamedTuple, Optional
+
+from ..ctbase import CTEntity
+from ..index_utils import get_field
+
+
+# which criteria of a trial, and the attribute of CTDocument holding their entities
+CRITERIA = ('include', 'exclude')
+ENT_FIELDS = {'include': 'inc_ents', 'exclude': 'exc_ents'}
+CUI_FIELDS = {'include': 'include_cuis', 'exclude': 'exclude_cuis'}
+
+# json writes a CTEntity as a list of its fields, in this order
+_CUI = CTEntity._fields.index('cui')
+_NEGATION = CTEntity._fields.index('negation')
+
+
+
+class Concept(NamedTuple):
+    cui: str
+    score: float               # the linker's score of the cui
+    negation: Optional[bool]   # None when negex was not in the pipeline
+
+
+
+def entity_concept(ent: Any) -> Concept:
+    """
+    ent:        a CTEntity, its dict, or the list json writes it as
+    """
+    if isinstance(ent, dict):
+        cui, negation = ent['cui'], ent.get('negation')
+    else:
+        cui, negation = ent[_CUI], ent[_NEGATION] if len(ent) > _NEGATION else None
+    return Concept(cui['val'], float(cui['score']), negation)
+
+
+
+def sent_concepts(ent_sents: Optional[Iterable[Iterable[Any]]]) -> List[Concept]:
+    if not ent_sents:
+        return []
+    return [entity_concept(ent) for ent_sent in ent_sents for ent in ent_sent]
+
+
+
+def doc_concepts(doc: Any, criteria: str) -> List[Concept]:
+    """
+    doc:        a processed CTDocument, its dict, or the dict of get_filtered_doc_as_dict()
+    criteria:   'include' or 'exclude'
+    returns:    the concepts of the entities of every criterion, in order. the space joined cuis of
+                a filtered doc have no score or negation, they get a score of 1
+    """
+    ent_sents = get_field(doc, ENT_FIELDS[criteria])
+    if ent_sents is None:
+        cuis = get_field(doc, CUI_FIELDS[criteria])
+        return [Concept(cui, 1., None) for cui in cuis.split()] if cuis else []
+    return sent_concepts(ent_sents)
+
+
+
+def topic_concepts(topic: Any) -> List[Concept]:
+    """
+    topic:      a processed CTTopic, or its dict
+    """
+    return sent_concepts(get_field(topic, 'ent_sents'))
+
+
+
+def object_id(obj: Any) -> str:
+    # id of a processed doc or topic, filtered docs have nct_id in its place
+    return get_field(obj, 'id') or get_field(obj, 'nct_id')
@@ -0,0 +1,228 @@
+# ----------------------------------------------------------------------------------------------- #
+# inverted index from umls cuis to the trials whose criteria mention them
+# ----------------------------------------------------------------------------------------------- #
+
+
+import json
+import logging
+import numpy as np
+from array import array
+from pathlib import Path
+from scipy import sparse
+from typing import Any, Dict, Iterable, Sequence, Union
+
+from ..index_utils import bool_csr, distinct, read_lines, renumber_sorted, rows_csr
+from .entities import CRITERIA, doc_concepts, object_id, topic_concepts
+
+logger = logging.getLogger(__file__)
+
+
+FORMAT_VERSION = 1
+
+MATCHES = ('any', 'all')
+
+
+
+class ConceptIndex:
+    """
+    trial_ids:  ids of the trials, in index order
+    cuis:       the cuis of the index, sorted
+    include:    cuis x trials boolean matrix, the trials whose inclusion criteria have each cui: each
+                row's indices are its postings, the sorted positions of those trials
+    exclude:    the same for the exclusion criteria
+    desc:       which trials' criteria mention which concepts, for generating candidates from the
+                concepts of many topics at once. trials whose criteria have any of a topic's cuis are
+                found with one sparse product for all topics, trials with all of them by intersecting
+                postings, shortest first, with binary searches, and trials whose exclusion criteria
+                have any of the topic's cuis are dropped with a second product
+    """
+
+
+    def __init__(self, trial_ids: Sequence[str], cuis: Sequence[str], include: sparse.csr_matrix, exclude: sparse.csr_matrix) -> None:
+        self.trial_ids = np.asarray(trial_ids, dtype=object)
+        self.cuis = list(cuis)
+        self.cui_ids: Dict[str, int] = {cui: i for i, cui in enumerate(self.cuis)}
+        self.include = include
+        self.exclude = exclude
+
+
+    def __len__(self) -> int:
+        return len(self.trial_ids)
+
+
+    @classmethod
+    def from_docs(cls, docs: Iterable[Any]) -> "ConceptIndex":
+        """
+        docs:       processed CTDocuments, their dicts (see utils.get_processed_data()) or the dicts of
+                    CTDocument.get_filtered_doc_as_dict(), read once, so CTProc.process_data() can be
+                    indexed as it writes its output
+        """
+        trial_ids = []
+        cui_ids: Dict[str, int] = {}
+        rows = {criteria: array('i') for criteria in CRITERIA}
+        columns = {criteria: array('i') for criteria in CRITERIA}
+        for position, doc in enumerate(docs):
+            trial_ids.append(object_id(doc))
+            for criteria in CRITERIA:
+                doc_cuis = {cui_ids.setdefault(concept.cui, len(cui_ids)) for concept in doc_concepts(doc, criteria)}
+                rows[criteria].extend(doc_cuis)
+                columns[criteria].extend([position] * len(doc_cuis))
+
+        cuis, renumber = renumber_sorted(cui_ids)
+        matrices = [
+            _postings(renumber[np.frombuffer(rows[criteria], dtype=np.int32)], np.frombuffer(columns[criteria], dtype=np.int32), (len(cuis), len(trial_ids)))
+            for criteria in CRITERIA
+        ]
+        return cls(trial_ids, cuis, *matrices)
+
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        path:       directory to write the index to, as .npy arrays that load() memory maps
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for criteria in CRITERIA:
+            matrix = self.postings_matrix(criteria)
+            np.save(path / f'{criteria}_indptr.npy', matrix.indptr)
+            np.save(path / f'{criteria}_indices.npy', matrix.indices)
+        (path / 'cuis.txt').write_text('\n'.join(self.cuis), encoding='utf-8')
+        (path / 'trial_ids.txt').write_text('\n'.join(self.trial_ids), encoding='utf-8')
+        meta = {'format_version': FORMAT_VERSION, 'n_trials': len(self.trial_ids), 'n_cuis': len(self.cuis)}
+        (path / 'meta.json').write_text(json.dumps(meta), encoding='utf-8')
+
+
+    @classmethod
+    def load(cls, path: Union[str, Path], mmap: bool = True) -> "ConceptIndex":
+        """
+        path:       directory save() wrote
+        mmap:       whether to memory map the postings instead of reading them in
+        """
+        path = Path(path)
+        meta = json.loads((path / 'meta.json').read_text(encoding='utf-8'))
+        if meta['format_version'] != FORMAT_VERSION:
+            raise ValueError(f"concept index at {path} has format {meta['format_version']}, expected {FORMAT_VERSION}")
+        mmap_mode = 'r' if mmap else None
+        shape = (meta['n_cuis'], meta['n_trials'])
+        matrices = []
+        for criteria in CRITERIA:
+            indptr = np.load(path / f'{criteria}_indptr.npy', mmap_mode=mmap_mode)
+            indices = np.load(path / f'{criteria}_indices.npy', mmap_mode=mmap_mode)
+            matrices.append(sparse.csr_matrix((np.ones(len(indices), dtype=bool), indices, indptr), shape=shape, copy=False))
+        cuis = read_lines(path / 'cuis.txt', meta['n_cuis'])
+        trial_ids = read_lines(path / 'trial_ids.txt', meta['n_trials'])
+        return cls(trial_ids, cuis, *matrices)
+
+
+    def postings_matrix(self, criteria: str) -> sparse.csr_matrix:
+        """
+        criteria:   'include' or 'exclude'
+        """
+        if criteria not in CRITERIA:
+            raise ValueError(f"criteria must be one of {CRITERIA}, not {criteria!r}")
+        return self.include if criteria == 'include' else self.exclude
+
+
+    def postings(self, cui: str, criteria: str = 'include') -> np.ndarray:
+        """
+        returns:    sorted positions of the trials whose criteria have the cui, empty for unknown cuis
+        """
+        matrix = self.postings_matrix(criteria)
+        row = self.cui_ids.get(cui)
+        if row is None:
+            return np.zeros(0, dtype=matrix.indices.dtype)
+        return matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]
+
+
+    def union(self, cuis: Iterable[str], criteria: str = 'include') -> np.ndarray:
+        """
+        returns:    sorted positions of the trials whose criteria have any of the cuis
+        """
+        lists = [self.postings(cui, criteria) for cui in set(cuis)]
+        return distinct(lists, len(self.trial_ids)).astype(np.int32)
+
+
+    def intersection(self, cuis: Iterable[str], criteria: str = 'include') -> np.ndarray:
+        """
+        returns:    sorted positions of the trials whose criteria have every one of the cuis, none
+                    for no cuis or a cui the index doesn't have
+        """
+        lists = sorted((self.postings(cui, criteria) for cui in set(cuis)), key=len)
+        if not lists:
+            return np.zeros(0, dtype=np.int32)
+        found = np.asarray(lists[0])
+        for postings in lists[1:]:
+            if len(found) == 0:
+                break
+            at = np.searchsorted(postings, found)
+            at[at == len(postings)] = 0
+            found = found[postings[at] == found]
+        return found
+
+
+    def difference(self, positions: np.ndarray, cuis: Iterable[str], criteria: str = 'exclude') -> np.ndarray:
+        """
+        positions:  sorted positions of trials, e.g. from union()
+        returns:    those of the trials whose criteria have none of the cuis
+        """
+        lists = [self.postings(cui, criteria) for cui in set(cuis)]
+        if not lists:
+            return positions
+        excluded = np.zeros(len(self.trial_ids), dtype=bool)
+        for postings in lists:
+            excluded[postings] = True
+        return positions[~excluded[positions]]
+
+
+    def topic_matrix(self, topic_cuis: Sequence[Iterable[str]]) -> sparse.csr_matrix:
+        """
+        topic_cuis: the cuis of each topic
+        returns:    topics x cuis boolean matrix of the cuis of each topic the index has
+        """
+        rows = [np.array(sorted({self.cui_ids[cui] for cui in cuis if cui in self.cui_ids}), dtype=np.int32) for cuis in topic_cuis]
+        return rows_csr(rows, len(self.cuis))
+
+
+    def query(self, topic_cuis: Sequence[Iterable[str]], match: str = 'any', criteria: str = 'include', exclude: bool = True) -> sparse.csr_matrix:
+        """
+        topic_cuis: the cuis of each topic, e.g. of topic_concepts()
+        match:      'any' for the trials whose criteria have any of a topic's cuis, 'all' for those
+                    with every one of them
+        criteria:   whose cuis are matched, 'include' or 'exclude'
+        exclude:    whether to drop the trials whose exclusion criteria have any of the topic's cuis
+        returns:    topics x trials boolean matrix, true where the trial is a candidate for the topic
+        """
+        if match not in MATCHES:
+            raise ValueError(f"match must be one of {MATCHES}, not {match!r}")
+        topic_cuis = [set(cuis) for cuis in topic_cuis]
+        topics = self.topic_matrix(topic_cuis)
+        if match == 'any':
+            found = (topics @ self.postings_matrix(criteria)).tocsr()
+        else:
+            found = rows_csr([self.intersection(cuis, criteria) for cuis in topic_cuis], len(self.trial_ids))
+        if exclude:
+            found = (found > (topics @ self.exclude)).tocsr()
+        found.sort_indices()
+        return found
+
+
+    def query_topics(self, topics: Iterable[Any], match: str = 'any', criteria: str = 'include', exclude: bool = True) -> Dict[str, np.ndarray]:
+        """
+        topics:     processed CTTopics, or their dicts
+        returns:    topic id -> ids of the candidate trials of query(), in index order
+        """
+        topics = list(topics)
+        found = self.query([[concept.cui for concept in topic_concepts(topic)] for topic in topics], match, criteria, exclude)
+        return {
+            object_id(topic): self.trial_ids[found.indices[found.indptr[row]:found.indptr[row + 1]]]
+            for row, topic in enumerate(topics)
+        }
+
+
+
+def _postings(rows: np.ndarray, columns: np.ndarray, shape: tuple) -> sparse.csr_matrix:
+    # columns come in increasing order, a stable sort by row keeps each row's postings sorted
+    return bool_csr(columns[np.argsort(rows, kind='stable')], np.bincount(rows, minlength=shape[0]), shape[1])
+
+
+
@@ -0,0 +1,223 @@
+# ----------------------------------------------------------------------------------------------- #
+# trials x cuis and topics x cuis sparse matrices over one cui vocabulary, for scoring every topic
+# against every trial with one sparse product
+# ----------------------------------------------------------------------------------------------- #
+
+
+import json
+import logging
+import numpy as np
+from array import array
+from pathlib import Path
+from scipy import sparse
+from typing import Any, Dict, Iterable, List, NamedTuple, Sequence, Tuple, Union
+
+from ..index_utils import read_lines, renumber_sorted
+from .entities import CRITERIA, Concept, doc_concepts, object_id, topic_concepts
+
+logger = logging.getLogger(__file__)
+
+
+FORMAT_VERSION = 1
+
+
+
+class TopicMatrix(NamedTuple):
+    topic_ids: List[str]
+    cuis: List[str]              # the vocabulary of the ConceptMatrices that made it
+    matrix: sparse.csr_matrix    # topics x cuis, the linker score of each cui of each topic
+
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        path:       directory to write the matrix to, as matrix.npz with the ids and cuis beside it
+        """
+        _save_matrices(Path(path), {'matrix': self.matrix}, self.topic_ids, self.cuis)
+
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "TopicMatrix":
+        (matrix,), topic_ids, cuis = _load_matrices(Path(path), ('matrix',))
+        return cls(topic_ids, cuis, matrix)
+
+
+
+class ConceptMatrices:
+    """
+    trial_ids:  ids of the trials, in row order
+    cuis:       the cuis of the columns, sorted, shared by the topic matrices made with topic_matrix()
+    include:    trials x cuis matrix, the linker score of each cui of each trial's inclusion criteria
+    exclude:    the same for the exclusion criteria
+    desc:       the concepts of many trials and topics as sparse matrices, so the concept similarity
+                of every topic to every trial is one sparse product in place of comparing their
+                entities one pair at a time. a cui mentioned more than once weighs its best score.
+                saved as .npz, so scoring again needs no nlp
+    """
+
+
+    def __init__(self, trial_ids: Sequence[str], cuis: Sequence[str], include: sparse.csr_matrix, exclude: sparse.csr_matrix) -> None:
+        self.trial_ids = np.asarray(trial_ids, dtype=object)
+        self.cuis = list(cuis)
+        self.cui_ids: Dict[str, int] = {cui: i for i, cui in enumerate(self.cuis)}
+        self.include = include
+        self.exclude = exclude
+        self._by_cui: Dict[str, sparse.csr_matrix] = {}
+
+
+    def __len__(self) -> int:
+        return len(self.trial_ids)
+
+
+    @classmethod
+    def from_docs(cls, docs: Iterable[Any]) -> "ConceptMatrices":
+        """
+        docs:       processed CTDocuments, or their dicts (see utils.get_processed_data()), read once
+        """
+        trial_ids = []
+        cui_ids: Dict[str, int] = {}
+        entries = {criteria: (array('i'), array('i'), array('f')) for criteria in CRITERIA}
+        for position, doc in enumerate(docs):
+            trial_ids.append(object_id(doc))
+            for criteria in CRITERIA:
+                rows, columns, scores = entries[criteria]
+                for cui, score in _best_scores(doc_concepts(doc, criteria)).items():
+                    rows.append(position)
+                    columns.append(cui_ids.setdefault(cui, len(cui_ids)))
+                    scores.append(score)
+
+        cuis, renumber = renumber_sorted(cui_ids)
+        matrices = []
+        for criteria in CRITERIA:
+            rows, columns, scores = entries[criteria]
+            rows, columns = np.frombuffer(rows, dtype=np.int32), renumber[np.frombuffer(columns, dtype=np.int32)]
+            matrices.append(_csr(rows, columns, np.frombuffer(scores, dtype=np.float32), (len(trial_ids), len(cuis))))
+        return cls(trial_ids, cuis, *matrices)
+
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        path:       directory to write the matrices to, include.npz and exclude.npz with the ids and cuis beside them
+        """
+        _save_matrices(Path(path), {criteria: self.matrix(criteria) for criteria in CRITERIA}, self.trial_ids.tolist(), self.cuis)
+
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "ConceptMatrices":
+        matrices, trial_ids, cuis = _load_matrices(Path(path), CRITERIA)
+        return cls(trial_ids, cuis, *matrices)
+
+
+    def matrix(self, criteria: str) -> sparse.csr_matrix:
+        """
+        criteria:   'include' or 'exclude'
+        """
+        if criteria not in CRITERIA:
+            raise ValueError(f"criteria must be one of {CRITERIA}, not {criteria!r}")
+        return self.include if criteria == 'include' else self.exclude
+
+
+    def topic_matrix(self, topics: Iterable[Any]) -> TopicMatrix:
+        """
+        topics:     processed CTTopics, or their dicts
+        returns:    their cuis over this vocabulary, those no trial has are left out, they can't score
+        """
+        topic_ids, rows = [], []
+        for topic in topics:
+            topic_ids.append(object_id(topic))
+            rows.append(_best_scores(topic_concepts(topic)))
+        return TopicMatrix(topic_ids, self.cuis, self.concept_matrix(rows))
+
+
+    def concept_matrix(self, rows: Sequence[Dict[str, float]]) -> sparse.csr_matrix:
+        """
+        rows:       cui -> weight of each row, e.g. of a topic
+        returns:    rows x cuis matrix of the weights, cuis not in the vocabulary left out
+        """
+        indptr, indices, weights = [0], [], []
+        for row in rows:
+            known = sorted((self.cui_ids[cui], weight) for cui, weight in row.items() if cui in self.cui_ids)
+            indices.extend(cui_id for cui_id, _ in known)
+            weights.extend(weight for _, weight in known)
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.asarray(weights, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int32)),
+            shape=(len(rows), len(self.cuis)),
+        )
+
+
+    def by_cui(self, criteria: str) -> sparse.csr_matrix:
+        """
+        returns:    the cuis x trials transpose of matrix(criteria), made once, what scores() multiplies by
+        """
+        if criteria not in self._by_cui:
+            self._by_cui[criteria] = self.matrix(criteria).T.tocsr()
+        return self._by_cui[criteria]
+
+
+    def scores(self, topics: TopicMatrix, criteria: str = 'include', cosine: bool = False) -> sparse.csr_matrix:
+        """
+        topics:     from topic_matrix(), or TopicMatrix.load() of one it saved
+        criteria:   whose cuis the topics are scored against, 'include' or 'exclude'
+        cosine:     whether to divide each score by the norms of the topic's and the trial's weights
+        returns:    topics x trials matrix of the sum over their shared cuis of the topic's weight
+                    times the trial's, trials sharing no cui with a topic left out
+        """
+        if topics.cuis is not self.cuis and topics.cuis != self.cuis:
+            raise ValueError("topic matrix was made over another cui vocabulary")
+        scores = (topics.matrix @ self.by_cui(criteria)).tocsr()
+        if cosine:
+            topic_norms = _row_norms(topics.matrix)
+            trial_norms = _row_norms(self.matrix(criteria))
+            scores = sparse.diags(_inverse(topic_norms)) @ scores @ sparse.diags(_inverse(trial_norms))
+            scores = scores.tocsr().astype(np.float32)
+        return scores
+
+
+
+def _best_scores(concepts: Iterable[Concept]) -> Dict[str, float]:
+    best: Dict[str, float] = {}
+    for concept in concepts:
+        if concept.score > best.get(concept.cui, -1.):
+            best[concept.cui] = concept.score
+    return best
+
+
+
+def _csr(rows: np.ndarray, columns: np.ndarray, data: np.ndarray, shape: tuple) -> sparse.csr_matrix:
+    # rows come in increasing order, sorting by row then column gives each row's sorted indices
+    order = np.lexsort((columns, rows))
+    indptr = np.zeros(shape[0] + 1, dtype=np.int32)
+    np.cumsum(np.bincount(rows, minlength=shape[0]), out=indptr[1:])
+    return sparse.csr_matrix((data[order], columns[order].astype(np.int32), indptr), shape=shape)
+
+
+
+def _row_norms(matrix: sparse.csr_matrix) -> np.ndarray:
+    return np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1), dtype=np.float64).ravel())
+
+
+
+def _inverse(norms: np.ndarray) -> np.ndarray:
+    inverse = np.zeros_like(norms)
+    np.divide(1., norms, out=inverse, where=norms > 0)
+    return inverse
+
+
+
+def _save_matrices(path: Path, matrices: Dict[str, sparse.csr_matrix], ids: List[str], cuis: List[str]) -> None:
+    path.mkdir(parents=True, exist_ok=True)
+    for name, matrix in matrices.items():
+        sparse.save_npz(path / f'{name}.npz', matrix)
+    (path / 'ids.txt').write_text('\n'.join(ids), encoding='utf-8')
+    (path / 'cuis.txt').write_text('\n'.join(cuis), encoding='utf-8')
+    meta = {'format_version': FORMAT_VERSION, 'n_ids': len(ids), 'n_cuis': len(cuis)}
+    (path / 'meta.json').write_text(json.dumps(meta), encoding='utf-8')
+
+
+
+def _load_matrices(path: Path, names: Sequence[str]) -> Tuple[List[sparse.csr_matrix], List[str], List[str]]:
+    meta = json.loads((path / 'meta.json').read_text(encoding='utf-8'))
+    if meta['format_version'] != FORMAT_VERSION:
+        raise ValueError(f"concept matrices at {path} have format {meta['format_version']}, expected {FORMAT_VERSION}")
+    matrices = [sparse.load_npz(path / f'{name}.npz').tocsr() for name in names]
+    return matrices, read_lines(path / 'ids.txt', meta['n_ids']), read_lines(path / 'cuis.txt', meta['n_cuis'])
@@ -0,0 +1,129 @@
+# ----------------------------------------------------------------------------------------------- #
+# negation aware exclusion screen: trials whose exclusion criteria mention, affirmed, a concept the
+# patient has, affirmed, are ruled out for all topics at once
+# ----------------------------------------------------------------------------------------------- #
+
+
+import logging
+import numpy as np
+from array import array
+from scipy import sparse
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from ..index_utils import bool_csr, renumber_sorted, rows_csr
+from .entities import Concept, doc_concepts, object_id, topic_concepts
+
+logger = logging.getLogger(__file__)
+
+
+
+def is_negated(concept: Concept) -> bool:
+    # negation is None when negex was not in the pipeline, the mention is taken as affirmed
+    return concept.negation is True
+
+
+
+class ExclusionScreen:
+    """
+    trial_ids:  ids of the trials, in row order
+    cuis:       the cuis of the columns, sorted, those of the trials' exclusion criteria
+    affirmed:   trials x cuis boolean matrix, the cuis the trial's exclusion criteria mention affirmed
+    negated:    the same for the cuis they mention negated (negex), a cui can be both
+    desc:       rules out trials whose exclusion criteria mention, affirmed, a concept a topic (the
+                patient) mentions affirmed, "history of stroke" in both. a negated mention on either
+                side rules nothing out, a patient with "no history of stroke" doesn't meet the
+                exclusion criterion "history of stroke". the topics' affirmed cuis times the trials'
+                affirmed cuis is one boolean sparse product for all topics, true where a trial is
+                ruled out
+    """
+
+
+    def __init__(self, trial_ids: Sequence[str], cuis: Sequence[str], affirmed: sparse.csr_matrix, negated: sparse.csr_matrix) -> None:
+        self.trial_ids = np.asarray(trial_ids, dtype=object)
+        self.cuis = list(cuis)
+        self.cui_ids: Dict[str, int] = {cui: i for i, cui in enumerate(self.cuis)}
+        self.affirmed = affirmed
+        self.negated = negated
+        self._affirmed_by_cui: Optional[sparse.csr_matrix] = None
+
+
+    def __len__(self) -> int:
+        return len(self.trial_ids)
+
+
+    @classmethod
+    def from_docs(cls, docs: Iterable[Any]) -> "ExclusionScreen":
+        """
+        docs:       processed CTDocuments, or their dicts (see utils.get_processed_data()), read once.
+                    the cuis of get_filtered_doc_as_dict() have no negation, they are all affirmed
+        """
+        trial_ids = []
+        cui_ids: Dict[str, int] = {}
+        entries = {negated: (array('i'), array('i')) for negated in (False, True)}
+        for position, doc in enumerate(docs):
+            trial_ids.append(object_id(doc))
+            mentions = {(cui_ids.setdefault(concept.cui, len(cui_ids)), is_negated(concept)) for concept in doc_concepts(doc, 'exclude')}
+            for cui_id, negated in mentions:
+                rows, columns = entries[negated]
+                rows.append(position)
+                columns.append(cui_id)
+
+        cuis, renumber = renumber_sorted(cui_ids)
+        matrices = []
+        for negated in (False, True):
+            rows, columns = entries[negated]
+            rows, columns = np.frombuffer(rows, dtype=np.int32), renumber[np.frombuffer(columns, dtype=np.int32)]
+            order = np.lexsort((columns, rows))
+            matrices.append(bool_csr(columns[order], np.bincount(rows, minlength=len(trial_ids)), len(cuis)))
+        return cls(trial_ids, cuis, *matrices)
+
+
+    def topic_matrices(self, topics: Iterable[Any]) -> Tuple[List[str], sparse.csr_matrix, sparse.csr_matrix]:
+        """
+        topics:     processed CTTopics, or their dicts
+        returns:    ids of the topics, and topics x cuis boolean matrices of the cuis each mentions
+                    affirmed and negated, cuis no trial excludes left out
+        """
+        topic_ids, affirmed, negated = [], [], []
+        for topic in topics:
+            topic_ids.append(object_id(topic))
+            mentions = [(self.cui_ids.get(concept.cui), is_negated(concept)) for concept in topic_concepts(topic)]
+            affirmed.append(np.array(sorted({cui_id for cui_id, neg in mentions if cui_id is not None and not neg}), dtype=np.int32))
+            negated.append(np.array(sorted({cui_id for cui_id, neg in mentions if cui_id is not None and neg}), dtype=np.int32))
+        return topic_ids, rows_csr(affirmed, len(self.cuis)), rows_csr(negated, len(self.cuis))
+
+
+    def ruled_out(self, topics: Iterable[Any]) -> sparse.csr_matrix:
+        """
+        topics:     processed CTTopics, or their dicts
+        returns:    topics x trials boolean matrix, true where the trial's exclusion criteria mention
+                    affirmed a concept the topic mentions affirmed
+        """
+        _, affirmed, _ = self.topic_matrices(topics)
+        if self._affirmed_by_cui is None:
+            self._affirmed_by_cui = self.affirmed.T.tocsr()
+        found = (affirmed @ self._affirmed_by_cui).tocsr()
+        found.sort_indices()
+        return found
+
+
+    def query_topics(self, topics: Iterable[Any], candidates: Optional[Dict[str, Iterable[Any]]] = None) -> Dict[str, np.ndarray]:
+        """
+        topics:     processed CTTopics, or their dicts
+        candidates: topic id -> ids of the trials to screen, e.g. from DemographicIndex.query_topics()
+                    or ConceptIndex.query_topics(), None to screen all trials
+        returns:    topic id -> ids of the trials (of its candidates) not ruled out, in index order
+        """
+        topics = list(topics)
+        found = self.ruled_out(topics)
+        positions = None if candidates is None else {trial_id: i for i, trial_id in enumerate(self.trial_ids.tolist())}
+        passing = {}
+        for row, topic in enumerate(topics):
+            topic_id = object_id(topic)
+            keep = np.ones(len(self.trial_ids), dtype=bool)
+            if candidates is not None:
+                keep[:] = False
+                keep[[positions[trial_id] for trial_id in candidates.get(topic_id, ()) if trial_id in positions]] = True
+            keep[found.indices[found.indptr[row]:found.indptr[row + 1]]] = False
+            passing[topic_id] = self.trial_ids[keep]
+        return passing
@@ -15,7 +15,13 @@ class CTEntity(NamedTuple):
     end: int 
     cui: Dict[str, str]
     alias_expansion: List[str]
-    negation: bool 
+    negation: Optional[bool]
+
+
+
+class ParsedText(NamedTuple):
+	sents: List[str]           # sentence texts, only filled for objects that need them (topics)
+	ents: List[CTEntity]       # linked entities over the whole text
 
 
 
@@ -23,6 +29,8 @@ class NLPTools(NamedTuple):
 	NLP: Callable
 	linker: Any 
 	STOP_WORDS: Set[str]
+	ent_cache: Any = None      # optional ent_cache.EntityCache
+	alias_table: Any = None    # optional alias_table.AliasTable, read instead of linker.kb
 	
 
 class CTBase:
@@ -32,6 +40,44 @@ class CTBase:
 		self.nlp_tools: Optional[NLPTools] = nlp_tools
 		
 
+	# whether parse_nlp_doc() keeps the sentence texts of each parsed text
+	keep_sents: bool = False
+
+
+	def nlp_key(self, text: str, config: CTConfig) -> Tuple[str, str]:
+		"""
+		desc:     key for text in the entity cache, the variant part covers every setting
+		          that changes what parse_nlp_doc() produces for the same text
+		"""
+		return f"sents={int(self.keep_sents)},ents={int(config.add_ents)},max_aliases={config.max_aliases}", text
+
+
+	def parse_nlp_doc(self, nlp_doc: Any, config: CTConfig) -> ParsedText:
+		sents = [s.text for s in nlp_doc.sents] if self.keep_sents else []
+		ents = self.get_ents([nlp_doc], config)[0] if config.add_ents else []
+		return ParsedText(sents=sents, ents=ents)
+
+
+	def parse_texts(self, texts: List[str], config: CTConfig) -> List[ParsedText]:
+		"""
+		texts:    texts to run through the spaCy pipeline one at a time
+		desc:     looks every text up in nlp_tools.ent_cache (if there is one) first, only
+		          the misses are parsed and then added to the cache
+		"""
+		cache = self.nlp_tools.ent_cache
+		keys = [self.nlp_key(text, config) for text in texts]
+		parsed = cache.get_many(keys) if cache is not None else {}
+
+		new_parsed = {}
+		for key, text in zip(keys, texts):
+			if key not in parsed:
+				parsed[key] = new_parsed[key] = self.parse_nlp_doc(self.nlp_tools.NLP(text), config)
+
+		if cache is not None:
+			cache.put_many(new_parsed)
+		return [parsed[key] for key in keys]
+
+
 	def get_ents(self, nlp_sent: Any, config: CTConfig) -> List[List[CTEntity]]:
 		new_ent_sents = []
 		for sent in nlp_sent:	
@@ -48,22 +94,32 @@ class CTBase:
 		              default 2 because more expands a lot and doesn't add much information
 		desc:         converts to CTEntity object with select fields
 		"""
-		linker = self.nlp_tools.linker
-		
 		# only take first UMLS entity, others have lower scores and not likely to add information...
 		umls_ent = spacy_ent._.kb_ents[0]
-		aliases=linker.kb.cui_to_entity[umls_ent[0]]._asdict()['aliases']
 		return CTEntity(
 			raw_text=spacy_ent.text,
 			label=spacy_ent.label_,
 			start=spacy_ent.start_char,
 			end=spacy_ent.end_char,
 			cui={'val':umls_ent[0], 'score':umls_ent[1]},
-			alias_expansion=aliases[:min(len(aliases), max_aliases)],
-			negation=spacy_ent._.negex,
+			alias_expansion=self.get_aliases(umls_ent[0], max_aliases),
+			negation=getattr(spacy_ent._, 'negex', None),   # None when negex is not in the pipeline
 		)
 
 	
+	def get_aliases(self, cui: str, max_aliases: int) -> List[str]:
+		"""
+		desc:         first max_aliases aliases of cui, from the alias table if there is one,
+		              falling back to the linker's knowledge base for cuis it doesn't have
+		"""
+		alias_table = self.nlp_tools.alias_table
+		if alias_table is not None:
+			aliases = alias_table.get(cui, max_aliases)
+			if aliases is not None:
+				return aliases
+		return list(self.nlp_tools.linker.kb.cui_to_entity[cui].aliases[:max_aliases])
+
+
 	#----------------------------------------------------------------------------------------------#
 	# methods for getting representations of eligibility criteria where aliases have been added
 	#----------------------------------------------------------------------------------------------#
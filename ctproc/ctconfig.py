@@ -26,6 +26,31 @@ class CTConfig(NamedTuple):
 
   is_topic:           bool, whether to treat the data_path as a path to topics, not clinical trials
   trec:               bool, whether to treat the data_path as a path to trec topic structure, not kz topics (docs are the same structure)
+
+  fields added since are appended below, after trec_or_kz, so positional arguments keep their meaning:
+
+  add_negation:      bool, whether to run negex over the entities, CTEntity.negation is None if False
+  nlp_batch_size:    int, number of texts (criteria sentences or topics) run through spaCy's nlp.pipe at once,
+                     collected across documents
+  ent_cache:         path to a sqlite file caching the parsed entities of each criteria sentence / topic text,
+                     shared between runs and worker processes, None to disable
+  ent_cache_max_bytes: int, size cap of the cached values, least recently used entries are evicted past it
+  alias_table:       path to a table built by `python -m ctproc.alias_table`, read for entity aliases instead of
+                     looking each up in the linker's knowledge base (which the linker still loads), None to use the knowledge base
+
+  write_offsets:     bool, whether to write the id -> byte offset index of the output beside it, <write_file>.offsets,
+                     which utils.get_processed_data() reads get_only ids through (see utils.OffsetIndex)
+
+  add_labs:           bool, whether to extract lab values (see ctproc.lab) from the criteria of docs, into inc_labs
+                      and exc_labs, and from the sentences of topics, into lab_sents. runs without nlp
+  analyte_table:      path to a CSV/TSV table of more analytes to extract, loaded by each CTProc (and worker),
+                      for its own docs only (see ctproc.lab.read_analyte_table()), None for the built-in lab tests only
+
+  workers:            int, number of processes to shard the zip members across, 1 processes serially in this process
+  shard_size:         int, number of zip members handed to a worker at a time
+  preserve_order:     bool, whether parallel results are yielded in zip order (buffered) or as shards complete
+
+  instrument:         bool, whether CTProc.instrument collects per stage timings and counters (see instrument.py)
   """
   data_path: Path
   id_to_print: Optional[str] = None
@@ -47,5 +72,24 @@ class CTConfig(NamedTuple):
   is_topic: bool = False
   trec_or_kz: str = 'trec'
 
+  # more nlp configs
+  add_negation: bool = True
+  nlp_batch_size: int = 256
+  ent_cache: Optional[Path] = None
+  ent_cache_max_bytes: int = 1 << 30
+  alias_table: Optional[Path] = None
+
+  # output configs
+  write_offsets: bool = True
+
+  # lab configs
+  add_labs: bool = False
+  analyte_table: Optional[Path] = None
 
+  # parallel configs
+  workers: int = 1
+  shard_size: int = 64
+  preserve_order: bool = True
 
+  # diagnostics
+  instrument: bool = False
@@ -6,7 +6,8 @@ from lxml import etree
 from typing import Dict, List, Optional, Set
 
 from .ctconfig import CTConfig
-from .ctbase import CTBase, NLPTools
+from .ctbase import CTBase, NLPTools, ParsedText
+from .lab import AnalyteTable, LabValue, extract_lab_values_batch
 from .regex_patterns import AGE_PATTERN
 from .utils import get_str_or_none, data_to_str, convert_age_to_year, filter_words
 
@@ -153,6 +154,21 @@ class CTDocument(CTBase):
             return None
         age = self.process_age_field(field_val.text)
         return age
+
+
+    def process_doc_age_text(self, min_age_text: Optional[str], max_age_text: Optional[str]) -> None:
+        """
+        desc: same as process_doc_age(), from the already extracted text of the age fields
+        """
+        if min_age_text is not None:
+            min_age = self.process_age_field(min_age_text)
+            if min_age is not None:
+                self.elig_min_age = min_age
+
+        if max_age_text is not None:
+            max_age = self.process_age_field(max_age_text)
+            if max_age is not None:
+                self.elig_max_age = max_age
        
 
     def get_filtered_doc_as_dict(self) -> Dict[str, str]:
@@ -161,30 +177,66 @@ class CTDocument(CTBase):
                  some other types of uses
         """
         filtered = {}
-        filtered['nct_id'] = self.nct_id
+        filtered['nct_id'] = self.id
         filtered['min_age'] = self.elig_min_age
         filtered['max_age'] = self.elig_max_age
         filtered['gender'] = self.elig_gender
-        filtered['include_cuis'] = ' '.join([ent['cui']['val'] for ent in self.inc_ents])
-        filtered['exclude_cuis'] = ' '.join([ent['cui']['val'] for ent in self.exc_ents])
+        filtered['include_cuis'] = ' '.join([ent.cui['val'] for ent_sent in self.inc_ents for ent in ent_sent])
+        filtered['exclude_cuis'] = ' '.join([ent.cui['val'] for ent_sent in self.exc_ents for ent in ent_sent])
         return filtered 
 
 
 
-    def add_nlp_features(self, config: CTConfig) -> None:
+    def get_nlp_texts(self, config: CTConfig) -> List[str]:
+        """
+        desc:    the texts add_nlp_features() runs through the spaCy pipeline, include then exclude criteria
+        """
+        if not config.add_ents:
+            return []
+        return self.elig_crit.include_criteria + self.elig_crit.exclude_criteria
+
+
+    def add_nlp_features(self, config: CTConfig, parsed_texts: Optional[List[ParsedText]] = None) -> None:
+        """
+        parsed_texts:   ParsedText for each of get_nlp_texts(), in the same order, if already parsed 
+                        in a batch, otherwise the criteria are parsed (or read from the cache) one at a time
+        """
         if config.remove_stops:
             self.inc_filtered = [filter_words(sent, self.nlp_tools.STOP_WORDS) for sent in self.elig_crit.include_criteria]
             self.exc_filtered = [filter_words(sent, self.nlp_tools.STOP_WORDS) for sent in self.elig_crit.exclude_criteria]
     
         if config.add_ents:
-            self.add_doc_ent_sents(config)
+            if parsed_texts is None:
+                self.add_doc_ent_sents(config)
+            else:
+                n_inc = len(self.elig_crit.include_criteria)
+                self.add_doc_ent_sents(config, parsed_texts[:n_inc], parsed_texts[n_inc:])
             
         if config.expand:
             self.expand_with_aliases()
 
             
-    def add_doc_ent_sents(self, config: CTConfig) -> None:
-        inc_nlp_sents = [self.nlp_tools.NLP(s) for s in self.elig_crit.include_criteria]
-        exc_nlp_sents = [self.nlp_tools.NLP(s) for s in self.elig_crit.exclude_criteria]
-        self.inc_ents = self.get_ents(inc_nlp_sents, config)
-        self.exc_ents = self.get_ents(exc_nlp_sents, config)
+    def add_doc_ent_sents(
+        self, 
+        config: CTConfig, 
+        inc_parsed: Optional[List[ParsedText]] = None, 
+        exc_parsed: Optional[List[ParsedText]] = None
+    ) -> None:
+        if inc_parsed is None:
+            inc_parsed = self.parse_texts(self.elig_crit.include_criteria, config)
+        if exc_parsed is None:
+            exc_parsed = self.parse_texts(self.elig_crit.exclude_criteria, config)
+        self.inc_ents = [parsed.ents for parsed in inc_parsed]
+        self.exc_ents = [parsed.ents for parsed in exc_parsed]
+
+
+    def add_lab_values(self, analyte_table: Optional[AnalyteTable] = None) -> None:
+        """
+        analyte_table: the lab tests to find, None for the built-in ones (see lab.read_analyte_table())
+        desc:    extracts the lab values of each include and exclude criterion, in one batch,
+                 into inc_labs and exc_labs, parallel to the criteria lists
+        """
+        n_inc = len(self.elig_crit.include_criteria)
+        labs = extract_lab_values_batch(self.elig_crit.include_criteria + self.elig_crit.exclude_criteria, analyte_table)
+        self.inc_labs: List[List[LabValue]] = labs[:n_inc]
+        self.exc_labs: List[List[LabValue]] = labs[n_inc:]
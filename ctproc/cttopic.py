@@ -6,13 +6,16 @@ from typing import Any, List, Optional
 from .ctconfig import CTConfig
 from .utils import filter_words, convert_age_to_year
 from .regex_patterns import TOPIC_AGE_PATTERN, TOPIC_GENDER_PATTERN
-from .ctbase import CTBase, CTEntity, NLPTools
+from .ctbase import CTBase, CTEntity, NLPTools, ParsedText
+from .lab import AnalyteTable, LabValue, extract_lab_values_batch
 
 logger = logging.getLogger(__file__)
 
 
 
 class CTTopic(CTBase):
+	keep_sents = True    # text_sents come from the parse
+
 	def __init__(self, id: str, raw_text: str, nlp_tools: Optional[NLPTools] = None) -> None:
 		super().__init__(id=id, nlp_tools=nlp_tools)
 		self.raw_text: Optional[str] = raw_text
@@ -61,20 +64,39 @@ class CTTopic(CTBase):
 		return "All"
 
 
-	def add_nlp_features(self, config: CTConfig) -> None:
-		nlp_sents = self.nlp_tools.NLP(self.raw_text)
-		self.text_sents = [s.text for s in nlp_sents.sents]
+	def get_nlp_texts(self, config: CTConfig) -> List[str]:
+		return [self.raw_text]
+
+
+	def add_nlp_features(self, config: CTConfig, parsed_texts: Optional[List[ParsedText]] = None) -> None:
+		"""
+		parsed_texts:   the ParsedText of raw_text in a single item list, if already parsed in a batch
+		"""
+		if parsed_texts is None:
+			parsed_texts = self.parse_texts(self.get_nlp_texts(config), config)
+		parsed = parsed_texts[0]
+		self.text_sents = parsed.sents
 		
 		if config.remove_stops:
 			self.filtered_sents = [filter_words(sent, self.nlp_tools.STOP_WORDS) for sent in self.text_sents]
 			
 		if config.add_ents:
-			self.ent_sents = self.get_ents([nlp_sents], config)
+			self.ent_sents = [parsed.ents]
 			
 		if config.expand:
 			self.expand_with_aliases()
 
 
+	def add_lab_values(self, analyte_table: Optional[AnalyteTable] = None) -> None:
+		"""
+		analyte_table:  the lab tests to find, None for the built-in ones (see lab.read_analyte_table())
+		desc:   extracts the lab values of each sentence, in one batch, into lab_sents, parallel to 
+				text_sents. without sentences (nlp off), lab_sents has the one list of raw_text
+		"""
+		sents = self.text_sents if self.text_sents is not None else [self.raw_text]
+		self.lab_sents: List[List[LabValue]] = extract_lab_values_batch(sents, analyte_table)
+
+
 	def expand_with_aliases(self):
 		"""
 		desc:   expands the text and entities with aliases
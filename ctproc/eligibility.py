@@ -1,7 +1,7 @@
 
 import re
-from .utils import clean_sentences
-from .regex_patterns import INC_ONLY_PATTERN, EXC_ONLY_PATTERN, BOTH_INC_AND_EXC_PATTERN
+from .utils import clean_sentences_batch
+from .regex_patterns import INC_ONLY_PATTERN, EXC_ONLY_PATTERN, BOTH_INC_AND_EXC_PATTERN, EXC_HEADER_PATTERN, EXC_HEADER_CRITERIA_OFFSETS, CRIT_WRAP_PATTERN
 
 
 #----------------------------------------------------------------#
@@ -32,18 +32,56 @@ def process_eligibility_naive(elig_text):
     any information once extracted and cleaned, in which case they will be removed.
 
     """
-    inc_crit, exc_crit = [], []
-    for h, chunk in enumerate(re.split(r'(?:[Ee]xclu(?:de|sion) criteria:?)|(?:[Ii]neligibility [Cc]riteria:?)', elig_text, flags=re.IGNORECASE)):
-      for s in re.split(r'\n\n', chunk): 
-        for ss in re.split(r'- ', s):
-          ss = re.sub(r'\n   +', ' ', ss).strip()
-          if len(ss) > 0:
-            if h == 0:
-              inc_crit.append(ss)
-            else:
-              exc_crit.append(ss)
-      
-    return clean_sentences(inc_crit), clean_sentences(exc_crit)
+    chunks = split_exc_headers(elig_text)
+    inc_crit, exc_crit = clean_sentences_batch([criteria_fragments(chunks[:1]), criteria_fragments(chunks[1:])])
+    return inc_crit, exc_crit
+
+
+
+def split_exc_headers(elig_text):
+  """
+  elig_text:   a block of raw eligibility text
+  desc:        same as EXC_HEADER_PATTERN.split(elig_text), the first chunk holding the inclusion 
+                criteria and the rest the exclusion criteria. the case insensitive pattern is slow 
+                to scan a whole textblock with, so for ascii text (where lower() keeps positions) 
+                it is only matched where 'criteria' occurs, at the offsets a header would start
+  """
+  if not elig_text.isascii():
+    return EXC_HEADER_PATTERN.split(elig_text)
+
+  lowered = elig_text.lower()
+  chunks, last_end = [], 0
+  pos = lowered.find('criteria')
+  while pos != -1:
+    for offset in EXC_HEADER_CRITERIA_OFFSETS:
+      if pos - offset >= last_end:
+        m = EXC_HEADER_PATTERN.match(elig_text, pos - offset)
+        if m is not None:
+          chunks.append(elig_text[last_end:m.start()])
+          last_end = m.end()
+          break
+    pos = lowered.find('criteria', pos + 8)
+  chunks.append(elig_text[last_end:])
+  return chunks
+
+
+
+def criteria_fragments(chunks):
+  """
+  chunks:      chunks of eligibility text
+  returns:     the non empty fragments of the chunks split by blank lines, then by '- ' bullets,
+                with wrapped lines joined
+  """
+  crit = []
+  for chunk in chunks:
+    for s in chunk.split('\n\n'):
+      for ss in s.split('- '):
+        if '\n   ' in ss:
+          ss = CRIT_WRAP_PATTERN.sub(' ', ss)
+        ss = ss.strip()
+        if len(ss) > 0:
+          crit.append(ss)
+  return crit
 
 
 
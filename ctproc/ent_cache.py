@@ -0,0 +1,335 @@
+# ----------------------------------------------------------------------------------------------- #
+# on disk, content addressed cache of the entity linking results for a piece of text
+# ----------------------------------------------------------------------------------------------- #
+
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Generator, Iterable, List, Optional, Tuple, Union
+
+from .ctbase import CTEntity, ParsedText
+
+logger = logging.getLogger(__file__)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ents (
+    key BLOB PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ents_last_used ON ents(last_used);
+CREATE TABLE IF NOT EXISTS meta (total_bytes INTEGER NOT NULL, hits INTEGER NOT NULL, misses INTEGER NOT NULL);
+INSERT INTO meta SELECT 0, 0, 0 WHERE NOT EXISTS (SELECT 1 FROM meta);
+CREATE TRIGGER IF NOT EXISTS ents_insert AFTER INSERT ON ents BEGIN
+    UPDATE meta SET total_bytes = total_bytes + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS ents_delete AFTER DELETE ON ents BEGIN
+    UPDATE meta SET total_bytes = total_bytes - OLD.size;
+END;
+"""
+
+# sqlite's default limit on host parameters is 999 on older builds
+_MAX_PARAMS = 900
+
+# how text is normalized before it is hashed into a key, part of every key so a change to
+# normalize_text() never reads entries keyed by the old one
+NORMALIZATION = "casefold,collapse-whitespace:1"
+
+# last_used updates of hits kept in memory until this many, then written in one transaction,
+# so a lookup doesn't take the write lock
+TOUCH_BATCH = 4096
+
+_NON_SPACE = re.compile(r'\S+')
+
+
+
+def serialize_parsed(parsed: ParsedText, text: str = "") -> bytes:
+    """
+    text:       the text parsed, the entity offsets and sentences are positions in it
+    """
+    return json.dumps([parsed.sents, [list(ent) for ent in parsed.ents], text], default=float).encode('utf-8')
+
+
+def deserialize_parsed(value: bytes) -> Tuple[ParsedText, str]:
+    sents, ents, text = json.loads(value)
+    return ParsedText(sents=sents, ents=[CTEntity(*ent) for ent in ents]), text
+
+
+
+def normalize_text(text: str) -> str:
+    """
+    desc:       lowercased, whitespace runs collapsed to one space and stripped, what the key
+                of a text hashes, so case and whitespace variants of a criterion share an entry
+    """
+    return ' '.join(_NON_SPACE.findall(_lower(text)))
+
+
+
+def _lower(text: str) -> str:
+    # lowercase without changing the length (str.lower() turns U+0130 into two characters),
+    # so positions in the lowered text are positions in text
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        lowered = ''.join(ch.lower() if len(ch.lower()) == 1 else ch for ch in text)
+    return lowered
+
+
+
+def _positions(text: str) -> List[int]:
+    # position in text of each character of normalize_text(text), a collapsed whitespace run at
+    # the position of its first character
+    positions: List[int] = []
+    for match in _NON_SPACE.finditer(text):
+        if positions:
+            positions.append(positions[-1] + 1)
+        positions.extend(range(match.start(), match.end()))
+    return positions
+
+
+
+def remap_parsed(parsed: ParsedText, parsed_text: str, text: str) -> Optional[ParsedText]:
+    """
+    parsed:     the ParsedText of parsed_text
+    text:       a variant of parsed_text, the same under normalize_text()
+    returns:    parsed with the entity offsets, entity texts and sentences moved onto text, None
+                when a span doesn't start and end on a character normalize_text() keeps
+    """
+    if parsed_text == text:
+        return parsed
+    source = {position: i for i, position in enumerate(_positions(parsed_text))}
+    target = _positions(text)
+
+    def span(start: int, end: int) -> Optional[Tuple[int, int]]:
+        first, last = source.get(start), source.get(end - 1)
+        if first is None or last is None:
+            return None
+        return target[first], target[last] + 1
+
+    ents = []
+    for ent in parsed.ents:
+        moved = span(ent.start, ent.end)
+        if moved is None:
+            return None
+        ents.append(ent._replace(raw_text=text[moved[0]:moved[1]], start=moved[0], end=moved[1]))
+
+    sents, start = [], 0
+    for sent in parsed.sents:
+        start = parsed_text.find(sent, start)
+        moved = span(start, start + len(sent)) if (start >= 0 and sent) else None
+        if moved is None:
+            return None
+        sents.append(text[moved[0]:moved[1]])
+        start += len(sent)
+    return ParsedText(sents=sents, ents=ents)
+
+
+
+class EntityCache:
+    """
+    path:           sqlite file, shared between runs and between worker processes
+    version:        model / linker version string, part of every key so a new model never
+                    reads results produced by an old one
+    max_bytes:      cap on the size of the cached values, least recently used entries are
+                    evicted down to 90% of the cap once it is exceeded
+    desc:           maps (normalized text, parse variant) -> ParsedText, see normalize_text().
+                    the text parsed is stored with its entities, whose offsets refer to positions
+                    in it, and a variant of it gets them moved onto its own text (remap_parsed()).
+                    the database runs in WAL mode so readers in other processes are never blocked
+                    by a writer, and lookups only read: hit and miss counts and the last use of
+                    hits are kept in memory and written with the next put_many(), every
+                    TOUCH_BATCH hits, and by stats() and close(). a connection is opened per
+                    process (the object can be pickled into workers)
+    """
+    def __init__(self, path: Union[str, Path], version: str, max_bytes: int = 1 << 30) -> None:
+        self.path = Path(path)
+        self.version = version
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._unflushed_hits = 0
+        self._unflushed_misses = 0
+        self._touched: Dict[bytes, int] = {}
+
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state['_conn'], state['_pid'] = None, None
+        state['_unflushed_hits'], state['_unflushed_misses'], state['_touched'] = 0, 0, {}
+        return state
+
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)   # transactions are explicit
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._pid = os.getpid()
+        return self._conn
+
+
+    def close(self) -> None:
+        if self._conn is not None and self._pid == os.getpid():
+            self.sync()
+            self._conn.close()
+        self._conn, self._pid = None, None
+
+
+    @contextmanager
+    def write(self) -> Generator[sqlite3.Connection, None, None]:
+        # takes the write lock up front, so concurrent writers queue on busy_timeout instead of
+        # failing to upgrade a read transaction
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+    def make_key(self, key: Tuple[str, str]) -> bytes:
+        variant, text = key
+        raw = f"{self.version}\0{NORMALIZATION}\0{variant}\0{normalize_text(text)}".encode('utf-8', 'surrogatepass')
+        return hashlib.blake2b(raw, digest_size=16).digest()
+
+
+    def get_many(self, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], ParsedText]:
+        """
+        keys:       (variant, text) pairs, see CTBase.nlp_key()
+        returns:    the cached ParsedText of every key found, moved onto the key's text when a
+                    variant of it was parsed, hits and misses are counted
+        """
+        by_digest: Dict[bytes, List[Tuple[str, str]]] = {}
+        for key in set(keys):
+            by_digest.setdefault(self.make_key(key), []).append(key)
+        if len(by_digest) == 0:
+            return {}
+
+        found = {}
+        digests = list(by_digest)
+        for i in range(0, len(digests), _MAX_PARAMS):
+            chunk = digests[i:i + _MAX_PARAMS]
+            marks = ','.join('?' * len(chunk))
+            for digest, value in self.conn.execute(f"SELECT key, value FROM ents WHERE key IN ({marks})", chunk):
+                parsed, parsed_text = deserialize_parsed(value)
+                for key in by_digest[digest]:
+                    moved = remap_parsed(parsed, parsed_text, key[1])
+                    if moved is not None:
+                        found[key] = moved
+                        self._touched[digest] = time.time_ns()
+
+        n_hits, n_misses = len(found), sum(len(keys) for keys in by_digest.values()) - len(found)
+        self.hits += n_hits
+        self.misses += n_misses
+        self._unflushed_hits += n_hits
+        self._unflushed_misses += n_misses
+
+        if len(self._touched) >= TOUCH_BATCH:
+            with self.write():
+                self.flush()
+        return found
+
+
+    def unflushed(self) -> bool:
+        return bool(self._unflushed_hits or self._unflushed_misses or self._touched)
+
+
+    def flush(self) -> None:
+        """
+        desc:   writes the hit and miss counts and last uses kept since the last flush, called
+                inside a write() transaction
+        """
+        conn = self.conn
+        conn.execute("UPDATE meta SET hits = hits + ?, misses = misses + ?", (self._unflushed_hits, self._unflushed_misses))
+        conn.executemany("UPDATE ents SET last_used = ? WHERE key = ?", [(used, digest) for digest, used in self._touched.items()])
+        self._unflushed_hits, self._unflushed_misses, self._touched = 0, 0, {}
+
+
+    def sync(self) -> None:
+        """
+        desc:   writes what is kept in memory (see flush()), if anything, in a transaction of its own
+        """
+        if self.unflushed():
+            with self.write():
+                self.flush()
+
+
+    def put_many(self, items: Dict[Tuple[str, str], ParsedText]) -> None:
+        if len(items) == 0:
+            return
+
+        now = time.time_ns()
+        rows = []
+        for key, parsed in items.items():
+            value = serialize_parsed(parsed, key[1])
+            rows.append((self.make_key(key), value, len(value), now))
+
+        with self.write() as conn:
+            self.flush()
+            conn.executemany("INSERT OR IGNORE INTO ents (key, value, size, last_used) VALUES (?, ?, ?, ?)", rows)
+            self.evict()
+
+
+    def evict(self) -> None:
+        """
+        desc:   drops least recently used entries until the cache is back under 90% of max_bytes,
+                called inside the put_many() transaction
+        """
+        total_bytes = self.total_bytes()
+        if total_bytes <= self.max_bytes:
+            return
+
+        to_free = total_bytes - int(0.9 * self.max_bytes)
+        victims: List[bytes] = []
+        for digest, size in self.conn.execute("SELECT key, size FROM ents ORDER BY last_used"):
+            victims.append(digest)
+            to_free -= size
+            if to_free <= 0:
+                break
+
+        for i in range(0, len(victims), _MAX_PARAMS):
+            chunk = victims[i:i + _MAX_PARAMS]
+            self.conn.execute(f"DELETE FROM ents WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+        logger.info(f"evicted {len(victims)} entries from the entity cache")
+
+
+    def total_bytes(self) -> int:
+        return self.conn.execute("SELECT total_bytes FROM meta").fetchone()[0]
+
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.
+
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        returns:    hit counts for this process, and over every process and run that used the file
+        """
+        self.sync()
+        total_bytes, hits, misses = self.conn.execute("SELECT total_bytes, hits, misses FROM meta").fetchone()
+        n_entries = self.conn.execute("SELECT COUNT(*) FROM ents").fetchone()[0]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate(),
+            'total_hits': hits,
+            'total_misses': misses,
+            'total_hit_rate': hits / (hits + misses) if hits + misses > 0 else 0.,
+            'entries': n_entries,
+            'bytes': total_bytes,
+        }
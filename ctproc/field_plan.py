@@ -0,0 +1,161 @@
+# ----------------------------------------------------------------------------------------------- #
+# single pass extraction of the fields CTProc needs from a clinical trial XML document
+# ----------------------------------------------------------------------------------------------- #
+
+
+import logging
+
+from lxml import etree
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Set, Tuple, Union
+
+logger = logging.getLogger(__file__)
+
+
+FieldValue = Union[Optional[str], List[str]]
+
+
+class FieldSpec(NamedTuple):
+    path: str            # path relative to the <clinical_study> root, as passed to root.find()
+    multi: bool = False  # True for root.findall() semantics (list of texts), else root.find() (first text)
+
+
+# fields read by CTProc.process_ct_doc_file()
+CT_DOC_FIELDS: Dict[str, FieldSpec] = {
+    'nct_id': FieldSpec('id_info/nct_id'),
+    'condition': FieldSpec('condition', multi=True),
+    'condition_browse': FieldSpec('condition/condition_browse', multi=True),
+    'intervention_type': FieldSpec('intervention/intervention_type', multi=True),
+    'intervention_name': FieldSpec('intervention/intervention_name', multi=True),
+    'criteria': FieldSpec('eligibility/criteria/textblock'),
+    'minimum_age': FieldSpec('eligibility/minimum_age'),
+    'maximum_age': FieldSpec('eligibility/maximum_age'),
+}
+
+
+# relative order of top level elements that holds across the ClinicalTrials.gov schema versions
+# (public.xsd is a sequence). Only elements whose position is stable are ranked; seeing a ranked
+# element means every element of lower rank is behind us. Unranked elements never end the
+# extraction early, so a missing entry only costs reading further.
+_AFTER_ELIGIBILITY = (
+    'overall_official', 'overall_contact', 'overall_contact_backup', 'location', 'location_countries',
+    'removed_countries', 'link', 'reference', 'results_reference', 'verification_date',
+)
+ROOT_ORDER: Dict[str, int] = {
+    'required_header': 0,
+    'id_info': 1,
+    'condition': 2,
+    'arm_group': 3,
+    'intervention': 4,
+    'biospec_retention': 5,
+    'biospec_descr': 5,
+    'eligibility': 6,
+    **{tag: 7 for tag in _AFTER_ELIGIBILITY},
+}
+
+
+
+class FieldPlan:
+    """
+    fields:     dict of output name -> FieldSpec
+    desc:       compiled form of a field set, built once and shared by every document parsed:
+                a lookup from element path (as a tuple of tags) to the fields it fills, the
+                top level anchor element each field lives under, and the tags the parser reports
+    """
+    def __init__(self, fields: Dict[str, FieldSpec] = CT_DOC_FIELDS) -> None:
+        self.fields = fields
+        self.names: List[str] = list(fields)
+        self.multi: List[bool] = [spec.multi for spec in fields.values()]
+        self.by_path: Dict[Tuple[str, ...], List[int]] = {}
+        self.anchors: List[str] = []
+        for i, spec in enumerate(fields.values()):
+            path = tuple(spec.path.split('/'))
+            self.by_path.setdefault(path, []).append(i)
+            self.anchors.append(path[0])
+
+        self.leaf_tags: Set[str] = {path[-1] for path in self.by_path}
+
+        # once a top level element ranked after every anchor opens, every field is complete
+        anchor_ranks = [ROOT_ORDER.get(anchor) for anchor in self.anchors]
+        if anchor_ranks and None not in anchor_ranks:
+            self.stop_tags = {tag for tag, rank in ROOT_ORDER.items() if rank > max(anchor_ranks)}
+        else:
+            self.stop_tags = set()
+
+        # only these tags produce parser events, everything else stays in C
+        self.tags: Set[str] = self.leaf_tags | self.stop_tags
+
+
+
+def element_path(el: etree._Element) -> Tuple[str, ...]:
+    """path of tags from below the root down to el, the form root.find() paths take"""
+    path = []
+    parent = el.getparent()
+    while parent is not None:
+        path.append(el.tag)
+        el, parent = parent, parent.getparent()
+    return tuple(reversed(path))
+
+
+
+class FieldExtractor:
+    """
+    plan:           compiled FieldPlan
+    chunk_size:     bytes read from the member at a time
+    desc:           gets every field of the plan in one pass over the document, with root.find() /
+                    root.findall() semantics. a single configured pull parser is reused for every
+                    document; it only reports the plan's tags, and reading the member stops as soon
+                    as all fields have been seen
+    """
+    def __init__(self, plan: Optional[FieldPlan] = None, chunk_size: int = 1 << 12) -> None:
+        self.plan = plan if plan is not None else FieldPlan()
+        self.chunk_size = chunk_size
+        self.parser = etree.XMLPullParser(
+            events=('start', 'end'),
+            tag=self.plan.tags,
+            resolve_entities=False,
+            no_network=True,
+            huge_tree=True,
+        )
+
+
+    def extract(self, xml_filereader: BinaryIO) -> Dict[str, FieldValue]:
+        plan = self.plan
+        values: List[FieldValue] = [[] if multi else None for multi in plan.multi]
+        found = [False] * len(plan.names)
+        done = False
+        finished = False
+        try:
+            while not done:
+                chunk = xml_filereader.read(self.chunk_size)
+                if not chunk:
+                    finished = True
+                    break
+                self.parser.feed(chunk)
+
+                for event, el in self.parser.read_events():
+                    if event == 'start':
+                        if el.tag in plan.stop_tags and el.getparent().getparent() is None:
+                            done = True
+                            break
+                        continue
+                    if el.tag not in plan.leaf_tags:
+                        continue
+
+                    for i in plan.by_path.get(element_path(el), ()):
+                        if plan.multi[i]:
+                            values[i].append(el.text)
+                        elif not found[i]:
+                            values[i] = el.text
+                            found[i] = True
+        finally:
+            try:
+                self.parser.close()
+            except etree.XMLSyntaxError:
+                # expected when we stop early on a partially fed document, resets the parser
+                if finished:
+                    raise
+            finally:
+                for _ in self.parser.read_events():
+                    pass
+
+        return dict(zip(plan.names, values))
@@ -0,0 +1,83 @@
+# ----------------------------------------------------------------------------------------------- #
+# helpers shared by the indexes over processed trials: prefilter, retrieval and concepts
+# ----------------------------------------------------------------------------------------------- #
+
+
+import numpy as np
+from pathlib import Path
+from scipy import sparse
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+
+
+def get_field(obj: Any, name: str) -> Any:
+    """
+    obj:        processed CTDocument or CTTopic, or its dict as read back by utils.get_processed_data()
+    returns:    the value of its field name, None if it doesn't have it
+    """
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+
+def read_lines(path: Path, n_lines: int) -> List[str]:
+    """
+    desc:       the lines of a file written as '\\n'.join(lines), n_lines tells an empty file from one empty line
+    """
+    text = path.read_text(encoding='utf-8')
+    return text.split('\n') if n_lines else []
+
+
+
+def renumber_sorted(ids: Dict[str, int]) -> Tuple[List[str], np.ndarray]:
+    """
+    ids:        keys (e.g. cuis) numbered as first seen
+    returns:    the keys sorted, and the array taking each first seen number to its position in them
+    """
+    keys = sorted(ids)
+    renumber = np.zeros(len(keys), dtype=np.int32)
+    renumber[[ids[key] for key in keys]] = np.arange(len(keys), dtype=np.int32)
+    return keys, renumber
+
+
+
+def index_dtype(n_entries: int) -> type:
+    """
+    desc:       dtype of the indptr and indices of a csr matrix with n_entries entries. indptr only needs
+                int64 once there are 2^31 entries, and with both index arrays one dtype scipy takes them
+                (also memory mapped) as they are
+    """
+    return np.int32 if n_entries < np.iinfo(np.int32).max else np.int64
+
+
+
+def bool_csr(indices: np.ndarray, lengths: np.ndarray, n_columns: int) -> sparse.csr_matrix:
+    """
+    indices:    column indices of the true entries, row by row
+    lengths:    number of entries in each row
+    """
+    dtype = index_dtype(len(indices))
+    indptr = np.zeros(len(lengths) + 1, dtype=dtype)
+    np.cumsum(lengths, out=indptr[1:])
+    return sparse.csr_matrix((np.ones(len(indices), dtype=bool), indices.astype(dtype, copy=False), indptr), shape=(len(lengths), n_columns))
+
+
+
+def rows_csr(rows: Sequence[np.ndarray], n_columns: int) -> sparse.csr_matrix:
+    """
+    rows:       sorted column indices of the true entries of each row
+    """
+    indices = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+    return bool_csr(indices, np.array([len(row) for row in rows], dtype=np.int64), n_columns)
+
+
+
+def distinct(positions: Iterable[np.ndarray], n_positions: int) -> np.ndarray:
+    """
+    positions:  arrays of positions below n_positions
+    returns:    the sorted, distinct positions in any of them
+    """
+    # through a mask over all positions, cheaper than sorting many of them
+    mask = np.zeros(n_positions, dtype=bool)
+    for array in positions:
+        mask[array] = True
+    return np.flatnonzero(mask)
@@ -0,0 +1,242 @@
+# ----------------------------------------------------------------------------------------------- #
+# opt in timing and counters for the stages of the CTProc pipeline
+# ----------------------------------------------------------------------------------------------- #
+
+
+import logging
+from time import perf_counter
+from collections import defaultdict
+from typing import Any, BinaryIO, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__file__)
+
+
+# callback(doc_id, {stage: seconds}) called once per document, when it has been written
+DocCallback = Callable[[str, Dict[str, float]], None]
+
+
+
+class StageStats(NamedTuple):
+    seconds: Dict[str, float]      # cumulative time per stage, exclusive of stages nested inside it
+    calls: Dict[str, int]          # times each stage ran
+    counters: Dict[str, int]       # event counts, e.g. docs, skipped members, nlp texts
+
+    def __str__(self) -> str:
+        total = sum(self.seconds.values())
+        lines = [f"{'stage':>16} {'seconds':>10} {'share':>6} {'calls':>9}"]
+        for stage, seconds in sorted(self.seconds.items(), key=lambda item: -item[1]):
+            share = seconds / total if total > 0 else 0.
+            lines.append(f"{stage:>16} {seconds:10.3f} {100 * share:5.1f}% {self.calls.get(stage, 0):9d}")
+        lines.extend(f"{name:>16} {n:10d}" for name, n in sorted(self.counters.items()))
+        return '\n'.join(lines)
+
+
+
+class _Stage:
+    __slots__ = ('instrument', 'name', 'key', 't0')
+
+    def __init__(self, instrument: "Instrument", name: str, key: Optional[Hashable]) -> None:
+        self.instrument, self.name, self.key = instrument, name, key
+
+    def __enter__(self) -> None:
+        self.instrument._stack.append(0.)
+        self.t0 = perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.instrument._end_stage(self.name, self.key, perf_counter() - self.t0)
+
+
+
+class Instrument:
+    """
+    keep_doc_timings:   whether per document timings are kept in doc_timings, besides being
+                        passed to the callbacks
+    desc:               collects the time spent in each pipeline stage, cumulative and per document,
+                        and named counters. stages nest, and the time of a stage excludes the stages
+                        run inside it. readable at any point of a run with stats()
+    """
+    enabled = True
+
+    def __init__(self, keep_doc_timings: bool = False) -> None:
+        self.keep_doc_timings = keep_doc_timings
+        self.callbacks: List[DocCallback] = []
+        self.doc_timings: List[Tuple[str, Dict[str, float]]] = []
+        self._seconds: Dict[str, float] = defaultdict(float)
+        self._calls: Dict[str, int] = defaultdict(int)
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._pending: Dict[Hashable, Dict[str, float]] = {}
+        self._stack: List[float] = []
+
+
+    def add_callback(self, callback: DocCallback) -> None:
+        self.callbacks.append(callback)
+
+
+    def stage(self, name: str, key: Optional[Hashable] = None) -> _Stage:
+        """
+        key:        the document (or any hashable standing in for it until it exists, see rekey())
+                    the time is attributed to, None for stages shared by many documents
+        desc:       context manager timing one run of a stage
+        """
+        return _Stage(self, name, key)
+
+
+    def _end_stage(self, name: str, key: Optional[Hashable], elapsed: float) -> None:
+        exclusive = elapsed - self._stack.pop()
+        if self._stack:
+            self._stack[-1] += elapsed
+        self._seconds[name] += exclusive
+        self._calls[name] += 1
+        if key is not None:
+            doc_times = self._pending.setdefault(self._key(key), {})
+            doc_times[name] = doc_times.get(name, 0.) + exclusive
+
+
+    @staticmethod
+    def _key(key: Hashable) -> Hashable:
+        # documents are keyed by identity, they are neither hashable by value nor immutable
+        return key if isinstance(key, (str, int, tuple)) else id(key)
+
+
+    def count(self, name: str, n: int = 1) -> None:
+        self._counters[name] += n
+
+
+    def rekey(self, old_key: Hashable, new_key: Hashable) -> None:
+        """
+        desc:       moves the timings recorded under old_key (e.g. the zip member) to new_key
+                    (the document built from it), dropping them if new_key is None
+        """
+        doc_times = self._pending.pop(self._key(old_key), None)
+        if (doc_times is not None) and (new_key is not None):
+            for name, seconds in doc_times.items():
+                new_times = self._pending.setdefault(self._key(new_key), {})
+                new_times[name] = new_times.get(name, 0.) + seconds
+
+
+    def pop_doc_times(self, key: Hashable) -> Dict[str, float]:
+        return self._pending.pop(self._key(key), {})
+
+
+    def set_doc_times(self, key: Hashable, doc_times: Dict[str, float]) -> None:
+        self._pending[self._key(key)] = dict(doc_times)
+
+
+    def end_doc(self, key: Hashable, doc_id: str) -> None:
+        """
+        desc:       closes the timings of a document, passing them to the callbacks
+        """
+        doc_times = self._pending.pop(self._key(key), {})
+        if self.keep_doc_timings:
+            self.doc_timings.append((doc_id, doc_times))
+        for callback in self.callbacks:
+            callback(doc_id, doc_times)
+
+
+    def stats(self) -> StageStats:
+        return StageStats(dict(self._seconds), dict(self._calls), dict(self._counters))
+
+
+    def merge(self, stats: StageStats) -> None:
+        """
+        desc:       adds stats collected elsewhere, e.g. in a worker process
+        """
+        for stage, seconds in stats.seconds.items():
+            self._seconds[stage] += seconds
+        for stage, calls in stats.calls.items():
+            self._calls[stage] += calls
+        for name, n in stats.counters.items():
+            self._counters[name] += n
+
+
+    def reset(self) -> StageStats:
+        """
+        returns:    the stats so far, which are then cleared
+        """
+        stats = self.stats()
+        self._seconds.clear()
+        self._calls.clear()
+        self._counters.clear()
+        return stats
+
+
+    def timed_reader(self, filereader: BinaryIO, key: Optional[Hashable] = None) -> "TimedReader":
+        return TimedReader(filereader, self, key)
+
+
+
+class TimedReader:
+    """
+    desc:   file object proxy timing read() as the 'decompress' stage, for zip members read
+            incrementally by the field extractor
+    """
+    def __init__(self, filereader: BinaryIO, instrument: Instrument, key: Optional[Hashable] = None) -> None:
+        self.filereader = filereader
+        self.instrument = instrument
+        self.key = key
+
+    def read(self, size: int = -1) -> bytes:
+        with self.instrument.stage('decompress', self.key):
+            return self.filereader.read(size)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.filereader, name)
+
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+_NO_STAGE = _NoStage()
+
+
+
+class NoInstrument:
+    """
+    desc:   stand in used when instrumentation is off, every call is a no-op returning shared objects
+    """
+    enabled = False
+    callbacks: List[DocCallback] = []
+
+    def add_callback(self, callback: DocCallback) -> None:
+        raise ValueError("instrumentation is off, set CTConfig.instrument=True to use callbacks")
+
+    def stage(self, name: str, key: Optional[Hashable] = None) -> _NoStage:
+        return _NO_STAGE
+
+    def count(self, name: str, n: int = 1) -> None:
+        return None
+
+    def rekey(self, old_key: Hashable, new_key: Hashable) -> None:
+        return None
+
+    def pop_doc_times(self, key: Hashable) -> Dict[str, float]:
+        return {}
+
+    def set_doc_times(self, key: Hashable, doc_times: Dict[str, float]) -> None:
+        return None
+
+    def end_doc(self, key: Hashable, doc_id: str) -> None:
+        return None
+
+    def stats(self) -> StageStats:
+        return StageStats({}, {}, {})
+
+    def merge(self, stats: StageStats) -> None:
+        return None
+
+    def reset(self) -> StageStats:
+        return self.stats()
+
+    def timed_reader(self, filereader: BinaryIO, key: Optional[Hashable] = None) -> BinaryIO:
+        return filereader
+
+
+NO_INSTRUMENT = NoInstrument()
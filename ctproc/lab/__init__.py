@@ -1,3 +1,16 @@
-from .extractor import extract_lab_values
+from .extractor import extract_lab_values, extract_lab_values_batch
 from .types import LabValue, LabTest, ReferenceRange
 from .reference_ranges import get_lab_test, get_all_lab_names
+from .loader import load_analyte_table, read_analyte_table
+from .patterns import AnalyteTable
+from .matcher import AnalyteMatcher
+from .units import canonical_unit, to_canonical, reference_range, normalize_values, evaluate_values
+from .constraints import LabConstraint, extract_lab_constraints, constraint_from_value
+
+
+def __getattr__(name):
+    # the index needs numpy, only imported when it is used
+    if name in ("LabIndex", "LabColumns"):
+        from . import index
+        return getattr(index, name)
+    raise AttributeError(f"module 'ctproc.lab' has no attribute {name!r}")
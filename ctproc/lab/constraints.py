@@ -0,0 +1,136 @@
+import re
+from dataclasses import dataclass
+from typing import List
+
+from .types import LabTest, LabValue
+from .patterns import AnalyteTable
+from .reference_ranges import get_lab_test
+from .extractor import extract_lab_values
+from .units import canonical_unit, reference_range, to_canonical
+
+# Comparator phrases of eligibility criteria, and the comparator each one means. The
+# extractor skips them on the way to the value, they are read back from the mention here.
+COMPARATORS: dict[str, str] = {
+    "≥": ">=", ">=": ">=", "at least": ">=", "greater than or equal to": ">=", "no less than": ">=",
+    "equal to or greater than": ">=", "not less than": ">=", "minimum of": ">=", "minimum": ">=",
+    ">": ">", "greater than": ">", "more than": ">", "above": ">", "over": ">", "exceeding": ">",
+    "higher than": ">", "in excess of": ">",
+    "≤": "<=", "<=": "<=", "less than or equal to": "<=", "no greater than": "<=", "no more than": "<=",
+    "equal to or less than": "<=", "not greater than": "<=", "not more than": "<=", "not exceeding": "<=",
+    "maximum of": "<=", "maximum": "<=", "up to": "<=",
+    "<": "<", "less than": "<", "below": "<", "under": "<", "lower than": "<",
+    "=": "=", "equal to": "=",
+}
+COMPARATOR_PATTERN = re.compile(
+    "|".join(
+        rf"\b{re.escape(phrase)}\b".replace(r"\ ", r"\s+") if phrase[0].isalpha() else re.escape(phrase)
+        for phrase in sorted(COMPARATORS, key=len, reverse=True)
+    ),
+    re.IGNORECASE,
+)
+# "9 g/dL or more" — comparators that follow the value (and the rest of its unit, the end
+# of an extracted value can fall short of the end of the unit)
+POSTFIX_COMPARATOR_PATTERN = re.compile(
+    r"\S*\s*(?:(?P<ge>or\s+(?:more|higher|greater|above)|and\s+(?:above|over)|or\s+over)|"
+    r"(?P<le>or\s+(?:less|lower|below|fewer)|and\s+(?:below|under)))\b",
+    re.IGNORECASE,
+)
+_MULTISPACE = re.compile(r"\s+")
+
+
+@dataclass
+class LabConstraint:
+    """
+    A lab requirement of an eligibility criterion: the analyte compared to a threshold.
+
+    threshold (and threshold_high, the top of a "between" range) are in the canonical unit
+    of the analyte (see units.canonical_unit()), None if the unit of the mention could not be
+    converted to it. A ULN multiple is resolved against the high end of the analyte's
+    conventional range, and kept in uln_multiple.
+    """
+    analyte: str
+    comparator: str          # one of "<", "<=", ">", ">=", "=", "between"
+    threshold: float | None
+    threshold_high: float | None = None
+    unit: str = ""
+    uln_multiple: float | None = None
+    raw_text: str = ""
+
+    def bounds(self) -> tuple[float, float, bool, bool]:
+        """(low, high, low inclusive, high inclusive) of the values satisfying the constraint."""
+        inf = float("inf")
+        if self.comparator == "between":
+            return self.threshold, self.threshold_high, True, True
+        if self.comparator in (">", ">="):
+            return self.threshold, inf, self.comparator == ">=", False
+        if self.comparator in ("<", "<="):
+            return -inf, self.threshold, False, self.comparator == "<="
+        return self.threshold, self.threshold, True, True
+
+
+def upper_limit_of_normal(lab_test: LabTest) -> float | None:
+    """The upper limit of normal of lab_test in its canonical unit, None if it has no range."""
+    bounds = reference_range(lab_test)
+    if bounds is None or bounds[1] == float("inf"):
+        return None
+    return bounds[1]
+
+
+def _comparator(text: str, lab_value: LabValue) -> str | None:
+    if lab_value.value_high is not None:
+        return "between"
+    m = COMPARATOR_PATTERN.search(text, lab_value.start, lab_value.end)
+    if m is not None:
+        return COMPARATORS[_MULTISPACE.sub(" ", m.group().lower())]
+    m = POSTFIX_COMPARATOR_PATTERN.match(text, lab_value.end)
+    if m is not None:
+        return ">=" if m["ge"] is not None else "<="
+    return None
+
+
+def constraint_from_value(text: str, lab_value: LabValue, table: AnalyteTable | None = None) -> LabConstraint | None:
+    """
+    The constraint of a lab value extracted from text, None if no comparator goes with it
+    (a bare "Hemoglobin 9 g/dL" does not say which way it bounds). table, if given, is the
+    lab tests the value was extracted with, in place of the built-in ones (LAB_TESTS).
+    """
+    lab_test = get_lab_test(lab_value.analyte) if table is None else table.get_lab_test(lab_value.analyte)
+    comparator = _comparator(text, lab_value)
+    if lab_test is None or comparator is None:
+        return None
+
+    unit = canonical_unit(lab_test)
+    if lab_value.unit == "x ULN":
+        uln = upper_limit_of_normal(lab_test)
+        threshold = None if uln is None else lab_value.value * uln
+        return LabConstraint(
+            analyte=lab_test.name, comparator=comparator, threshold=threshold, unit=unit,
+            uln_multiple=lab_value.value, raw_text=lab_value.raw_text,
+        )
+
+    threshold_high = None
+    if lab_value.value_high is not None:
+        threshold_high = to_canonical(lab_test, lab_value.value_high, lab_value.unit)
+    return LabConstraint(
+        analyte=lab_test.name, comparator=comparator,
+        threshold=to_canonical(lab_test, lab_value.value, lab_value.unit), threshold_high=threshold_high,
+        unit=unit, raw_text=lab_value.raw_text,
+    )
+
+
+def extract_lab_constraints(
+    text: str, lab_values: List[LabValue] | None = None, table: AnalyteTable | None = None
+) -> List[LabConstraint]:
+    """
+    The lab constraints of a criterion. lab_values are those extracted from text already
+    (e.g. CTDocument.inc_labs), extracted here if None. table is the lab tests they are (or
+    are to be) extracted with, e.g. CTProc.analyte_table, None for the built-in ones.
+    """
+    if lab_values is None:
+        lab_values = extract_lab_values(text, table)
+    constraints = []
+    for lab_value in lab_values:
+        constraint = constraint_from_value(text, lab_value, table)
+        if constraint is not None:
+            constraints.append(constraint)
+    return constraints
@@ -1,32 +1,38 @@
 import re
-from typing import List
+from typing import Iterable, List
 
 from .types import LabValue
 from .reference_ranges import get_lab_test
-from .patterns import ANALYTE_PATTERN, parse_number, parse_unit
-
-
-# Words/symbols between an analyte name and its value in clinical text.
-# Includes eligibility comparators as noise to skip through.
-_FILLER_WORDS = re.compile(
-    r"^(?:count|level|of|is|was|"
+from .patterns import VALUE_PATTERN, AnalyteTable, get_analyte_matcher
+
+
+# Symbols and filler words between an analyte name and its value in clinical text,
+# repeated until there are none: an optional parenthesized abbreviation like (LDH),
+# colons, whitespace and a comparator symbol, then optionally one filler word.
+# Eligibility comparators are noise to skip through.
+_FILLERS = (
+    r"\s*(?:"
+    r"(?:\([A-Z]{2,6}\)\s*)?"
+    r"[\s:]*"
+    r"(?:≥|>=|≤|<=|>|<|=)?\s*"
+    r"(?:(?i:count|level|of|is|was|"
     r"at\s+least|greater\s+than(?:\s+or\s+equal\s+to)?|"
     r"less\s+than(?:\s+or\s+equal\s+to)?|"
     r"no\s+greater\s+than|no\s+less\s+than|no\s+more\s+than|"
     r"equal\s+to|above|below|over|under|approximately"
-    r")[\s:]*",
-    re.IGNORECASE,
+    r")[\s:]*)?"
+    r")*"
 )
 
-# Symbols/punctuation between analyte and value
-_FILLER_SYMBOLS = re.compile(
-    r"^(?:\([A-Z]{2,6}\)\s*)?"     # optional parenthesized abbreviation like (LDH)
-    r"[\s:]*"                       # colon, whitespace
-    r"(?:≥|>=|≤|<=|>|<|=)?\s*",    # optional comparator symbol
-)
+# Fillers and value in one match. The fillers are matched inside a lookahead and consumed
+# with a backreference, so they are never backtracked into when no value follows them.
+_SCANNER = re.compile(rf"(?=(?P<fillers>{_FILLERS}))(?P=fillers){VALUE_PATTERN}")
+
+# Characters after an analyte name searched for its value
+_WINDOW = 150
 
 
-def extract_lab_values(text: str) -> List[LabValue]:
+def extract_lab_values(text: str, table: AnalyteTable | None = None) -> List[LabValue]:
     """
     Extract lab values from clinical text.
 
@@ -35,80 +41,87 @@ def extract_lab_values(text: str) -> List[LabValue]:
     patient descriptions.
 
     Returns a list of LabValue objects with analyte name, value(s), unit, and
-    position in the source text.
+    position in the source text. table, if given, is the lab tests to find in place
+    of the built-in ones (LAB_TESTS).
+    """
+    return extract_lab_values_batch([text], table)[0]
+
+
+def extract_lab_values_batch(texts: Iterable[str], table: AnalyteTable | None = None) -> List[List[LabValue]]:
+    """
+    Extract lab values from each of many texts, e.g. the criteria of a trial or the
+    sentences of a patient description, with one lookup of the analyte matcher, that
+    of table if given.
+
+    Returns a list of LabValue lists, one per text, in the order of texts.
+    """
+    if table is None:
+        matcher, lookup = get_analyte_matcher(), get_lab_test
+    else:
+        matcher, lookup = table.matcher, table.get_lab_test
+    batch = []
+    for text in texts:
+        results = []
+        for start, end in matcher.finditer(text):
+            lab_test = lookup(text[start:end])
+            if lab_test is None:
+                continue
+
+            extracted = _extract_value(text, lab_test, start, end)
+            if extracted:
+                results.append(extracted)
+        batch.append(results)
+
+    return batch
+
+
+def _extract_value(text: str, lab_test, match_start: int, match_end: int) -> LabValue | None:
     """
-    results = []
-    for m in ANALYTE_PATTERN.finditer(text):
-        analyte_text = m.group(1)
-        lab_test = get_lab_test(analyte_text)
-        if lab_test is None:
-            continue
-
-        after = text[m.end():m.end() + 150]
-        extracted = _extract_value(after, lab_test, m.start(), m.end(), text)
-        if extracted:
-            results.append(extracted)
-
-    return results
-
-
-def _extract_value(after: str, lab_test, match_start: int, match_end: int, full_text: str) -> LabValue | None:
-    """Try to extract a numeric value (and optional unit) from text following an analyte name."""
-
-    # strip symbols (colon, parens, comparator symbols), then filler words, repeat
-    cleaned = after.strip()
-    changed = True
-    while changed:
-        changed = False
-        result = _FILLER_SYMBOLS.sub("", cleaned).strip()
-        if result != cleaned:
-            cleaned = result
-            changed = True
-        result = _FILLER_WORDS.sub("", cleaned, count=1).strip()
-        if result != cleaned:
-            cleaned = result
-            changed = True
-
-    # handle ULN pattern: "2.5 times upper limit of normal" or "2.5 x ULN"
-    num = parse_number(cleaned)
-    if num is None:
+    Try to extract a numeric value (and optional unit) from the _WINDOW characters of
+    text following an analyte name, scanning by position without copying the window.
+    """
+    # the window without trailing whitespace ends at stop
+    window_end = min(len(text), match_end + _WINDOW)
+    stop = window_end
+    while stop > match_end and text[stop - 1].isspace():
+        stop -= 1
+
+    # skip whitespace, symbols (colon, parens, comparator symbols) and filler words,
+    # then read the value
+    m = _SCANNER.match(text, match_end, stop)
+    if m is None:
         return None
+    pos = m.end("fillers")
+    val = float(m["value"].replace(",", ""))
 
-    val, rest = num
+    # end positions are those of the slicing implementation this replaced, counted back
+    # from the end of the whitespace stripped window
+    trailing = window_end - stop
 
-    # check for ULN — treat the multiplier as the value, unit as "x ULN"
-    uln_match = re.match(
-        r"\s*(?:x\s+|times?\s+)?(?:the\s+)?(?:upper\s+limit\s+of\s+normal|ULN|institutional\s+normal)",
-        rest, re.IGNORECASE,
-    )
-    if uln_match:
-        end_pos = match_end + len(after) - len(cleaned) + len(str(val)) + uln_match.end()
+    # ULN — treat the multiplier as the value, unit as "x ULN"
+    if m["uln"] is not None:
+        end_pos = trailing + pos + len(str(val)) + m.end("uln") - m.end("value")
         return LabValue(
             analyte=lab_test.name, value=val, unit="x ULN",
             start=match_start, end=end_pos,
-            raw_text=full_text[match_start:end_pos].strip(),
+            raw_text=text[match_start:end_pos].strip(),
         )
 
-    # check for range: "9-12" or "9–12"
-    range_match = re.match(r"\s*[-–]\s*", rest)
-    if range_match:
-        rest2 = rest[range_match.end():]
-        num2 = parse_number(rest2)
-        if num2:
-            val2, rest3 = num2
-            unit = parse_unit(rest3) or lab_test.default_unit
-            end_pos = match_end + len(after) - len(rest3)
-            return LabValue(
-                analyte=lab_test.name, value=val, value_high=val2, unit=unit,
-                start=match_start, end=end_pos,
-                raw_text=full_text[match_start:end_pos].strip(),
-            )
+    unit = m["unit"] or lab_test.default_unit
+
+    # range: "9-12" or "9–12"
+    if m["high"] is not None:
+        end_pos = trailing + m.end("high")
+        return LabValue(
+            analyte=lab_test.name, value=val, value_high=float(m["high"].replace(",", "")), unit=unit,
+            start=match_start, end=end_pos,
+            raw_text=text[match_start:end_pos].strip(),
+        )
 
     # single value with optional unit
-    unit = parse_unit(rest) or lab_test.default_unit
-    end_pos = match_end + len(after) - len(rest) + (len(unit) if unit in rest else 0)
+    end_pos = trailing + m.end("value") + (len(unit) if text.find(unit, m.end("value"), stop) >= 0 else 0)
     return LabValue(
         analyte=lab_test.name, value=val, unit=unit,
         start=match_start, end=end_pos,
-        raw_text=full_text[match_start:end_pos].strip(),
+        raw_text=text[match_start:end_pos].strip(),
     )
@@ -0,0 +1,151 @@
+from dataclasses import dataclass
+from typing import Any, Iterable, List, Mapping, Sequence
+
+import numpy as np
+
+from .types import LabValue
+from .patterns import AnalyteTable
+from .reference_ranges import get_lab_test
+from .units import to_canonical
+from .constraints import LabConstraint, extract_lab_constraints
+
+
+@dataclass
+class LabColumns:
+    """The constraints of one analyte, one entry per constraint."""
+    trial: np.ndarray       # int32 position of the trial in LabIndex.trial_ids
+    low: np.ndarray         # float64 closed interval [low, high] of the values satisfying
+    high: np.ndarray        # the constraint, in the canonical unit of the analyte
+    exclude: np.ndarray     # bool, whether it is an exclusion criterion
+
+
+def _closed_bounds(constraint: LabConstraint) -> tuple[float, float]:
+    # strict bounds become the next float inward, so every interval is closed
+    low, high, low_inclusive, high_inclusive = constraint.bounds()
+    if not low_inclusive:
+        low = np.nextafter(low, np.inf)
+    if not high_inclusive:
+        high = np.nextafter(high, -np.inf)
+    return float(low), float(high)
+
+
+class LabIndex:
+    """
+    Columnar index of the lab constraints of many trials, for screening patients by their
+    lab values.
+
+    The constraints of every analyte are held in NumPy arrays (see LabColumns), so checking
+    a patient is one vectorized comparison per analyte of the patient, over all the trials
+    constraining it. A trial is ruled out when a patient value fails one of its inclusion
+    constraints or satisfies one of its exclusion constraints. Analytes the patient has no
+    value for rule nothing out, and each constraint of a criterion is checked on its own,
+    as if the criterion joined them with "and". table is the lab tests the constraints were
+    extracted with (e.g. CTProc.analyte_table), patient values are read with them too.
+    """
+
+    def __init__(self, trial_ids: Sequence[str], columns: dict[str, LabColumns], table: AnalyteTable | None = None) -> None:
+        self.trial_ids = np.asarray(trial_ids, dtype=str)
+        self.columns = columns
+        self.table = table
+
+    def __len__(self) -> int:
+        return len(self.trial_ids)
+
+    @classmethod
+    def from_constraints(
+        cls, trials: Iterable[tuple[str, List[LabConstraint], List[LabConstraint]]], table: AnalyteTable | None = None
+    ) -> "LabIndex":
+        """
+        trials: (trial id, inclusion constraints, exclusion constraints) of each trial.
+                constraints without a threshold (unit not convertible) are left out.
+        """
+        trial_ids = []
+        rows: dict[str, tuple[list, list, list, list]] = {}
+        for i, (trial_id, inc_constraints, exc_constraints) in enumerate(trials):
+            trial_ids.append(trial_id)
+            for exclude, constraints in ((False, inc_constraints), (True, exc_constraints)):
+                for constraint in constraints:
+                    if constraint.threshold is None or (constraint.comparator == "between" and constraint.threshold_high is None):
+                        continue
+                    low, high = _closed_bounds(constraint)
+                    trial, lows, highs, excludes = rows.setdefault(constraint.analyte, ([], [], [], []))
+                    trial.append(i)
+                    lows.append(low)
+                    highs.append(high)
+                    excludes.append(exclude)
+
+        columns = {
+            analyte: LabColumns(
+                trial=np.array(trial, dtype=np.int32), low=np.array(lows, dtype=np.float64),
+                high=np.array(highs, dtype=np.float64), exclude=np.array(excludes, dtype=bool),
+            )
+            for analyte, (trial, lows, highs, excludes) in rows.items()
+        }
+        return cls(trial_ids, columns, table)
+
+    @classmethod
+    def from_docs(cls, docs: Iterable[Any], table: AnalyteTable | None = None) -> "LabIndex":
+        """
+        docs:   processed CTDocuments, their lab values (inc_labs, exc_labs) are used if they
+                were added (CTConfig.add_labs), otherwise extracted from the criteria here
+        table:  the lab tests of the run that processed them (CTProc.analyte_table), so the
+                analytes only the table has get constraints too. None for the built-in ones
+        """
+        def doc_constraints(doc):
+            crit = doc.elig_crit
+            inc_labs = getattr(doc, "inc_labs", None) or [None] * len(crit.include_criteria)
+            exc_labs = getattr(doc, "exc_labs", None) or [None] * len(crit.exclude_criteria)
+            inc = [c for text, labs in zip(crit.include_criteria, inc_labs) for c in extract_lab_constraints(text, labs, table)]
+            exc = [c for text, labs in zip(crit.exclude_criteria, exc_labs) for c in extract_lab_constraints(text, labs, table)]
+            return doc.id, inc, exc
+
+        return cls.from_constraints((doc_constraints(doc) for doc in docs), table)
+
+    def n_constraints(self) -> int:
+        return sum(len(cols.trial) for cols in self.columns.values())
+
+    @staticmethod
+    def patient_values(labs: Mapping[str, float] | Iterable[LabValue], table: AnalyteTable | None = None) -> dict[str, float]:
+        """
+        labs:   a patient's lab values, either LabValues (e.g. from CTTopic.lab_sents) or a map of
+                analyte name or alias to value in the canonical unit of the analyte
+        table:  the lab tests to read the analytes with, None for the built-in ones
+        returns the values by canonical analyte name, leaving out those that cannot be converted
+                to the canonical unit. the last value of an analyte wins
+        """
+        lookup = get_lab_test if table is None else table.get_lab_test
+        values = {}
+        if isinstance(labs, Mapping):
+            for name, value in labs.items():
+                lab_test = lookup(name)
+                if lab_test is not None:
+                    values[lab_test.name] = float(value)
+            return values
+
+        for lab_value in labs:
+            lab_test = lookup(lab_value.analyte)
+            if lab_test is None or lab_value.unit == "x ULN":
+                continue
+            value = to_canonical(lab_test, lab_value.value, lab_value.unit)
+            if value is not None:
+                values[lab_test.name] = value
+        return values
+
+    def ruled_out(self, labs: Mapping[str, float] | Iterable[LabValue]) -> np.ndarray:
+        """Boolean mask over trial_ids of the trials the patient's lab values rule out."""
+        out = np.zeros(len(self.trial_ids), dtype=bool)
+        for analyte, value in self.patient_values(labs, self.table).items():
+            cols = self.columns.get(analyte)
+            if cols is None:
+                continue
+            satisfied = (cols.low <= value) & (value <= cols.high)
+            out[cols.trial[satisfied == cols.exclude]] = True
+        return out
+
+    def screen(self, labs: Mapping[str, float] | Iterable[LabValue]) -> np.ndarray:
+        """Boolean mask over trial_ids of the trials the patient's lab values do not rule out."""
+        return ~self.ruled_out(labs)
+
+    def screen_ids(self, labs: Mapping[str, float] | Iterable[LabValue]) -> np.ndarray:
+        """The ids of the trials the patient's lab values do not rule out, in index order."""
+        return self.trial_ids[self.screen(labs)]
@@ -0,0 +1,89 @@
+import csv
+import dataclasses
+from pathlib import Path
+
+from .types import LabTest
+from .reference_ranges import LAB_TESTS
+from .patterns import AnalyteTable, reset_analyte_matcher
+from .units import reset_unit_factors
+
+# column names read from an analyte table, first found wins; the LOINC ones let an
+# export of the LOINC table be loaded as is
+NAME_COLUMNS = ["name", "COMPONENT"]
+ALIAS_COLUMNS = ["aliases", "SHORTNAME", "LONG_COMMON_NAME", "CONSUMER_NAME"]
+UNIT_COLUMNS = ["unit", "EXAMPLE_UCUM_UNITS", "EXAMPLE_UNITS"]
+ALIAS_SEP = "|"
+
+
+def _first(row: dict[str, str], columns: list[str]) -> str:
+    for column in columns:
+        if row.get(column):
+            return row[column].strip()
+    return ""
+
+
+def load_analyte_table(path: str | Path, delimiter: str | None = None, lab_tests: dict[str, LabTest] | None = None) -> int:
+    """
+    Load analytes from a CSV or TSV table with a header row into LAB_TESTS, and have the
+    analyte matcher rebuilt with them. With lab_tests, they are loaded into that dict
+    instead and LAB_TESTS is left as it is.
+
+    Columns: name (or COMPONENT), aliases separated by "|" (and/or any of SHORTNAME,
+    LONG_COMMON_NAME, CONSUMER_NAME) and unit (or EXAMPLE_UCUM_UNITS, EXAMPLE_UNITS),
+    used as the default unit. A row naming a known lab test adds its other names to that
+    test as aliases, so the curated tests and their reference ranges are kept.
+
+    Returns the number of lab tests added.
+    """
+    path = Path(path)
+    if delimiter is None:
+        delimiter = "\t" if path.suffix in (".tsv", ".txt") else ","
+    scoped = lab_tests is not None
+    if not scoped:
+        lab_tests = LAB_TESTS
+
+    n_added = 0
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f, delimiter=delimiter):
+            name = _first(row, NAME_COLUMNS)
+            if not name:
+                continue
+            aliases = [a.strip() for a in (row.get("aliases") or "").split(ALIAS_SEP) if a.strip()]
+            aliases += [row[c].strip() for c in ALIAS_COLUMNS[1:] if row.get(c)]
+            names = [name] + [a for a in dict.fromkeys(aliases) if a.lower() != name.lower()]
+
+            lab_test = next((lab_tests[n.lower()] for n in names if n.lower() in lab_tests), None)
+            if lab_test is None:
+                lab_test = LabTest(name=name, default_unit=_first(row, UNIT_COLUMNS))
+                lab_tests[name.lower()] = lab_test
+                n_added += 1
+            elif scoped and any(lt is lab_test for lt in LAB_TESTS.values()):
+                lab_test = _own_copy(lab_tests, lab_test)
+            for alias in names:
+                if alias.lower() not in lab_tests:
+                    lab_tests[alias.lower()] = lab_test
+                    lab_test.aliases.append(alias)
+
+    if not scoped:
+        reset_analyte_matcher()
+        reset_unit_factors()
+    return n_added
+
+
+def read_analyte_table(path: str | Path, delimiter: str | None = None) -> AnalyteTable:
+    """
+    The built-in lab tests and those of the table at path (see load_analyte_table), for
+    one caller, e.g. a CTProc: LAB_TESTS and the lab tests in it are not changed.
+    """
+    lab_tests = dict(LAB_TESTS)
+    load_analyte_table(path, delimiter, lab_tests=lab_tests)
+    return AnalyteTable(lab_tests)
+
+
+def _own_copy(lab_tests: dict[str, LabTest], lab_test: LabTest) -> LabTest:
+    # a built-in lab test gets its aliases added to a copy, under all of its names
+    copy = dataclasses.replace(lab_test, aliases=list(lab_test.aliases))
+    for key, lt in lab_tests.items():
+        if lt is lab_test:
+            lab_tests[key] = copy
+    return copy
@@ -0,0 +1,102 @@
+import re
+from typing import Iterable, Iterator
+
+# Characters re.IGNORECASE treats as equal beyond simple lowercasing (re._casefix),
+# the first of each group is the one they fold to.
+_CASE_GROUPS = [
+    "i\u0131", "s\u017f", "\u03bc\u00b5", "\u03b9\u0345\u1fbe", "\u0390\u1fd3", "\u03b0\u1fe3",
+    "\u03b2\u03d0", "\u03b5\u03f5", "\u03b8\u03d1", "\u03ba\u03f0", "\u03c0\u03d6", "\u03c1\u03f1",
+    "\u03c3\u03c2", "\u03c6\u03d5", "\u0432\u1c80", "\u0434\u1c81", "\u043e\u1c82", "\u0441\u1c83",
+    "\u0442\u1c84\u1c85", "\u044a\u1c86", "\u0463\u1c87", "\ua64b\u1c88", "\u1e61\u1e9b", "\ufb06\ufb05",
+]
+_FOLD_GROUPS = str.maketrans({ch: group[0] for group in _CASE_GROUPS for ch in group[1:]})
+_FOLD_GROUP_CHARS = re.compile("[" + "".join(group[1:] for group in _CASE_GROUPS) + "]")
+
+# str.lower() maps every character to one character except U+0130 (dotted I), which re lowercases to "i"
+_FOLD_DOTTED_I = str.maketrans({"\u0130": "i"})
+
+_ASCII_LETTERS = frozenset("abcdefghijklmnopqrstuvwxyz")
+_END = ""   # trie key marking the end of a name, never a character
+
+
+def fold_case(text: str) -> str:
+    """
+    Case fold text the way re.IGNORECASE compares characters: two characters match
+    case-insensitively iff they fold to the same character. Keeps the length of text,
+    so positions in the folded text are positions in text.
+    """
+    # str.translate() is slow, only run when there is something to translate
+    if text.isascii():
+        return text.lower()
+    if "\u0130" in text:
+        text = text.translate(_FOLD_DOTTED_I)
+    folded = text.lower()
+    if _FOLD_GROUP_CHARS.search(folded) is not None:
+        folded = folded.translate(_FOLD_GROUPS)
+    return folded
+
+
+class AnalyteMatcher:
+    """
+    Finds lab test names and aliases in text, with the same results as finditer of
+
+        (?<![a-zA-Z])(name1|name2|...)(?![a-zA-Z])    names longest first, re.IGNORECASE
+
+    i.e. scanning left to right, the longest name at each position that is not inside
+    a word, continuing after it.
+
+    Names are kept in a character trie over case folded text, and only positions that
+    can start a name are tried, so the time to match grows with the length of the
+    names found rather than with the number of names.
+    """
+
+    def __init__(self, names: Iterable[str]) -> None:
+        self.trie: dict = {}
+        self.n_names = 0
+        for name in names:
+            key = fold_case(name)
+            if not key:
+                continue
+            node = self.trie
+            for ch in key:
+                node = node.setdefault(ch, {})
+            if _END not in node:
+                node[_END] = True
+                self.n_names += 1
+
+        # a name starts where its first two characters are, not preceded by a letter
+        prefixes = []
+        for ch, node in sorted(self.trie.items()):
+            if _END in node:
+                prefixes.append(re.escape(ch))
+            else:
+                prefixes.append(re.escape(ch) + "[" + "".join(re.escape(c) for c in sorted(node)) + "]")
+        self._starts = re.compile(rf"(?<![a-z])(?:{'|'.join(prefixes)})") if prefixes else None
+
+    def __len__(self) -> int:
+        return self.n_names
+
+    def finditer(self, text: str) -> Iterator[tuple[int, int]]:
+        """Yield the (start, end) span of every name found in text."""
+        if self._starts is None:
+            return
+        folded = fold_case(text)
+        n = len(folded)
+        search = self._starts.search
+        m = search(folded)
+        while m is not None:
+            start = end = m.start()
+            node = self.trie
+            i = start
+            while i < n:
+                node = node.get(folded[i])
+                if node is None:
+                    break
+                i += 1
+                if _END in node and (i == n or folded[i] not in _ASCII_LETTERS):
+                    end = i
+            if end > start:
+                yield start, end
+                m = search(folded, end)
+            else:
+                m = search(folded, start + 1)
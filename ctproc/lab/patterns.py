@@ -1,35 +1,103 @@
+import os
 import re
+from .matcher import AnalyteMatcher
 from .reference_ranges import LAB_TESTS
+from .types import LabTest
+
+# path of an analyte table (see loader.load_analyte_table) loaded before the matcher is first built
+ANALYTE_TABLE_ENV = "CTPROC_ANALYTE_TABLE"
 
 # Numeric value: handles "1.5", "100,000", "1,500", "3500"
 NUMBER_PATTERN = r"(\d[\d,]*\.?\d*)"
 
 # Units that appear in clinical text
-UNIT_PATTERN = (
-    r"(?:\s*"
+UNIT_ALTERNATIVES = (
     r"(?:g/[dD][lL]|mg/[dD][lL]|mg/dL|mL/min|IU/L|U/L|mIU/L|mU/L|"
     r"ng/mL|ng/dL|pg/mL|μg/L|μg/dL|µg/L|µg/dL|"
     r"mmol/L|μmol/L|µmol/L|nmol/L|pmol/L|mEq/L|"
     r"x\s*10[\^]?\d+/[Ll]|/mm3|/mm\^3|/μL|/µL|"
     r"mm/h|mm\s*Hg|mmHg|sec|fL|EU|%)"
-    r")?"
 )
+UNIT_PATTERN = rf"(?:\s*{UNIT_ALTERNATIVES})?"
 
+# Multiple of the upper limit of normal: "2.5 times upper limit of normal", "2.5 x ULN"
+ULN_PATTERN = r"\s*(?:x\s+|times?\s+)?(?:the\s+)?(?:upper\s+limit\s+of\s+normal|ULN|institutional\s+normal)"
 
-def _build_analyte_pattern() -> re.Pattern:
-    """Build a compiled regex that matches any known lab test name or alias."""
+# A value: the number, then either a ULN multiple or the high end of a range ("9-12",
+# "9–12"), then the unit. Only the ULN part ignores case.
+VALUE_PATTERN = (
+    rf"\s*(?P<value>\d[\d,]*\.?\d*)"
+    rf"(?:(?P<uln>(?i:{ULN_PATTERN}))|\s*[-–]\s*(?P<high>\d[\d,]*\.?\d*))?"
+    rf"\s*(?P<unit>{UNIT_ALTERNATIVES})?"
+)
+
+
+def _analyte_names(lab_tests: dict[str, LabTest] = LAB_TESTS) -> set[str]:
     names = set()
-    for lt in LAB_TESTS.values():
-        names.add(re.escape(lt.name))
-        for alias in lt.aliases:
-            names.add(re.escape(alias))
+    for lt in lab_tests.values():
+        names.add(lt.name)
+        names.update(lt.aliases)
+    return names
+
+
+def _build_analyte_pattern() -> re.Pattern:
+    """
+    Build a compiled regex that matches any known lab test name or alias. The analyte
+    matcher finds the same spans, this is what it is checked against.
+    """
+    names = {re.escape(name) for name in _analyte_names()}
     # sort longest first so "Hemoglobin A1c" matches before "Hemoglobin"
     sorted_names = sorted(names, key=len, reverse=True)
     pattern = "|".join(sorted_names)
     return re.compile(rf"(?<![a-zA-Z])({pattern})(?![a-zA-Z])", re.IGNORECASE)
 
 
-ANALYTE_PATTERN = _build_analyte_pattern()
+_analyte_matcher: AnalyteMatcher | None = None
+_env_table_loaded = False
+
+
+def get_analyte_matcher() -> AnalyteMatcher:
+    """
+    The matcher of every known lab test name and alias, built on first use. The analyte
+    table at $CTPROC_ANALYTE_TABLE, if set, is loaded first.
+    """
+    global _analyte_matcher, _env_table_loaded
+    if not _env_table_loaded:
+        _env_table_loaded = True
+        table_path = os.environ.get(ANALYTE_TABLE_ENV)
+        if table_path:
+            from .loader import load_analyte_table
+            load_analyte_table(table_path)
+    if _analyte_matcher is None:
+        _analyte_matcher = AnalyteMatcher(_analyte_names())
+    return _analyte_matcher
+
+
+def reset_analyte_matcher() -> None:
+    """Drop the matcher, so the next get_analyte_matcher() picks up changes to LAB_TESTS."""
+    global _analyte_matcher
+    _analyte_matcher = None
+
+
+class AnalyteTable:
+    """
+    Lab tests by lowercase name and alias, e.g. the built-in ones and those of a table (see
+    loader.read_analyte_table), with the matcher of their names built on first use. Held by
+    whoever loaded it, so LAB_TESTS and the shared matcher are left as they are.
+    """
+
+    def __init__(self, lab_tests: dict[str, LabTest]) -> None:
+        self.lab_tests = lab_tests
+        self._matcher: AnalyteMatcher | None = None
+
+    def get_lab_test(self, name: str) -> LabTest | None:
+        return self.lab_tests.get(name.lower())
+
+    @property
+    def matcher(self) -> AnalyteMatcher:
+        if self._matcher is None:
+            self._matcher = AnalyteMatcher(_analyte_names(self.lab_tests))
+        return self._matcher
 
 
 def parse_number(text: str) -> tuple[float, str] | None:
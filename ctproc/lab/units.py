@@ -0,0 +1,259 @@
+import re
+from typing import TYPE_CHECKING, Sequence
+
+from .types import LabTest, ReferenceRange
+from .reference_ranges import get_lab_test
+
+if TYPE_CHECKING:
+    import numpy as np   # the batch functions import it when called, the rest never needs it
+
+# Every unit is a scale of the base unit of its kind: g/L for mass concentrations, mol/L
+# for molar ones, Eq/L for equivalents, cells/L for counts, U/L for enzyme activity, and
+# a fraction (1 = 100%). Units of one kind convert by the ratio of their scales, mass and
+# molar units through the molar mass of the analyte, equivalents through its valence.
+UNIT_SCALES: dict[str, tuple[str, float]] = {
+    "g/l": ("mass", 1.), "g/dl": ("mass", 10.), "mg/ml": ("mass", 1.), "mg/dl": ("mass", 1e-2),
+    "mg/l": ("mass", 1e-3), "μg/ml": ("mass", 1e-3), "μg/dl": ("mass", 1e-5), "μg/l": ("mass", 1e-6),
+    "ng/ml": ("mass", 1e-6), "ng/dl": ("mass", 1e-8), "ng/l": ("mass", 1e-9), "pg/ml": ("mass", 1e-9),
+    "mol/l": ("molar", 1.), "mmol/l": ("molar", 1e-3), "μmol/l": ("molar", 1e-6), "nmol/l": ("molar", 1e-9),
+    "pmol/l": ("molar", 1e-12),
+    "eq/l": ("equivalent", 1.), "meq/l": ("equivalent", 1e-3),
+    "/l": ("count", 1.), "x10^9/l": ("count", 1e9), "x10^12/l": ("count", 1e12), "x10^3/μl": ("count", 1e9),
+    "x10^6/μl": ("count", 1e12), "x10^9/μl": ("count", 1e15), "/mm3": ("count", 1e6),
+    "u/l": ("activity", 1.), "ku/l": ("activity", 1e3), "mu/l": ("activity", 1e-3), "μu/ml": ("activity", 1e-3),
+    "mu/ml": ("activity", 1.), "u/ml": ("activity", 1e3),
+    "%": ("fraction", 1e-2), "": ("fraction", 1.), "l/l": ("fraction", 1.),
+    "sec": ("time", 1.), "min": ("time", 60.),
+    "mmhg": ("pressure", 1.), "kpa": ("pressure", 7.50062),
+    "mm/h": ("rate", 1.),
+}
+
+# g/mol, for converting between mass and molar units (phosphate as phosphorus, BUN as
+# nitrogen, lipids as cholesterol and triolein, PTH as the 1-84 peptide)
+MOLAR_MASS: dict[str, float] = {
+    "Bilirubin": 584.66, "Direct bilirubin": 584.66, "Creatinine": 113.12, "BUN": 28.014,
+    "Sodium": 22.990, "Potassium": 39.098, "Calcium": 40.078, "Phosphate": 30.974, "Magnesium": 24.305,
+    "Chloride": 35.45, "Bicarbonate": 61.017, "Glucose": 180.16, "Cholesterol": 386.65, "LDL": 386.65,
+    "HDL": 386.65, "Triglycerides": 885.7, "Uric acid": 168.11, "Free T4": 776.87, "Iron": 55.845,
+    "TIBC": 55.845, "PTH": 9425.,
+}
+# charge of the ion, for converting between molar units and equivalents
+VALENCE: dict[str, int] = {
+    "Sodium": 1, "Potassium": 1, "Chloride": 1, "Bicarbonate": 1, "Calcium": 2, "Magnesium": 2,
+}
+
+# spellings of units, as keys of UNIT_SCALES
+_UNIT_SYNONYMS = {
+    "/mm^3": "/mm3", "/cumm": "/mm3", "cells/mm3": "/mm3", "cells/μl": "/mm3", "/μl": "/mm3",
+    "x10^3/mm3": "x10^3/μl", "k/μl": "x10^3/μl", "10^3/μl": "x10^3/μl", "10^9/l": "x10^9/l",
+    "10^12/l": "x10^12/l", "x10^6/mm3": "x10^6/μl",
+    "iu/l": "u/l", "miu/l": "mu/l", "μiu/ml": "μu/ml", "miu/ml": "mu/ml", "iu/ml": "u/ml",
+    "mg%": "mg/dl", "s": "sec", "seconds": "sec", "mm/hr": "mm/h",
+}
+_SUPERSCRIPTS = str.maketrans("⁰¹²³⁴⁵⁶⁷⁸⁹", "0123456789")
+_POWER = re.compile(r"10(?:e|\*\*|\^)(?=\d+/)|(?<=x)10(?=\d+/)")
+_MICRO = re.compile(r"^(?:mc|u)(?=g/|mol/|iu/|u/)|(?<=/)u(?=l$)")
+
+# unknown: no value, unit or range to compare with
+LOW, NORMAL, HIGH, UNKNOWN = -1, 0, 1, 2
+
+# demographic names, as keys of LabTest.demographic_ranges
+DEMOGRAPHICS = {
+    "male": "males", "males": "males", "m": "males", "man": "males", "men": "males", "boy": "males",
+    "female": "females", "females": "females", "f": "females", "woman": "females", "women": "females",
+    "girl": "females", "child": "children", "children": "children", "newborn": "newborn",
+}
+
+
+def unit_key(unit: str) -> str:
+    """unit as a key of UNIT_SCALES: one spelling per unit, lowercase, without spaces."""
+    if unit == "G/L":   # giga per liter, not grams
+        return "x10^9/l"
+    key = unit.replace(" ", "").replace("µ", "μ").replace("×", "x").translate(_SUPERSCRIPTS)
+    key = _MICRO.sub("μ", _POWER.sub("10^", key.lower()))
+    return _UNIT_SYNONYMS.get(key, key)
+
+
+def canonical_unit(lab_test: LabTest) -> str:
+    """The unit lab values of lab_test are compared in: its conventional unit, if it has ranges."""
+    if lab_test.conventional_range is not None:
+        return lab_test.conventional_range.unit
+    if lab_test.si_range is not None:
+        return lab_test.si_range.unit
+    return lab_test.default_unit
+
+
+def _to_mol(kind: str, analyte: str) -> float | None:
+    # factor from the base unit of kind to mol/L
+    if kind == "molar":
+        return 1.
+    if kind == "mass" and analyte in MOLAR_MASS:
+        return 1. / MOLAR_MASS[analyte]
+    if kind == "equivalent" and analyte in VALENCE:
+        return 1. / VALENCE[analyte]
+    return None
+
+
+def _range_factor(lab_test: LabTest) -> float | None:
+    # conventional / SI, from the ends of the two ranges, for analytes of unknown molar mass
+    si, conv = lab_test.si_range, lab_test.conventional_range
+    if si is None or conv is None:
+        return None
+    for si_end, conv_end in ((si.high, conv.high), (si.low, conv.low)):
+        if si_end and conv_end:
+            return conv_end / si_end
+    return None
+
+
+def _factor(lab_test: LabTest, key: str, canonical: str) -> float | None:
+    if key == canonical:
+        return 1.
+    if key in UNIT_SCALES and canonical in UNIT_SCALES:
+        (kind, scale), (canonical_kind, canonical_scale) = UNIT_SCALES[key], UNIT_SCALES[canonical]
+        if kind == canonical_kind:
+            return scale / canonical_scale
+        to_mol, from_mol = _to_mol(kind, lab_test.name), _to_mol(canonical_kind, lab_test.name)
+        if to_mol is not None and from_mol is not None:
+            return scale * to_mol / from_mol / canonical_scale
+    if lab_test.si_range is not None and key == unit_key(lab_test.si_range.unit):
+        return _range_factor(lab_test)
+    return None
+
+
+_unit_factors: dict[str, dict[str, float]] = {}
+
+
+def unit_factors(lab_test: LabTest) -> dict[str, float]:
+    """
+    Factor from every unit lab_test can be converted from (by unit_key()) to its canonical unit,
+    computed on first use of the analyte.
+    """
+    factors = _unit_factors.get(lab_test.name)
+    if factors is None:
+        canonical = unit_key(canonical_unit(lab_test))
+        keys = set(UNIT_SCALES) | {unit_key(r.unit) for r in (lab_test.si_range, lab_test.conventional_range) if r}
+        keys.add(unit_key(lab_test.default_unit))
+        factors = {}
+        for key in keys:
+            factor = _factor(lab_test, key, canonical)
+            if factor is not None:
+                factors[key] = factor
+        _unit_factors[lab_test.name] = factors
+    return factors
+
+
+def reset_unit_factors() -> None:
+    """Drop the factor tables, so they are recomputed after changes to LAB_TESTS."""
+    _unit_factors.clear()
+
+
+def to_canonical(lab_test: LabTest, value: float, unit: str) -> float | None:
+    """value in unit (the default unit of lab_test if empty) in the canonical unit, None if unknown."""
+    factor = unit_factors(lab_test).get(unit_key(unit or lab_test.default_unit))
+    return None if factor is None else value * factor
+
+
+def reference_range(lab_test: LabTest, demographic: str | None = None) -> tuple[float, float] | None:
+    """
+    The normal range of lab_test in its canonical unit, for the demographic (e.g. "male",
+    "children") if it has one, missing ends open. None if lab_test has no range.
+    """
+    ref: ReferenceRange | None = None
+    if demographic:
+        ref = lab_test.demographic_ranges.get(DEMOGRAPHICS.get(demographic.lower(), demographic.lower()))
+    if ref is None:
+        ref = lab_test.conventional_range or lab_test.si_range
+    if ref is None:
+        return None
+    # the unit of a range is never left out, "" is a fraction (e.g. SI hematocrit)
+    factor = unit_factors(lab_test).get(unit_key(ref.unit))
+    if factor is None:
+        return None
+    low = -float("inf") if ref.low is None else ref.low * factor
+    high = float("inf") if ref.high is None else ref.high * factor
+    return low, high
+
+
+def _factorize(items: Sequence) -> tuple[list, "np.ndarray"]:
+    # the distinct items, and the position of each item among them
+    import numpy as np
+    distinct = list(dict.fromkeys(items))
+    code_of = {item: i for i, item in enumerate(distinct)}
+    return distinct, np.fromiter(map(code_of.__getitem__, items), dtype=np.int64, count=len(items))
+
+
+def _lookup(analyte_names: list[str], column_names: list, cell) -> "np.ndarray":
+    # cell(lab_test, column name) -> float for each known analyte, NaN elsewhere
+    import numpy as np
+    table = np.full((len(analyte_names), len(column_names)), np.nan)
+    for i, name in enumerate(analyte_names):
+        lab_test = get_lab_test(name)
+        if lab_test is None:
+            continue
+        for j, column in enumerate(column_names):
+            table[i, j] = cell(lab_test, column)
+    return table
+
+
+def _unit_factor_or_nan(lab_test: LabTest, unit: str) -> float:
+    return unit_factors(lab_test).get(unit_key(unit or lab_test.default_unit), float("nan"))
+
+
+def _range_end(lab_test: LabTest, demographic: str | None, end: int) -> float:
+    bounds = reference_range(lab_test, demographic)
+    return float("nan") if bounds is None else bounds[end]
+
+
+def normalize_values(analytes: Sequence[str], values: Sequence[float], units: Sequence[str]) -> "np.ndarray":
+    """
+    Values of analytes (names or aliases) in units, converted to the canonical unit of their
+    analyte, NaN where the analyte or unit is unknown. The conversion factor of each distinct
+    (analyte, unit) is looked up once, the values are converted in one array operation.
+    """
+    analyte_names, analyte_codes = _factorize(analytes)
+    return _normalize(analyte_names, analyte_codes, values, units)
+
+
+def _normalize(analyte_names: list[str], analyte_codes: "np.ndarray", values: Sequence[float], units: Sequence[str]) -> "np.ndarray":
+    import numpy as np
+    values = np.asarray(values, dtype=np.float64)
+    unit_names, unit_codes = _factorize(units)
+    factors = _lookup(analyte_names, unit_names, _unit_factor_or_nan)
+    if len(values) == 0:
+        return values.copy()
+    return values * factors[analyte_codes, unit_codes]
+
+
+def evaluate_values(
+    analytes: Sequence[str],
+    values: Sequence[float],
+    units: Sequence[str],
+    demographics: Sequence[str | None] | None = None,
+) -> tuple["np.ndarray", "np.ndarray"]:
+    """
+    demographics:   per value, e.g. the gender of the patient ("Male", "female") or "children",
+                    None (or no demographics at all) for the general range
+    returns:        normalize_values(), and the flag of each value against the reference range
+                    of its analyte (and demographic): LOW, NORMAL, HIGH, or UNKNOWN for values
+                    that could not be normalized and analytes without a range, as int8
+    """
+    import numpy as np
+    analyte_names, analyte_codes = _factorize(analytes)
+    normalized = _normalize(analyte_names, analyte_codes, values, units)
+    flags = np.full(len(normalized), UNKNOWN, dtype=np.int8)
+    if len(normalized) == 0:
+        return normalized, flags
+
+    if demographics is None:
+        demographic_names, demographic_codes = [None], np.zeros(len(normalized), dtype=np.int64)
+    else:
+        demographic_names, demographic_codes = _factorize(demographics)
+    lows = _lookup(analyte_names, demographic_names, lambda lab_test, demographic: _range_end(lab_test, demographic, 0))
+    highs = _lookup(analyte_names, demographic_names, lambda lab_test, demographic: _range_end(lab_test, demographic, 1))
+
+    low, high = lows[analyte_codes, demographic_codes], highs[analyte_codes, demographic_codes]
+    known = ~(np.isnan(normalized) | np.isnan(low))
+    flags[known] = NORMAL
+    flags[known & (normalized < low)] = LOW
+    flags[known & (normalized > high)] = HIGH
+    return normalized, flags
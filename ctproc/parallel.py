@@ -0,0 +1,154 @@
+# ----------------------------------------------------------------------------------------------- #
+# helpers for sharding the members of a clinical trials zip file across a pool of processes
+# ----------------------------------------------------------------------------------------------- #
+
+
+import logging
+
+from multiprocessing.util import Finalize
+from zipfile import ZipFile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Generator, List, Optional, Sequence, Tuple
+
+from .ctconfig import CTConfig
+from .instrument import StageStats
+
+logger = logging.getLogger(__file__)
+
+
+# per-process state, set once by the pool initializer so the pipeline (and the zip handle)
+# are built a single time per worker rather than once per shard
+_WORKER_PROC = None
+_WORKER_ZIP: Optional[ZipFile] = None
+
+
+
+def shard_members(ct_files: Sequence[str], shard_size: int) -> List[List[str]]:
+    """
+    ct_files:     zip member names, already filtered by DocChecker.iter_check
+    shard_size:   max number of members per shard
+    desc:         splits the member list into contiguous shards, preserving zip order
+    """
+    shard_size = max(1, shard_size)
+    return [list(ct_files[i:i + shard_size]) for i in range(0, len(ct_files), shard_size)]
+
+
+
+def _init_doc_worker(config: CTConfig) -> None:
+    global _WORKER_PROC, _WORKER_ZIP
+    from .proc import CTProc   # deferred, proc imports this module
+
+    _WORKER_PROC = CTProc(config._replace(workers=1))
+    _WORKER_ZIP = ZipFile(config.data_path, 'r')
+    cache = _worker_ent_cache()
+    if cache is not None:
+        # pool workers exit without running atexit handlers, multiprocessing runs its finalizers
+        Finalize(cache, cache.close, exitpriority=10)
+
+
+
+def _worker_ent_cache() -> Any:
+    nlp_tools = _WORKER_PROC.nlp_tools
+    return None if nlp_tools is None else nlp_tools.ent_cache
+
+
+
+def _process_doc_shard(ct_files: List[str]) -> Tuple[int, List[Any], StageStats, List[Dict[str, float]], Tuple[int, int]]:
+    """
+    desc:       runs build_docs() over one shard inside a worker process
+    returns:    number of members consumed, the processed docs, stripped of their
+                (unpicklable) nlp_tools so they can be sent back to the parent, the
+                worker's instrumentation for the shard (empty if it is off), and the entity
+                cache hits and misses of the shard, which are written to the cache before
+                it returns
+    """
+    instrument = _WORKER_PROC.instrument
+    cache = _worker_ent_cache()
+    hits, misses = (0, 0) if cache is None else (cache.hits, cache.misses)
+    docs = list(_WORKER_PROC.build_docs(ct_files, _WORKER_ZIP))
+    doc_times = []
+    for doc in docs:
+        doc.nlp_tools = None
+        doc_times.append(instrument.pop_doc_times(doc))
+    cache_counts = (0, 0)
+    if cache is not None:
+        cache.sync()
+        cache_counts = (cache.hits - hits, cache.misses - misses)
+    return len(ct_files), docs, instrument.reset(), doc_times, cache_counts
+
+
+
+def imap_shards(
+    func: Callable,
+    shards: Sequence[Any],
+    workers: int,
+    initializer: Optional[Callable] = None,
+    initargs: Tuple = (),
+    preserve_order: bool = True,
+    max_pending: Optional[int] = None,
+) -> Generator[Any, None, None]:
+    """
+    func:             picklable, module level function applied to each shard in a worker
+    shards:           sequence of shard arguments
+    workers:          number of worker processes
+    preserve_order:   if True, results are held in a reorder buffer and yielded in shard order,
+                      otherwise they are yielded in completion order
+    max_pending:      bound on the shards submitted or buffered at once, defaults to 2 * workers,
+                      keeps memory flat when one slow shard holds up the reorder buffer
+    desc:             lazily maps func over shards with a process pool
+    """
+    max_pending = max(1, max_pending or 2 * workers)
+    shard_iter = iter(enumerate(shards))
+    pending: Dict[Any, int] = {}
+    reorder: Dict[int, Any] = {}
+    next_idx = 0
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs)
+    try:
+        def fill() -> None:
+            while len(pending) + len(reorder) < max_pending:
+                nxt = next(shard_iter, None)
+                if nxt is None:
+                    return
+                idx, shard = nxt
+                pending[pool.submit(func, shard)] = idx
+
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                idx = pending.pop(fut)
+                if preserve_order:
+                    reorder[idx] = fut.result()
+                else:
+                    yield fut.result()
+
+            while next_idx in reorder:
+                yield reorder.pop(next_idx)
+                next_idx += 1
+
+            fill()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+
+def map_doc_shards(
+    config: CTConfig, 
+    ct_files: Sequence[str]
+) -> Generator[Tuple[int, List[Any], StageStats, List[Dict[str, float]], Tuple[int, int]], None, None]:
+    """
+    desc:       shards ct_files and processes them across config.workers processes
+    returns:    yields (number of members consumed, processed docs, stage stats, per doc timings,
+                entity cache hits and misses) per shard
+    """
+    shards = shard_members(ct_files, config.shard_size)
+    logger.info(f"processing {len(ct_files)} members in {len(shards)} shards across {config.workers} workers")
+    yield from imap_shards(
+        _process_doc_shard,
+        shards,
+        workers=config.workers,
+        initializer=_init_doc_worker,
+        initargs=(config,),
+        preserve_order=config.preserve_order,
+    )
@@ -0,0 +1,133 @@
+# ----------------------------------------------------------------------------------------------- #
+# age and gender prefilter of processed trials, for many topics at once
+# ----------------------------------------------------------------------------------------------- #
+
+
+import logging
+import numpy as np
+from scipy import sparse
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from .index_utils import get_field
+
+logger = logging.getLogger(__file__)
+
+
+# gender codes, a trial of gender ALL takes topics of any gender, and a topic of gender ALL
+# (unknown) is taken by trials of any gender
+ALL, MALE, FEMALE = 0, 1, 2
+GENDER_CODES = {'all': ALL, 'both': ALL, 'male': MALE, 'female': FEMALE}
+
+
+
+def gender_code(gender: Optional[str]) -> int:
+    if gender is None:
+        return ALL
+    return GENDER_CODES.get(gender.strip().lower(), ALL)
+
+
+
+class DemographicIndex:
+    """
+    trial_ids:  ids of the trials, in index order
+    min_ages:   elig_min_age of each trial, in years
+    max_ages:   elig_max_age of each trial, in years
+    genders:    elig_gender of each trial, "All", "Male" or "Female"
+    desc:       the age and gender eligibility of many trials, queried for many topics at once.
+                trials are kept sorted by minimum age, so the trials a topic's age can pass are
+                a prefix of them, found with a binary search, and only that prefix is checked
+                against the maximum ages. which trials take each gender is a bitset. topics of
+                the same age and gender share one lookup
+    """
+    def __init__(self, trial_ids: Sequence[str], min_ages: Sequence[float], max_ages: Sequence[float], genders: Sequence[str]) -> None:
+        self.trial_ids = np.asarray(trial_ids, dtype=object)   # the id strings themselves, not copies, are indexed out
+        min_ages = np.asarray(min_ages, dtype=np.float64)
+        max_ages = np.asarray(max_ages, dtype=np.float64)
+        codes = np.fromiter((gender_code(gender) for gender in genders), dtype=np.int8, count=len(self.trial_ids))
+
+        self.by_min_age = np.argsort(min_ages, kind='stable').astype(np.int32)
+        self.sorted_min_ages = min_ages[self.by_min_age]
+        self.max_ages_by_min_age = max_ages[self.by_min_age]
+
+        # takes_gender[g]: packed bits over trial positions, whether the trial takes topics of gender g
+        self.takes_gender = np.stack([
+            np.packbits(np.ones(len(codes), dtype=bool)),
+            np.packbits((codes == ALL) | (codes == MALE)),
+            np.packbits((codes == ALL) | (codes == FEMALE)),
+        ])
+
+
+    def __len__(self) -> int:
+        return len(self.trial_ids)
+
+
+    @classmethod
+    def from_docs(cls, docs: Iterable[Any]) -> "DemographicIndex":
+        """
+        docs:       processed CTDocuments, or their dicts (see utils.get_processed_data())
+        """
+        ids, min_ages, max_ages, genders = [], [], [], []
+        for doc in docs:
+            ids.append(get_field(doc, 'id'))
+            min_ages.append(get_field(doc, 'elig_min_age'))
+            max_ages.append(get_field(doc, 'elig_max_age'))
+            genders.append(get_field(doc, 'elig_gender'))
+        return cls(ids, min_ages, max_ages, genders)
+
+
+    def candidates(self, age: Optional[float], gender: Optional[str] = None) -> np.ndarray:
+        """
+        age:        of the topic in years, None (or NaN) to skip the age check
+        returns:    sorted positions of the trials the topic is eligible for by age and gender
+        """
+        n_trials = len(self.trial_ids)
+        eligible = np.unpackbits(self.takes_gender[gender_code(gender)], count=n_trials).view(bool)
+        if age is not None and not np.isnan(age):
+            n_started = int(np.searchsorted(self.sorted_min_ages, age, side='right'))
+            in_age = np.zeros(n_trials, dtype=bool)
+            in_age[self.by_min_age[:n_started][self.max_ages_by_min_age[:n_started] >= age]] = True
+            eligible &= in_age
+        return np.flatnonzero(eligible).astype(np.int32)
+
+
+    def _rows(self, ages: Sequence[Optional[float]], genders: Optional[Sequence[Optional[str]]]) -> List[np.ndarray]:
+        # candidates() of each topic, one lookup (and one array) per distinct (age, gender)
+        if genders is None:
+            genders = [None] * len(ages)
+        found: Dict[tuple, np.ndarray] = {}
+        rows = []
+        for age, gender in zip(ages, genders):
+            key = (None if age is None or np.isnan(age) else float(age), gender_code(gender))
+            if key not in found:
+                found[key] = self.candidates(key[0], gender)
+            rows.append(found[key])
+        return rows
+
+
+    def query(self, ages: Sequence[Optional[float]], genders: Optional[Sequence[Optional[str]]] = None) -> sparse.csr_matrix:
+        """
+        ages:       of each topic, see candidates()
+        genders:    of each topic, None for all unknown
+        returns:    topics x trials boolean matrix, true where the topic is eligible for the trial
+        """
+        rows = self._rows(ages, genders)
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in rows], out=indptr[1:])
+        indices = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+        data = np.ones(len(indices), dtype=bool)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(rows), len(self.trial_ids)))
+
+
+    def query_topics(self, topics: Iterable[Any]) -> Dict[str, np.ndarray]:
+        """
+        topics:     processed CTTopics, or their dicts
+        returns:    topic id -> ids of the trials it is eligible for by age and gender, in index order.
+                    topics of the same age and gender share one array
+        """
+        topics = list(topics)
+        rows = self._rows([get_field(topic, 'age') for topic in topics], [get_field(topic, 'gender') for topic in topics])
+        ids: Dict[int, np.ndarray] = {}
+        for row in rows:
+            if id(row) not in ids:
+                ids[id(row)] = self.trial_ids[row]
+        return {get_field(topic, 'id'): ids[id(row)] for topic, row in zip(topics, rows)}
@@ -5,22 +5,24 @@ import logging
 
 import copy
 import json
-import spacy
-from tqdm import tqdm
+from importlib import metadata
 from lxml import etree
 from zipfile import ZipFile
-from negspacy.negation import Negex
-from scispacy.linking import EntityLinker 
-from typing import Callable, Generator, List, Optional, Set, Union
+from typing import Callable, Generator, Iterable, List, Optional, Set, Tuple, Union
 
 from .doc_checker import DocChecker as dc
+from .parallel import map_doc_shards
+from .instrument import NO_INSTRUMENT, Instrument
+from .field_plan import FieldExtractor, FieldPlan
 
-from .ctbase import NLPTools
+from .ctbase import NLPTools, ParsedText
+from .ent_cache import EntityCache
 from .cttopic import CTTopic
 from .ctconfig import CTConfig
-from .utils import print_crit, filter_words
+from .utils import NoProgress, OffsetWriter, print_crit, filter_words
 from .ctdocument import CTDocument, EligCrit
 from .eligibility import process_eligibility_naive
+from .lab import AnalyteTable, read_analyte_table
 from .regex_patterns import EMPTY_PATTERN, TOPIC_ID_PATTERN
 
 
@@ -32,6 +34,17 @@ logger.setLevel('ERROR')
 
 
 
+def add_negex(NLP) -> None:
+    """
+    desc:       adds negex to the end of the NLP pipeline. negex bounds each negation by the sentence
+                (it reads doc.sents), so without the parser a rule based sentencizer goes before it
+    """
+    if not {'parser', 'senter', 'sentencizer'} & set(NLP.pipe_names):
+        NLP.add_pipe("sentencizer")
+    NLP.add_pipe("negex")
+
+
+
 #----------------------------------------------------------------#
 # Document Processing API Object
 #----------------------------------------------------------------#
@@ -40,9 +53,21 @@ class CTProc:
     def __init__(self, ct_config: CTConfig):
         self.config: CTConfig = ct_config
         self.nlp_tools: Optional[NLPTools] = None
+        self.field_extractor = FieldExtractor(FieldPlan())
+        self.instrument = Instrument() if ct_config.instrument else NO_INSTRUMENT
+        self.worker_cache_counts = [0, 0]   # entity cache hits and misses of the worker processes
+
+        # expand_with_aliases() is run (and timed) on its own by transform_ct_object()
+        self.features_config = ct_config._replace(expand=False)
+
+        # the table's lab tests are this CTProc's own, the built-in ones (LAB_TESTS) are left as they are
+        self.analyte_table: Optional[AnalyteTable] = None
+        if ct_config.add_labs and (ct_config.analyte_table is not None):
+            self.analyte_table = read_analyte_table(ct_config.analyte_table)
         
         if ct_config.nlp:
-            self.add_nlp()
+            if not self.uses_doc_workers():
+                self.add_nlp()   # otherwise each worker process loads its own pipeline
         else:
             nlp_flags = self.check_nlp_configs()
       
@@ -63,31 +88,130 @@ class CTProc:
         return config_flags
 
 
+    def uses_doc_workers(self) -> bool:
+        return (self.config.workers > 1) and not self.config.is_topic
+
+
+    def uses_ents(self) -> bool:
+        # expand works off the entities, so it needs the linker as well
+        return self.config.add_ents or self.config.expand
+
+
+    def uses_negation(self) -> bool:
+        return self.uses_ents() and self.config.add_negation
+
+
+    def get_nlp_excludes(self) -> List[str]:
+        """
+        desc:       components of en_core_sci_md the config never reads, left out of spacy.load()
+        """
+        excludes = ['tagger', 'attribute_ruler', 'lemmatizer']   # nothing reads POS tags or lemmas
+        if not self.config.is_topic:
+            excludes.append('parser')       # criteria are split already, negex gets a sentencizer instead
+        if not self.uses_ents():
+            excludes.append('ner')
+            if not self.config.is_topic:
+                excludes.append('tok2vec')  # stop words only, the pipeline is never run
+        return excludes
+
+
     def add_nlp(self):
+        """
+        desc:       builds self.nlp_tools from the config, loading only the components it needs:
+                    the UMLS linker if entities are added (or expanded), negex if their negation
+                    is kept, and the parser only for topics, which are split into sentences
+        """
+        # the nlp extra is imported here, not at module level, so runs without nlp never pay for 
+        # (or need) it. negspacy and scispacy register the "negex" and "scispacy_linker" factories
+        import spacy
+        import negspacy.negation     # noqa: F401
+        import scispacy.linking      # noqa: F401
+
         #np.warnings.filterwarnings('ignore', category=np.VisibleDeprecationWarning) 
-        NLP = spacy.load("en_core_sci_md")  # throws runtime error if not installed
-        NLP.add_pipe("scispacy_linker", config={"resolve_abbreviations": True, "linker_name": "umls"})
-        NLP.add_pipe("negex")
-        linker = NLP.get_pipe("scispacy_linker")
+        NLP = spacy.load("en_core_sci_md", exclude=self.get_nlp_excludes())  # throws runtime error if not installed
+        linker = None
+        if self.uses_ents():
+            NLP.add_pipe("scispacy_linker", config={"resolve_abbreviations": True, "linker_name": "umls"})
+            linker = NLP.get_pipe("scispacy_linker")
+            if self.uses_negation():
+                add_negex(NLP)
         STOP_WORDS = NLP.Defaults.stop_words
-        self.nlp_tools = NLPTools(NLP=NLP, linker=linker, STOP_WORDS=STOP_WORDS)
+        self.nlp_tools = NLPTools(
+            NLP=NLP, 
+            linker=linker, 
+            STOP_WORDS=STOP_WORDS, 
+            ent_cache=self.get_ent_cache(NLP), 
+            alias_table=self.get_alias_table(),
+        )
+
+
+    def get_alias_table(self):
+        if (self.config.alias_table is None) or not self.uses_ents():
+            return None
+        from .alias_table import AliasTable
+
+        alias_table = AliasTable(self.config.alias_table)
+        if alias_table.max_aliases < self.config.max_aliases:
+            logger.warning(f"{self.config.alias_table} keeps {alias_table.max_aliases} aliases per cui, max_aliases is {self.config.max_aliases}")
+        return alias_table
+
+
+    def get_ent_cache(self, NLP) -> Optional[EntityCache]:
+        if self.config.ent_cache is None:
+            return None
+        import spacy
+        # cached results are only valid for the same model, library versions and pipeline
+        meta = NLP.meta
+        version = '/'.join([
+            f"{meta['lang']}_{meta['name']}-{meta['version']}",
+            f"spacy-{spacy.__version__}",
+            f"scispacy-{metadata.version('scispacy')}",
+            ','.join(NLP.pipe_names),
+        ])
+        return EntityCache(self.config.ent_cache, version=version, max_bytes=self.config.ent_cache_max_bytes)
 
 
 
 
+    def progress(self, iterable: Optional[Iterable] = None, total: Optional[int] = None):
+        """
+        desc:       tqdm progress bar, imported only when progress is shown
+        """
+        if self.config.disable_tqdm:
+            return NoProgress(iterable)
+        from tqdm import tqdm
+        return tqdm(iterable, total=total)
+
+
     def process_data(self) -> Generator[None, None, Union[CTDocument, CTTopic]]:
         """
         desc:      main method for processing a zipped file of clinical trial XML documents from clinicaltrials.gov
+                   writes the jsonl to config.write_file, with its offset index beside it (see utils.OffsetIndex)
         """
 
-        with open(self.config.write_file, "w") as outfile:
+        # "\n" newlines and utf-8 on every platform, so the offset index counts the bytes on disk
+        with open(self.config.write_file, "w", newline="\n", encoding="utf-8") as outfile:
+            writer = OffsetWriter(outfile, self.config.write_file)
             proc_func = self.get_proc_func()  # will be either proc_doc_data() or proc_topic_data()
             for processed_obj in proc_func():
-                del processed_obj.nlp_tools  # remove nlp_tools from object before writing to file 
-                json.dump(processed_obj, outfile, default= lambda o: o.__dict__)
-                outfile.write("\n")
+                with self.instrument.stage('write', processed_obj):
+                    del processed_obj.nlp_tools  # remove nlp_tools from object before writing to file 
+                    writer.write(processed_obj.id, json.dumps(processed_obj, default= lambda o: o.__dict__))
+                self.instrument.count('docs')
+                self.instrument.end_doc(processed_obj, processed_obj.id)
                 yield processed_obj
 
+            # only once every doc is written, a partial output gets no offset index
+            if self.config.write_offsets:
+                writer.close()
+
+        if (self.nlp_tools is not None) and (self.nlp_tools.ent_cache is not None):
+            logger.info(f"entity cache: {self.nlp_tools.ent_cache.stats()}")
+        elif self.uses_doc_workers() and (self.config.ent_cache is not None):
+            hits, misses = self.worker_cache_counts
+            hit_rate = hits / (hits + misses) if hits + misses > 0 else 0.
+            logger.info(f"entity cache, over {self.config.workers} workers: {{'hits': {hits}, 'misses': {misses}, 'hit_rate': {hit_rate}}}")
+
 
     def get_proc_func(self) -> Callable:
         if self.config.is_topic:
@@ -104,16 +228,37 @@ class CTProc:
                     parameterized by CTConfig by which the ClinProc object (self) was initialized
         returns:    yields processed CTDocment objects, one at a time
         """
-        
+        if self.uses_doc_workers():
+            yield from self.process_doc_data_parallel()
+            return
+
         with ZipFile(self.config.data_path, 'r') as zip_reader:
-            for i, ct_file in enumerate(tqdm(zip_reader.namelist(), disable=self.config.disable_tqdm)):
-                
-                if not dc.iter_check(i, self.config):
-                    continue 
-            
-                processed_doc = self.build_doc(ct_file, zip_reader) 
-                if processed_doc is not None:
-                    yield processed_doc
+            ct_files = (
+                ct_file for i, ct_file in enumerate(self.progress(zip_reader.namelist())) 
+                if dc.iter_check(i, self.config)
+            )
+            yield from self.build_docs(ct_files, zip_reader)
+
+
+    def process_doc_data_parallel(self) -> Generator[None, None, CTDocument]:
+        """
+        desc:       process_doc_data() sharded across config.workers processes, each running
+                    build_doc() -> transform_ct_object() on its own shard of the zip members.
+                    docs come back in zip order if config.preserve_order, otherwise in completion order
+        returns:    yields processed CTDocment objects, one at a time
+        """
+        with ZipFile(self.config.data_path, 'r') as zip_reader:
+            ct_files = [ct_file for i, ct_file in enumerate(zip_reader.namelist()) if dc.iter_check(i, self.config)]
+
+        with self.progress(total=len(ct_files)) as pbar:
+            for n_consumed, docs, stats, doc_times, (hits, misses) in map_doc_shards(self.config, ct_files):
+                pbar.update(n_consumed)
+                self.instrument.merge(stats)
+                self.worker_cache_counts[0] += hits
+                self.worker_cache_counts[1] += misses
+                for doc, times in zip(docs, doc_times):
+                    self.instrument.set_doc_times(doc, times)
+                yield from docs
 
         
     def process_trec_topic_data(self) -> Generator[None, None, CTTopic]:
@@ -124,8 +269,7 @@ class CTProc:
         """
 
         topic_root = etree.parse(self.config.data_path).getroot()
-        for topic in topic_root:
-            yield self.build_topic(topic.attrib['number'], topic.text)
+        yield from self.build_topics((topic.attrib['number'], topic.text) for topic in topic_root)
 
 
     def process_kz_topic_data(self) -> Generator[None, None, CTTopic]:
@@ -135,6 +279,10 @@ class CTProc:
         returns:    yields processed CTTopic objects, one at a time
         """
 
+        yield from self.build_topics(self.read_kz_topics())
+
+
+    def read_kz_topics(self) -> Generator[None, None, Tuple[str, str]]:
         with open(self.config.data_path, 'r') as f:
             for line in f.readlines():
                 line = line.strip()
@@ -148,7 +296,7 @@ class CTProc:
 
                 elif line.startswith('<TITLE>'):
                     text = line[7:].strip()
-                    yield self.build_topic(topic_id, text)
+                    yield topic_id, text
                     
 
 
@@ -160,13 +308,30 @@ class CTProc:
         return self.transform_ct_object(doc)
 
 
+    def build_docs(self, ct_files: Iterable[str], zip_reader) -> Generator[None, None, CTDocument]:
+        """
+        desc:       build_doc() over many zip members, with the nlp features of consecutive 
+                    documents added in batches (see transform_ct_objects())
+        """
+        built_docs = (self.build_doc_helper(ct_file, zip_reader) for ct_file in ct_files)
+        yield from self.transform_ct_objects(doc for doc in built_docs if doc is not None)
+
+
     def build_doc_helper(self, ct_file: str, zip_reader) -> Optional[CTDocument]:
+        self.instrument.count('members')
         if not dc.combined_predoc_check(ct_file, self.config):
+            self.instrument.count('skipped')
             return None
         logger.info(f"ct file being processed: {ct_file}, doc being created")
-        result_doc = self.process_ct_doc_file(zip_reader.open(ct_file, 'r'), self.config.id_to_print)
+        with self.instrument.stage('parse_xml', ct_file):
+            with zip_reader.open(ct_file, 'r') as xml_filereader:
+                result_doc = self.process_ct_doc_file(self.instrument.timed_reader(xml_filereader, ct_file), self.config.id_to_print)
         if not dc.combined_doc_check(result_doc):
+            self.instrument.count('skipped')
+            self.instrument.rekey(result_doc, None)
+            self.instrument.rekey(ct_file, None)
             return None
+        self.instrument.rekey(ct_file, result_doc)
         return result_doc
 
 
@@ -175,6 +340,18 @@ class CTProc:
         ctop = self.transform_ct_object(ctop)
         ctop.add_age_and_gender_data()        # might depend on added sentences
         return ctop
+
+
+    def build_topics(self, topics: Iterable[Tuple[str, str]]) -> Generator[None, None, CTTopic]:
+        """
+        topics:     (topic_id, topic_text) pairs
+        desc:       build_topic() over many topics, with the nlp features added in batches
+        """
+        ctops = (CTTopic(id=topic_id, raw_text=topic_text, nlp_tools=self.nlp_tools) for topic_id, topic_text in topics)
+        for ctop in self.transform_ct_objects(ctops):
+            with self.instrument.stage('age_gender', ctop):
+                ctop.add_age_and_gender_data()
+            yield ctop
   
 
   
@@ -182,14 +359,13 @@ class CTProc:
     def process_ct_doc_file(self, xml_filereader, id_to_print: Optional[str]):
         """
         xml_filereader:  specific type of object passed from process_data(),
-                        used by parsexml library etree.parse() to get tree,
-                        allows for easy searching and getting of desired fields 
-                        in the document.
+                        a binary file object read incrementally by the field extractor
 
         id_to_print:     for debugging processing of a particular CT file, pass the id you wish
                         to have the contents printed for
                         
-        desc:            parses xml tree for the set of required fields you see below. 
+        desc:            gets the set of required fields (field_plan.CT_DOC_FIELDS) in a single
+                        pass over the xml, stopping once all of them have been seen. 
                         some fields require special treatment. chief among these is
                         'eligibility/criteria/textblock', requiring special 
                         functions to process ths value. 
@@ -197,24 +373,23 @@ class CTProc:
         returns:         built CTDocument from processed xml data
         
         """
-        doc_tree = etree.parse(xml_filereader)
-        root = doc_tree.getroot()
+        fields = self.field_extractor.extract(xml_filereader)
 
-        docid = root.find('id_info/nct_id').text
+        docid = fields['nct_id']
         if docid == id_to_print:
-            logger.info(etree.tostring(root, pretty_print=True, encoding='unicode'))
+            logger.info(fields)
 
         ct_doc = CTDocument(nct_id=docid, nlp_tools=self.nlp_tools)
-        ct_doc.condition = [result.text for result in root.findall('condition')]
-        ct_doc.condition_browse =  [result.text for result in root.findall('condition/condition_browse')] 
-        ct_doc.intervention_type = [result.text for result in root.findall('intervention/intervention_type')]
-        ct_doc.intervention_name = [result.text for result in root.findall('intervention/intervention_name')]
-        ct_doc = self.add_eligibility(ct_doc, root)
+        ct_doc.condition = fields['condition']
+        ct_doc.condition_browse = fields['condition_browse']
+        ct_doc.intervention_type = fields['intervention_type']
+        ct_doc.intervention_name = fields['intervention_name']
+        ct_doc = self.add_eligibility_text(ct_doc, fields['criteria'])
 
         if ct_doc.id == id_to_print:
             print_crit(ct_doc.elig_crit.include_criteria, ct_doc.elig_crit.exclude_criteria)
                         
-        ct_doc.process_doc_age(root) 
+        ct_doc.process_doc_age_text(fields['minimum_age'], fields['maximum_age'])
 
         return ct_doc
 
@@ -222,16 +397,20 @@ class CTProc:
   
     def add_eligibility(self, ct_doc: CTDocument, xml_root: etree) -> CTDocument:
         field_val = xml_root.find('eligibility/criteria/textblock')
-        if field_val is None:
+        return self.add_eligibility_text(ct_doc, None if field_val is None else field_val.text)
+
+
+    def add_eligibility_text(self, ct_doc: CTDocument, field_text: Optional[str]) -> CTDocument:
+        if field_text is None:
             logger.info("no eligbility criteria exists for this document")
             return ct_doc
         
-        field_text = field_val.text
         if EMPTY_PATTERN.fullmatch(field_text):
             logger.info("eligibility criteria is empty")
             return ct_doc
 
-        inc_elig, exc_elig = process_eligibility_naive(field_text)
+        with self.instrument.stage('eligibility', ct_doc):
+            inc_elig, exc_elig = process_eligibility_naive(field_text)
         ct_doc.elig_crit = EligCrit(field_text) 
         ct_doc.elig_crit.include_criteria = inc_elig
         ct_doc.elig_crit.exclude_criteria = exc_elig
@@ -243,16 +422,95 @@ class CTProc:
     # methods for transforming the documents and/or adding features
     #----------------------------------------------------------------#
     
-    def transform_ct_object(self, ct_obj: Union[CTDocument, CTTopic]) -> Union[CTDocument, CTTopic]:    
+    def transform_ct_object(
+        self, 
+        ct_obj: Union[CTDocument, CTTopic], 
+        parsed_texts: Optional[List[ParsedText]] = None
+    ) -> Union[CTDocument, CTTopic]:    
         if self.config.nlp:
-            ct_obj.add_nlp_features(self.config)
+            with self.instrument.stage('nlp_features', ct_obj):
+                ct_obj.add_nlp_features(self.features_config, parsed_texts)
+            if self.config.expand:
+                with self.instrument.stage('expand', ct_obj):
+                    ct_obj.expand_with_aliases()
+
+        if self.config.add_labs:
+            with self.instrument.stage('labs', ct_obj):
+                ct_obj.add_lab_values(self.analyte_table)
 
         if self.config.concat:
-            ct_obj.concatenate_data()
+            with self.instrument.stage('concat', ct_obj):
+                ct_obj.concatenate_data()
 
         return ct_obj
 
 
+    def transform_ct_objects(
+        self, 
+        ct_objs: Iterable[Union[CTDocument, CTTopic]]
+    ) -> Generator[None, None, Union[CTDocument, CTTopic]]:
+        """
+        ct_objs:    docs or topics, consumed lazily
+        desc:       transform_ct_object() over a stream of objects. objects are buffered until they 
+                    hold config.nlp_batch_size texts for the spaCy pipeline, then all of those texts 
+                    go through a single nlp.pipe() call and the results are routed back to
+                    the object that owns them
+        returns:    yields the transformed objects, in input order
+        """
+        if not self.config.nlp:
+            yield from (self.transform_ct_object(ct_obj) for ct_obj in ct_objs)
+            return
+
+        batch, n_texts = [], 0
+        for ct_obj in ct_objs:
+            texts = ct_obj.get_nlp_texts(self.config)
+            batch.append((ct_obj, texts))
+            n_texts += len(texts)
+            if n_texts >= self.config.nlp_batch_size:
+                yield from self.transform_ct_batch(batch)
+                batch, n_texts = [], 0
+
+        if len(batch) > 0:
+            yield from self.transform_ct_batch(batch)
+
+
+    def transform_ct_batch(self, batch: List[Tuple[Union[CTDocument, CTTopic], List[str]]]) -> List[Union[CTDocument, CTTopic]]:
+        """
+        batch:      (object, texts to parse for it) pairs
+        desc:       parses every distinct text of the batch that is not already in the entity cache
+                    with one nlp.pipe() call, then transforms each object with its parsed texts
+        """
+        cache = self.nlp_tools.ent_cache
+        keys = [[ct_obj.nlp_key(text, self.config) for text in texts] for ct_obj, texts in batch]
+        parsed = cache.get_many({key for obj_keys in keys for key in obj_keys}) if cache is not None else {}
+
+        to_parse = {}   # key -> index of the first object in the batch that owns the text 
+        for i, obj_keys in enumerate(keys):
+            for key in obj_keys:
+                if key not in parsed and key not in to_parse:
+                    to_parse[key] = i
+
+        self.instrument.count('nlp_texts', sum(len(obj_keys) for obj_keys in keys))
+        self.instrument.count('nlp_parsed', len(to_parse))
+
+        new_parsed = {}
+        if len(to_parse) > 0:
+            with self.instrument.stage('nlp'):
+                tagged_texts = ((key[1], key) for key in to_parse)
+                for nlp_doc, key in self.nlp_tools.NLP.pipe(tagged_texts, as_tuples=True, batch_size=self.config.nlp_batch_size):
+                    ct_obj = batch[to_parse[key]][0]
+                    new_parsed[key] = ct_obj.parse_nlp_doc(nlp_doc, self.config)
+
+        if cache is not None:
+            cache.put_many(new_parsed)
+        parsed.update(new_parsed)
+
+        return [
+            self.transform_ct_object(ct_obj, [parsed[key] for key in obj_keys]) 
+            for (ct_obj, _), obj_keys in zip(batch, keys)
+        ]
+
+
 
     #--------------------------------------------------------------------------------------#
     # methods for reformatting text
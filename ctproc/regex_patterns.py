@@ -10,6 +10,14 @@ YEAR_PATTERN = re.compile(r'(?P<year>[yY]ears?.*)')
 MONTH_PATTERN = re.compile(r'(?P<month>[mM]o(?:nth)?)')
 WEEK_PATTERN = re.compile(r'(?P<week>[wW]eeks?)')
 
+ALL_CAPS_PATTERN = re.compile(r'[A-Z][A-Z][A-Z][A-Z][A-Z][A-Z]+(?: [A-Z]+)?')    # ex. DISEASE
+LEADING_NUMBER_PATTERN = re.compile(r'\d+. *(?P<crit>.*)')
+
+# header starting the exclusion criteria of a textblock, and the wrapped lines of a criterion
+EXC_HEADER_PATTERN = re.compile(r'(?:[Ee]xclu(?:de|sion) criteria:?)|(?:[Ii]neligibility [Cc]riteria:?)', flags=re.IGNORECASE)
+EXC_HEADER_CRITERIA_OFFSETS = (14, 10, 8)   # offsets of 'criteria' from the start of a header, longest first
+CRIT_WRAP_PATTERN = re.compile(r'\n   +')
+
 BOTH_INC_AND_EXC_PATTERN = re.compile(r'[\s\n]*[Ii]nclusion [Cc]riteria:?(?: +[Ee]ligibility[ \w]+\: )?(?P<include_crit>[ \n(?:\-|\d)\.\?\"\%\r\w\:\,\(\)]*)[Ee]xclusion [Cc]riteria:?(?P<exclude_crit>[\w\W ]*)')
 
 
@@ -0,0 +1,2 @@
+from .analyzer import analyze, stem, tokenize, PorterStemmer, STOPWORDS
+from .bm25 import BM25Index, Hit, FIELDS, DEFAULT_K1, DEFAULT_B, field_text, build_field_indexes, load_field_indexes, read_json_collection
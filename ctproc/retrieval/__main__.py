@@ -0,0 +1,31 @@
+"""
+Builds bm25 indexes, in place of `python -m pyserini.index`.
+
+    python -m ctproc.retrieval --input data/nct004x_jsonl --index indexes/nct004x
+    python -m ctproc.retrieval --input processed_docs.jsonl --index indexes/nct004x --fields
+
+The first indexes a folder of pyserini JsonCollection files ({"id": ..., "contents": ...} per
+line), the second the contents, include and exclude criteria of processed docs, one index each.
+"""
+import argparse
+
+from ..utils import get_processed_data
+from .bm25 import BM25Index, DEFAULT_B, DEFAULT_K1, build_field_indexes, read_json_collection
+
+
+def main(args):
+    if args.fields:
+        build_field_indexes(get_processed_data(args.input), args.index, k1=args.k1, b=args.b)
+    else:
+        ids, texts = read_json_collection(args.input)
+        BM25Index.build(ids, texts, k1=args.k1, b=args.b).save(args.index)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", required=True, help="folder of JsonCollection files, or a processed docs jsonl with --fields")
+    parser.add_argument("--index", required=True, help="directory to write the index to")
+    parser.add_argument("--fields", action="store_true", help="index the fields of processed docs, see ctproc.retrieval.FIELDS")
+    parser.add_argument("--k1", type=float, default=DEFAULT_K1)
+    parser.add_argument("--b", type=float, default=DEFAULT_B)
+    main(parser.parse_args())
@@ -0,0 +1,265 @@
+# ----------------------------------------------------------------------------------------------- #
+# english analyzer of the lucene indexes pyserini builds: word tokens, lowercased, possessives and
+# stopwords removed, porter stemmed
+# ----------------------------------------------------------------------------------------------- #
+
+
+import re
+from functools import lru_cache
+from typing import List
+
+
+# word boundaries of lucene's StandardTokenizer, for the text trials are written in: runs of letters
+# and digits, joined across an apostrophe, colon or period between letters (U.S.A, o'clock) and
+# across a period, comma or semicolon between digits (1.5, 100,000)
+TOKEN_PATTERN = re.compile(r"\w+(?:(?:(?<=[^\W\d])[.:'’](?=[^\W\d])|(?<=\d)[.,;'’](?=\d))\w+)*")
+
+# lucene's EnglishAnalyzer.ENGLISH_STOP_WORDS_SET
+STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if', 'in', 'into', 'is', 'it', 'no', 'not',
+    'of', 'on', 'or', 'such', 'that', 'the', 'their', 'then', 'there', 'these', 'they', 'this', 'to', 'was',
+    'will', 'with',
+])
+
+VOWELS = frozenset('aeiou')
+
+
+
+class PorterStemmer:
+    """
+    desc:       the porter stemming algorithm, as in Martin Porter's reference implementation (which
+                lucene's PorterStemFilter is a port of), words of one or two letters are left alone
+    """
+    def __init__(self) -> None:
+        self.b = ''
+        self.k = 0
+        self.j = 0
+
+
+    def cons(self, i: int) -> bool:
+        ch = self.b[i]
+        if ch in VOWELS:
+            return False
+        if ch == 'y':
+            return i == 0 or not self.cons(i - 1)
+        return True
+
+
+    def m(self) -> int:
+        """
+        returns:    the number of consonant-vowel sequences between the start of the word and j
+        """
+        n, i = 0, 0
+        while True:
+            if i > self.j:
+                return n
+            if not self.cons(i):
+                break
+            i += 1
+        i += 1
+        while True:
+            while True:
+                if i > self.j:
+                    return n
+                if self.cons(i):
+                    break
+                i += 1
+            i += 1
+            n += 1
+            while True:
+                if i > self.j:
+                    return n
+                if not self.cons(i):
+                    break
+                i += 1
+            i += 1
+
+
+    def vowel_in_stem(self) -> bool:
+        return any(not self.cons(i) for i in range(self.j + 1))
+
+
+    def double_cons(self, j: int) -> bool:
+        return j >= 1 and self.b[j] == self.b[j - 1] and self.cons(j)
+
+
+    def cvc(self, i: int) -> bool:
+        if i < 2 or not self.cons(i) or self.cons(i - 1) or not self.cons(i - 2):
+            return False
+        return self.b[i] not in 'wxy'
+
+
+    def ends(self, s: str) -> bool:
+        length = len(s)
+        if s[-1] != self.b[self.k] or length > self.k + 1:
+            return False
+        if self.b[self.k - length + 1:self.k + 1] != s:
+            return False
+        self.j = self.k - length
+        return True
+
+
+    def set_to(self, s: str) -> None:
+        self.b = self.b[:self.j + 1] + s
+        self.k = self.j + len(s)
+
+
+    def r(self, s: str) -> None:
+        if self.m() > 0:
+            self.set_to(s)
+
+
+    def step1ab(self) -> None:
+        # plurals, -ed and -ing
+        if self.b[self.k] == 's':
+            if self.ends('sses'):
+                self.k -= 2
+            elif self.ends('ies'):
+                self.set_to('i')
+            elif self.b[self.k - 1] != 's':
+                self.k -= 1
+        if self.ends('eed'):
+            if self.m() > 0:
+                self.k -= 1
+        elif (self.ends('ed') or self.ends('ing')) and self.vowel_in_stem():
+            self.k = self.j
+            if self.ends('at'):
+                self.set_to('ate')
+            elif self.ends('bl'):
+                self.set_to('ble')
+            elif self.ends('iz'):
+                self.set_to('ize')
+            elif self.double_cons(self.k):
+                self.k -= 1
+                if self.b[self.k] in 'lsz':
+                    self.k += 1
+            else:
+                self.j = self.k
+                if self.m() == 1 and self.cvc(self.k):
+                    self.set_to('e')
+
+
+    def step1c(self) -> None:
+        if self.ends('y') and self.vowel_in_stem():
+            self.b = self.b[:self.k] + 'i' + self.b[self.k + 1:]
+
+
+    def replace_suffix(self, suffixes) -> None:
+        for suffix, replacement in suffixes:
+            if self.ends(suffix):
+                self.r(replacement)
+                return
+
+
+    def step2(self) -> None:
+        # double suffixes to single ones, -ization to -ize
+        if self.k == 0:
+            return
+        self.replace_suffix(STEP2_SUFFIXES.get(self.b[self.k - 1], ()))
+
+
+    def step3(self) -> None:
+        # -ic-, -full, -ness
+        self.replace_suffix(STEP3_SUFFIXES.get(self.b[self.k], ()))
+
+
+    def step4(self) -> None:
+        # -ant, -ence, ... in context <c>vcvc<v>
+        if self.k == 0:
+            return
+        for suffix in STEP4_SUFFIXES.get(self.b[self.k - 1], ()):
+            if self.ends(suffix):
+                if suffix == 'ion' and (self.j < 0 or self.b[self.j] not in 'st'):
+                    continue
+                break
+        else:
+            return
+        if self.m() > 1:
+            self.k = self.j
+
+
+    def step5(self) -> None:
+        # final -e, and -ll to -l, in long enough stems
+        self.j = self.k
+        if self.b[self.k] == 'e':
+            a = self.m()
+            if a > 1 or (a == 1 and not self.cvc(self.k - 1)):
+                self.k -= 1
+        if self.b[self.k] == 'l' and self.double_cons(self.k) and self.m() > 1:
+            self.k -= 1
+
+
+    def stem(self, word: str) -> str:
+        if len(word) <= 2:
+            return word
+        self.b, self.k, self.j = word, len(word) - 1, 0
+        self.step1ab()
+        if self.k > 0:
+            self.step1c()
+            self.step2()
+            self.step3()
+            self.step4()
+            self.step5()
+        return self.b[:self.k + 1]
+
+
+
+STEP2_SUFFIXES = {
+    'a': (('ational', 'ate'), ('tional', 'tion')),
+    'c': (('enci', 'ence'), ('anci', 'ance')),
+    'e': (('izer', 'ize'),),
+    'l': (('bli', 'ble'), ('alli', 'al'), ('entli', 'ent'), ('eli', 'e'), ('ousli', 'ous')),
+    'o': (('ization', 'ize'), ('ation', 'ate'), ('ator', 'ate')),
+    's': (('alism', 'al'), ('iveness', 'ive'), ('fulness', 'ful'), ('ousness', 'ous')),
+    't': (('aliti', 'al'), ('iviti', 'ive'), ('biliti', 'ble')),
+    'g': (('logi', 'log'),),
+}
+
+STEP3_SUFFIXES = {
+    'e': (('icate', 'ic'), ('ative', ''), ('alize', 'al')),
+    'i': (('iciti', 'ic'),),
+    'l': (('ical', 'ic'), ('ful', '')),
+    's': (('ness', ''),),
+}
+
+STEP4_SUFFIXES = {
+    'a': ('al',),
+    'c': ('ance', 'ence'),
+    'e': ('er',),
+    'i': ('ic',),
+    'l': ('able', 'ible'),
+    'n': ('ant', 'ement', 'ment', 'ent'),
+    'o': ('ion', 'ou'),
+    's': ('ism',),
+    't': ('ate', 'iti'),
+    'u': ('ous',),
+    'v': ('ive',),
+    'z': ('ize',),
+}
+
+
+
+@lru_cache(maxsize=1 << 18)
+def stem(word: str) -> str:
+    # trial text repeats a small vocabulary, each distinct word is stemmed once
+    return PorterStemmer().stem(word)
+
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    returns:    the lowercased word tokens of text, possessive 's removed
+    """
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    return [token[:-2] if token.endswith(("'s", "’s")) else token for token in tokens]
+
+
+
+def analyze(text: str) -> List[str]:
+    """
+    text:       document field or query
+    returns:    its index terms, in order, what pyserini's default english analyzer gives for it
+    """
+    if not text:
+        return []
+    return [stem(token) for token in tokenize(text) if token not in STOPWORDS]
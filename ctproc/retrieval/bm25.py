@@ -0,0 +1,428 @@
+# ----------------------------------------------------------------------------------------------- #
+# bm25 over scipy.sparse postings, scored the way lucene (and so pyserini) scores it
+# ----------------------------------------------------------------------------------------------- #
+
+
+import json
+import logging
+import numpy as np
+from array import array
+from collections import Counter
+from itertools import repeat
+from pathlib import Path
+from scipy import sparse
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from ..index_utils import distinct, get_field, index_dtype, read_lines
+from .analyzer import analyze
+
+logger = logging.getLogger(__file__)
+
+
+# pyserini's bm25 parameters, also what scripts/indexing.py searched with
+DEFAULT_K1 = 0.9
+DEFAULT_B = 0.4
+
+FORMAT_VERSION = 2
+
+# lucene's SmallFloat.intToByte4: a document length is kept in one byte, exact below 24 tokens and
+# rounded down to 4 significant bits above, scores use the rounded length
+_NUM_FREE_VALUES = 24
+
+
+
+def _int4_to_long(i: int) -> int:
+    bits, shift = i & 0x07, (i >> 3) - 1
+    return bits if shift == -1 else (bits | 0x08) << shift
+
+
+
+def byte4_to_int(b: int) -> int:
+    return b if b < _NUM_FREE_VALUES else _NUM_FREE_VALUES + _int4_to_long(b - _NUM_FREE_VALUES)
+
+
+
+# LENGTH_TABLE[norm]: the document length a norm byte stands for
+LENGTH_TABLE = np.array([byte4_to_int(b) for b in range(256)], dtype=np.int64)
+
+
+
+def length_norms(lengths: np.ndarray) -> np.ndarray:
+    """
+    lengths:    number of terms in each document
+    returns:    their norm bytes, the largest table length not above each length
+    """
+    return (np.searchsorted(LENGTH_TABLE, lengths, side='right') - 1).astype(np.uint8)
+
+
+
+class Hit(NamedTuple):
+    # same fields as a pyserini hit, so code written against SimpleSearcher reads these unchanged
+    docid: str
+    score: float
+
+
+
+def _top_k(ranks: np.ndarray, scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    ranks:      of the documents' ids in string order, pyserini's searcher breaks score ties by docid
+    returns:    positions of the k best scores, best first, ties broken by lowest rank
+    """
+    if len(scores) > k:
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        above = np.flatnonzero(scores > kth)
+        tied = np.flatnonzero(scores == kth)
+        tied = tied[np.argsort(ranks[tied], kind='stable')[:k - len(above)]]
+        keep = np.concatenate([above, tied])
+    else:
+        keep = np.arange(len(scores))
+    return keep[np.lexsort((ranks[keep], -scores[keep]))]
+
+
+
+class BM25Index:
+    """
+    doc_ids:    ids of the documents, in index order
+    terms:      analyzed terms, in term id order
+    postings:   terms x documents csr matrix of bm25 term impacts, tf / (tf + k1 * (1 - b + b * dl / avgdl)),
+                so the score of a document is the sum over the query terms of idf times its impact
+    doc_postings: the same impacts documents x terms, to score only some documents, built from
+                postings when not given
+    norms:      norm byte of each document's length
+    avgdl:      average length of the documents with any terms
+    doc_count:  number of documents with any terms, the N of the idf
+    desc:       a bm25 index of one field, searched for many queries with one sparse product. scores
+                are lucene's BM25Similarity: lengths as lucene rounds them, lucene's idf, no (k1 + 1)
+                factor, float32 arithmetic, a query term repeated n times weighted n times. a search
+                limited to candidate documents reads only their rows of doc_postings
+    """
+
+
+    def __init__(
+        self,
+        doc_ids: Sequence[str],
+        terms: Sequence[str],
+        postings: sparse.csr_matrix,
+        norms: np.ndarray,
+        avgdl: float,
+        doc_count: int,
+        k1: float = DEFAULT_K1,
+        b: float = DEFAULT_B,
+        doc_postings: Optional[sparse.csr_matrix] = None,
+    ) -> None:
+        self.doc_ids = np.asarray(doc_ids, dtype=object)
+        self.terms = list(terms)
+        self.term_ids: Dict[str, int] = {term: i for i, term in enumerate(self.terms)}
+        self.postings = postings
+        self.doc_postings = postings.T.tocsr() if doc_postings is None else doc_postings
+        self._positions: Optional[Dict[str, int]] = None
+        self._id_ranks: Optional[np.ndarray] = None
+        self.norms = norms
+        self.avgdl = avgdl
+        self.doc_count = doc_count
+        self.k1 = k1
+        self.b = b
+
+        self.doc_freqs = np.diff(postings.indptr)
+        self.doc_terms = np.diff(self.doc_postings.indptr)
+        self.idf = np.log1p((doc_count - self.doc_freqs + 0.5) / (self.doc_freqs + 0.5)).astype(np.float32)
+
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+
+    @classmethod
+    def build(cls, doc_ids: Sequence[str], texts: Iterable[Optional[str]], k1: float = DEFAULT_K1, b: float = DEFAULT_B) -> "BM25Index":
+        """
+        doc_ids:    id of each document
+        texts:      text of each document's field, None or empty for none
+        """
+        vocab: Dict[str, int] = {}
+        term_col, doc_col, tf_col = array('q'), array('q'), array('q')
+        lengths = np.zeros(len(doc_ids), dtype=np.int64)
+        for doc, text in enumerate(texts):
+            terms = analyze(text)
+            lengths[doc] = len(terms)
+            for term, tf in Counter(terms).items():
+                term_col.append(vocab.setdefault(term, len(vocab)))
+                doc_col.append(doc)
+                tf_col.append(tf)
+
+        # documents were added in order, so each term's postings are in document order
+        counts = sparse.csr_matrix(
+            (np.frombuffer(tf_col, dtype=np.int64).astype(np.float32), (np.frombuffer(term_col, dtype=np.int64), np.frombuffer(doc_col, dtype=np.int64))),
+            shape=(len(vocab), len(doc_ids)),
+        )
+        doc_count = int(np.count_nonzero(lengths))
+        avgdl = np.float32(lengths.sum() / doc_count) if doc_count else np.float32(1)
+        norms = length_norms(lengths)
+
+        # lucene's per norm cache of k1 * (1 - b + b * dl / avgdl), in float32 as lucene computes it
+        k1_32, b_32 = np.float32(k1), np.float32(b)
+        cache = k1_32 * ((np.float32(1) - b_32) + b_32 * LENGTH_TABLE.astype(np.float32) / avgdl)
+        counts.data /= counts.data + cache[norms[counts.indices]]
+        return cls(doc_ids, sorted(vocab, key=vocab.__getitem__), counts, norms, float(avgdl), doc_count, k1, b)
+
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        path:       directory to write, the arrays as .npy files load() can memory map
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        _save_csr(path, '', self.postings)
+        _save_csr(path, 'doc_', self.doc_postings)
+        np.save(path / 'norms.npy', np.asarray(self.norms, dtype=np.uint8))
+        (path / 'terms.txt').write_text('\n'.join(self.terms), encoding='utf-8')
+        (path / 'doc_ids.txt').write_text('\n'.join(self.doc_ids), encoding='utf-8')
+        meta = {
+            'format': FORMAT_VERSION, 'k1': self.k1, 'b': self.b, 'avgdl': self.avgdl, 'doc_count': self.doc_count,
+            'n_docs': len(self.doc_ids), 'n_terms': len(self.terms),
+        }
+        (path / 'meta.json').write_text(json.dumps(meta), encoding='utf-8')
+
+
+    @classmethod
+    def load(cls, path: Union[str, Path], mmap: bool = True) -> "BM25Index":
+        """
+        path:       directory written by save()
+        mmap:       whether to memory map the postings instead of reading them in
+        """
+        path = Path(path)
+        meta = json.loads((path / 'meta.json').read_text(encoding='utf-8'))
+        if meta['format'] != FORMAT_VERSION:
+            raise ValueError(f"{path} is a format {meta['format']} index, expected format {FORMAT_VERSION}")
+
+        mmap_mode = 'r' if mmap else None
+        postings = _load_csr(path, '', (meta['n_terms'], meta['n_docs']), mmap_mode)
+        doc_postings = _load_csr(path, 'doc_', (meta['n_docs'], meta['n_terms']), mmap_mode)
+        norms = np.load(path / 'norms.npy', mmap_mode=mmap_mode)
+        terms = read_lines(path / 'terms.txt', meta['n_terms'])
+        doc_ids = read_lines(path / 'doc_ids.txt', meta['n_docs'])
+        return cls(doc_ids, terms, postings, norms, meta['avgdl'], meta['doc_count'], meta['k1'], meta['b'], doc_postings)
+
+
+    def query_matrix(self, queries: Sequence[str]) -> sparse.csr_matrix:
+        """
+        returns:    queries x terms matrix of the weight of each query term, its idf times how often
+                    the query has it, terms not in the index left out
+        """
+        indptr, indices, weights = [0], [], []
+        for query in queries:
+            counts = Counter(term for term in analyze(query) if term in self.term_ids)
+            for term, count in counts.items():
+                term_id = self.term_ids[term]
+                indices.append(term_id)
+                weights.append(count * self.idf[term_id])
+            indptr.append(len(indices))
+        weights = sparse.csr_matrix(
+            (np.asarray(weights, dtype=np.float32), np.asarray(indices, dtype=self.postings.indices.dtype), np.asarray(indptr, dtype=self.postings.indptr.dtype)),
+            shape=(len(queries), len(self.terms)),
+        )
+        # terms in id order, the order doc_postings rows sum them in, so a document scores the same
+        # to the bit whether all documents or only candidates are scored
+        weights.sort_indices()
+        return weights
+
+
+    def positions(self, docs: Iterable[Any]) -> np.ndarray:
+        """
+        docs:       ids of documents, or their positions in the index (an integer array)
+        returns:    the sorted, distinct positions of those in the index
+        """
+        if not isinstance(docs, np.ndarray):
+            docs = np.asarray(list(docs))
+        if docs.dtype.kind not in 'iu':
+            if self._positions is None:
+                self._positions = {doc_id: i for i, doc_id in enumerate(self.doc_ids.tolist())}
+            docs = np.fromiter(map(self._positions.get, docs.tolist(), repeat(-1)), dtype=np.int64, count=len(docs))
+            docs = docs[docs >= 0]
+        return distinct([docs], len(self.doc_ids))
+
+
+    def scores(self, queries: Sequence[str]) -> sparse.csr_matrix:
+        """
+        returns:    queries x documents matrix of bm25 scores, documents sharing no term with a query left out
+        """
+        return (self.query_matrix(queries) @ self.postings).tocsr()
+
+
+    def id_ranks(self) -> np.ndarray:
+        """
+        returns:    rank of each document's id in string order, by position
+        """
+        if self._id_ranks is None:
+            self._id_ranks = np.empty(len(self.doc_ids), dtype=np.int64)
+            self._id_ranks[np.argsort(self.doc_ids, kind='stable')] = np.arange(len(self.doc_ids))
+        return self._id_ranks
+
+
+    def _hits(self, docs: np.ndarray, scores: np.ndarray, k: int) -> List[Hit]:
+        best = _top_k(self.id_ranks()[docs], scores, k)
+        return list(map(Hit._make, zip(self.doc_ids[docs[best]].tolist(), scores[best].tolist())))
+
+
+    def search_batch(
+        self,
+        queries: Sequence[str],
+        k: int = 1000,
+        batch_size: int = 32,
+        candidates: Optional[Sequence[Iterable[Any]]] = None,
+    ) -> List[List[Hit]]:
+        """
+        queries:    query texts, e.g. the contents of topics
+        k:          number of hits to return per query
+        batch_size: queries scored per sparse product, bounds the memory of the scores
+        candidates: per query, the ids (or positions) of the only documents it may hit, e.g. from
+                    prefilter.DemographicIndex.query_topics(). None to search all documents
+        returns:    the k best hits of each query, best first
+        """
+        if candidates is not None:
+            return self._search_candidates(queries, candidates, k, batch_size)
+        results = []
+        for start in range(0, len(queries), batch_size):
+            scores = self.scores(queries[start:start + batch_size])
+            for row in range(scores.shape[0]):
+                row_start, row_end = scores.indptr[row], scores.indptr[row + 1]
+                results.append(self._hits(scores.indices[row_start:row_end], scores.data[row_start:row_end], k))
+        return results
+
+
+    def _search_candidates(self, queries: Sequence[str], candidates: Sequence[Iterable[Any]], k: int, batch_size: int) -> List[List[Hit]]:
+        # only the candidates' rows of doc_postings are read, times the query weights, so the cost
+        # follows the number of candidates and not the depth of the hits. queries given the very
+        # same candidates (topics of one age and gender) share the rows. when the candidates have
+        # more postings than the queries' terms do, the queries are scored over all documents and
+        # the scores of the others dropped, whichever reads less. the scores are the same either way
+        if len(candidates) != len(queries):
+            raise ValueError(f"{len(candidates)} candidate sets for {len(queries)} queries")
+        weights = self.query_matrix(queries)
+        query_rows = np.repeat(np.arange(len(queries)), np.diff(weights.indptr))
+        query_postings = np.bincount(query_rows, weights=self.doc_freqs[weights.indices], minlength=len(queries))
+        groups: Dict[int, List[int]] = {}
+        for row, docs in enumerate(candidates):
+            groups.setdefault(id(docs), []).append(row)
+
+        results: List[List[Hit]] = [[] for _ in queries]
+        for rows in groups.values():
+            docs = self.positions(candidates[rows[0]])
+            if self.doc_terms[docs].sum() <= query_postings[rows].sum():
+                self._score_candidates(docs, weights, rows, k, batch_size, results)
+            else:
+                self._filter_scores(docs, weights, rows, k, batch_size, results)
+        return results
+
+
+    def _score_candidates(self, docs: np.ndarray, weights: sparse.csr_matrix, rows: List[int], k: int, batch_size: int, results: List[List[Hit]]) -> None:
+        doc_rows = self.doc_postings[docs]
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            scores = (doc_rows @ weights[batch].T).toarray()
+            for column, row in enumerate(batch):
+                matched = np.flatnonzero(scores[:, column])
+                results[row] = self._hits(docs[matched], scores[matched, column], k)
+
+
+    def _filter_scores(self, docs: np.ndarray, weights: sparse.csr_matrix, rows: List[int], k: int, batch_size: int, results: List[List[Hit]]) -> None:
+        is_candidate = np.zeros(len(self.doc_ids), dtype=bool)
+        is_candidate[docs] = True
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            scores = (weights[batch] @ self.postings).tocsr()
+            for i, row in enumerate(batch):
+                row_docs = scores.indices[scores.indptr[i]:scores.indptr[i + 1]]
+                row_scores = scores.data[scores.indptr[i]:scores.indptr[i + 1]]
+                keep = is_candidate[row_docs]
+                results[row] = self._hits(row_docs[keep], row_scores[keep], k)
+
+
+    def search(self, query: str, k: int = 1000, candidates: Optional[Iterable[Any]] = None) -> List[Hit]:
+        return self.search_batch([query], k, candidates=None if candidates is None else [candidates])[0]
+
+
+
+def read_json_collection(folder: Union[str, Path]) -> Tuple[List[str], List[str]]:
+    """
+    folder:     of pyserini JsonCollection files, one {"id": ..., "contents": ...} per line
+    returns:    ids and contents of the docs, for BM25Index.build()
+    """
+    ids, texts = [], []
+    for path in sorted(Path(folder).glob('*.json*')):
+        with open(path, 'r') as json_file:
+            for line in json_file:
+                if line.strip():
+                    doc = json.loads(line)
+                    ids.append(doc['id'])
+                    texts.append(doc['contents'])
+    return ids, texts
+
+
+
+def _save_csr(path: Path, prefix: str, matrix: sparse.csr_matrix) -> None:
+    dtype = index_dtype(matrix.nnz)
+    np.save(path / f'{prefix}indptr.npy', matrix.indptr.astype(dtype, copy=False))
+    np.save(path / f'{prefix}indices.npy', matrix.indices.astype(dtype, copy=False))
+    np.save(path / f'{prefix}impacts.npy', matrix.data.astype(np.float32, copy=False))
+
+
+
+def _load_csr(path: Path, prefix: str, shape: Tuple[int, int], mmap_mode: Optional[str]) -> sparse.csr_matrix:
+    arrays = [np.load(path / f'{prefix}{name}.npy', mmap_mode=mmap_mode) for name in ('impacts', 'indices', 'indptr')]
+    return sparse.csr_matrix(tuple(arrays), shape=shape, copy=False)
+
+
+
+# the fields of a processed CTDocument that are indexed, each is its own index
+FIELDS = ('contents', 'include', 'exclude')
+
+
+
+def field_text(doc: Any, field: str) -> str:
+    """
+    doc:        processed CTDocument, or its dict
+    field:      one of FIELDS, the include and exclude fields are the criteria of the doc, one per line
+    """
+    if field == 'contents':
+        return get_field(doc, 'contents') or ''
+    elig_crit = get_field(doc, 'elig_crit')
+    criteria = None if elig_crit is None else get_field(elig_crit, f'{field}_criteria')
+    return '\n'.join(criteria or [])
+
+
+
+def build_field_indexes(
+    docs: Iterable[Any],
+    path: Optional[Union[str, Path]] = None,
+    fields: Sequence[str] = FIELDS,
+    k1: float = DEFAULT_K1,
+    b: float = DEFAULT_B,
+) -> Dict[str, BM25Index]:
+    """
+    docs:       processed CTDocuments, or their dicts
+    path:       directory to save the indexes to, one subdirectory per field, None to keep them in memory
+    returns:    field -> its index
+    """
+    doc_ids: List[str] = []
+    texts: Dict[str, List[str]] = {field: [] for field in fields}
+    for doc in docs:
+        doc_ids.append(get_field(doc, 'id'))
+        for field in fields:
+            texts[field].append(field_text(doc, field))
+
+    indexes = {}
+    for field in fields:
+        indexes[field] = BM25Index.build(doc_ids, texts[field], k1, b)
+        if path is not None:
+            indexes[field].save(Path(path) / field)
+        logger.info(f"indexed {field} of {len(doc_ids)} docs, {len(indexes[field].terms)} terms")
+    return indexes
+
+
+
+def load_field_indexes(path: Union[str, Path], fields: Sequence[str] = FIELDS, mmap: bool = True) -> Dict[str, BM25Index]:
+    """
+    path:       directory build_field_indexes() saved to
+    returns:    field -> its index
+    """
+    return {field: BM25Index.load(Path(path) / field, mmap=mmap) for field in fields}
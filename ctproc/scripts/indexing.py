@@ -1,12 +1,12 @@
 from drive.MyDrive.trec21_ct_full.trec_ct.scripts.trec21_vis import get_relled
 from sklearn.metrics import confusion_matrix
-from pyserini.search import SimpleSearcher
+from ctproc.retrieval import BM25Index, read_json_collection
 from sklearn.metrics import ndcg_score
 from collections import defaultdict
+from functools import lru_cache
 import numpy as np
 import copy
 import json
-import os
 
 """
 functions for indexing documents, ranking
@@ -15,11 +15,17 @@ functions for indexing documents, ranking
 
 
 
-def get_top_N(N, index_path, topic_text, val_ids, score_dict, topic_id, inc_or_exc, rel_dict, id2topic, search_max=1500):
-  searcher = SimpleSearcher(index_path)
-  searcher.set_bm25(0.9, 0.4)
-  #searcher.set_rm3(10, 10, 0.5)
-  hits = searcher.search(topic_text, search_max)
+@lru_cache(maxsize=None)
+def load_index(index_path):
+  # one memory mapped index per path, not a new searcher per topic
+  return BM25Index.load(index_path)
+
+
+
+def get_top_N(N, index_path, topic_text, val_ids, score_dict, topic_id, inc_or_exc, rel_dict, id2topic):
+  searcher = load_index(index_path)   # bm25(0.9, 0.4), the parameters create_indexes() built it with
+  # only val_ids are scored, so every hit is valid and none are lost past a search depth
+  hits = searcher.search(topic_text, N, candidates=val_ids)
   i = 0
   num_found = 0
   all_found = 0
@@ -140,8 +146,9 @@ def no_rel_filter_by_topic(test_rel_dict, filtered_docs_by_topic):
 
 
 
-def create_indexes(input_folder, index_folder):
-  os.system(f"sudo python -m pyserini.index -collection JsonCollection -generator DefaultLuceneDocumentGenerator -threads 1 -input {input_folder} -index {index_folder} -storePositions -storeDocvectors -storeRaw")
+def create_indexes(input_folder, index_folder, k1=0.9, b=0.4):
+  ids, texts = read_json_collection(input_folder)
+  BM25Index.build(ids, texts, k1=k1, b=b).save(index_folder)
 
 
 
@@ -210,7 +217,7 @@ def evaluate(topics, filtered_docs_by_topic, test_rel_dict, index_path, inc_or_e
   score_dict = create_score_dict(filtered_docs_by_topic) if (score_dict is None) else score_dict  # for every topic, doc pair, score
   search_rel_recalls = {"twos_recalls":[], "ones_recalls":[]}
   for topic in topics:
-    n_try = len(filtered_docs_by_topic[topic['id']]) + 2000
+    n_try = len(filtered_docs_by_topic[topic['id']])
     hits, rel_recall = get_top_N(
                               N=n_try, 
                               index_path=index_path, 
@@ -1,19 +1,68 @@
 
 import logging
 
+import os
 import re
+import gzip
+import io
 import json
+import mmap
+from json.decoder import WHITESPACE, JSONDecodeError, scanstring
 from lxml import etree
 from pathlib import Path
-from typing import Dict, List, Optional, Set, Any
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Set, Any, Tuple
 
-from .regex_patterns import EMPTY_PATTERN
+from .regex_patterns import EMPTY_PATTERN, ALL_CAPS_PATTERN, LEADING_NUMBER_PATTERN
 from .skip_crit import SKIP_CRIT
 
 
 logger = logging.getLogger(__file__)
 
-REMOVE_WORDS = ["criteria", "include", "exclude", "inclusion", "exclusion", "eligibility"]
+REMOVE_WORDS = frozenset(["criteria", "include", "exclude", "inclusion", "exclusion", "eligibility"])
+
+# check_word() verdicts of the words seen so far, criteria reuse a small vocabulary over and over
+WORD_CACHE_SIZE = 1 << 18
+_word_verdicts: Dict[str, bool] = {}
+
+# the offset index of a jsonl output is written beside it, <write_file>.offsets
+OFFSETS_SUFFIX = '.offsets'
+OFFSETS_VERSION = 1
+
+# first bytes of compressed jsonl, read through gzip or zstandard (pip install ctproc[zstd])
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# the fields of an object to keep, field -> the tree of its own fields to keep, None to keep all of it
+FieldTree = Dict[str, Optional["FieldTree"]]
+
+# arrays and objects nested up to this deep are skipped with one regex match, deeper ones bracket by bracket
+SKIP_DEPTH = 8
+
+_STRING_PATTERN = r'"[^"\\]*(?:\\.[^"\\]*)*"'
+# a run of json without brackets, strings (which can have brackets) taken whole
+_BRACKET_FREE = re.compile(r'(?:[^"\[\]{}]+|' + _STRING_PATTERN + r')*')
+_decoder = json.JSONDecoder()
+
+
+class NoProgress:
+  """
+  desc:    stands in for a tqdm bar when progress is disabled, so tqdm is never imported
+  """
+  def __init__(self, iterable: Optional[Iterable] = None) -> None:
+    self.iterable = iterable
+
+  def __iter__(self) -> Iterator:
+    return iter(self.iterable)
+
+  def __enter__(self) -> "NoProgress":
+    return self
+
+  def __exit__(self, *exc) -> None:
+    return None
+
+  def update(self, n: int = 1) -> None:
+    return None
+
 
 
 # -------------------------------------------------------------------------------------- #
@@ -31,17 +80,182 @@ def save_docs_jsonl(docs: List[Any], writefile: Path) -> None:
 
 
 
-def get_processed_data(proc_loc, get_only: Optional[Set[str]] = None) -> List[Dict[str, str]]:
+def get_processed_data(proc_loc, get_only: Optional[Set[str]] = None, fields: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+  """
+  proc_loc:    str or path to location of docs in jsonl form, optionally gzip or zstd compressed
+  get_only:    set of nct_id strings to get, read through the offset index beside proc_loc when
+               it has one (see OffsetIndex), otherwise filtered from all of the docs
+  fields:      fields of the docs to keep, see iter_processed_data(), None for all of them
+  """
+  if get_only is not None:
+    offset_index = OffsetIndex.load(proc_loc)
+    if offset_index is not None:
+      return offset_index.read(get_only, fields=fields)
+  return list(iter_processed_data(proc_loc, get_only=get_only, fields=fields))
+
+
+
+def iter_processed_data(proc_loc, get_only: Optional[Set[str]] = None, fields: Optional[Iterable[str]] = None) -> Iterator[Dict[str, Any]]:
+  """
+  proc_loc:    str or path to location of docs in jsonl form, optionally gzip or zstd compressed
+  get_only:    set of nct_id strings to get, the id of each line is read first and the rest of
+               the line only parsed for those
+  fields:      fields of the docs to keep, dotted for the fields of nested objects, e.g. 'id',
+               'elig_gender', 'elig_crit.include_criteria'. the values of the others are skipped
+               over in the line, never parsed, and a line is left once its fields have all been
+               read. 'id' is always kept. None for all of them
+  desc:        yields the docs one line at a time, memory stays that of one doc however many there are
+  returns:     the docs as dicts, in file order
+  """
+  tree = field_tree(fields) if fields is not None else None
+  id_tree: FieldTree = {'id': None}
+  with open_processed(proc_loc) as json_file:
+    for line in json_file:
+      if not line.strip():
+        continue
+      if get_only is not None and project_json(line, id_tree).get('id') not in get_only:
+        continue
+      yield json.loads(line) if tree is None else project_json(line, tree)
+
+
+
+def open_processed(proc_loc) -> IO[str]:
   """
   proc_loc:    str or path to location of docs in jsonl form
+  returns:     the file open for reading text, decompressed as it is read when it starts with the
+               gzip or zstd magic bytes
   """
-  with open(proc_loc, 'r') as json_file:
-    json_list = list(json_file)
+  with open(proc_loc, 'rb') as raw_file:
+    magic = raw_file.read(len(ZSTD_MAGIC))
 
-  doc_list = [json.loads(json_str) for json_str in json_list]
-  if get_only is not None:
-    return filter_processed_data(doc_list, get_only=get_only)
-  return doc_list
+  if magic.startswith(GZIP_MAGIC):
+    return gzip.open(proc_loc, 'rt', encoding='utf-8')
+
+  if magic == ZSTD_MAGIC:
+    try:
+      import zstandard
+    except ImportError:
+      raise ImportError(f"{proc_loc} is zstd compressed, reading it needs the zstandard package (pip install ctproc[zstd])")
+    raw_file = open(proc_loc, 'rb')
+    return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw_file, read_across_frames=True, closefd=True), encoding='utf-8')
+
+  return open(proc_loc, 'r', encoding='utf-8')
+
+
+
+def field_tree(fields: Iterable[str]) -> FieldTree:
+  """
+  fields:      dotted field names, e.g. 'elig_crit.include_criteria'
+  returns:     field -> the tree of its fields to keep, None to keep all of it, 'id' always kept
+  """
+  tree: FieldTree = {'id': None}
+  for field in fields:
+    node = tree
+    *parents, name = field.split('.')
+    for parent in parents:
+      if parent in node and node[parent] is None:
+        break
+      node = node.setdefault(parent, {})
+    else:
+      node[name] = None
+  return tree
+
+
+
+def project_json(line: str, tree: FieldTree) -> Dict[str, Any]:
+  """
+  line:        the json of an object, e.g. a line of processed docs
+  tree:        its fields to keep, see field_tree()
+  returns:     the object with only those fields, the others skipped over without being parsed
+  """
+  value, _ = _project_object(line, WHITESPACE.match(line, 0).end(), tree, stop=True)
+  return value
+
+
+
+def _project_object(s: str, i: int, tree: FieldTree, stop: bool = False) -> Tuple[Any, Optional[int]]:
+  # returns the projected object and the index past it, None past it when stop and it was left
+  # early, once every field of the tree was read
+  if s[i:i + 1] != '{':
+    return _decoder.raw_decode(s, i)
+  obj: Dict[str, Any] = {}
+  i = WHITESPACE.match(s, i + 1).end()
+  if s[i:i + 1] == '}':
+    return obj, i + 1
+  while True:
+    if s[i:i + 1] != '"':
+      raise JSONDecodeError("Expecting property name enclosed in double quotes", s, i)
+    key, i = scanstring(s, i + 1)
+    i = WHITESPACE.match(s, i).end()
+    if s[i:i + 1] != ':':
+      raise JSONDecodeError("Expecting ':' delimiter", s, i)
+    i = WHITESPACE.match(s, i + 1).end()
+    if key not in tree:
+      i = _skip_value(s, i)
+    elif tree[key] is None:
+      obj[key], i = _decoder.raw_decode(s, i)
+    else:
+      obj[key], i = _project_object(s, i, tree[key])
+    if stop and len(obj) == len(tree):
+      return obj, None
+    i = WHITESPACE.match(s, i).end()
+    delimiter = s[i:i + 1]
+    i = WHITESPACE.match(s, i + 1).end()
+    if delimiter == '}':
+      return obj, i
+    if delimiter != ',':
+      raise JSONDecodeError("Expecting ',' delimiter", s, i)
+
+
+
+def _skip_value(s: str, i: int) -> int:
+  # index past the json value at i, found by counting brackets outside of strings, nothing is
+  # parsed or validated
+  start = s[i:i + 1]
+  if start == '"':
+    # the next quote not escaped by an odd run of backslashes, found with str.find()
+    end = i
+    while True:
+      end = s.find('"', end + 1)
+      if end < 0:
+        raise JSONDecodeError("Unterminated string", s, i)
+      backslash = end
+      while s[backslash - 1] == '\\':
+        backslash -= 1
+      if (end - backslash) % 2 == 0:
+        return end + 1
+  if start not in ('[', '{'):
+    return _decoder.raw_decode(s, i)[1]
+  match = _CONTAINER.match(s, i)
+  if match is not None:
+    return match.end()
+  depth = 0
+  while i < len(s):
+    if s[i] in '[{':
+      depth += 1
+    elif s[i] in ']}':
+      depth -= 1
+      if depth == 0:
+        return i + 1
+    else:
+      break
+    i = _BRACKET_FREE.match(s, i + 1).end()
+  raise JSONDecodeError("Unterminated value", s, i)
+
+
+
+def _container_pattern(depth: int) -> str:
+  # an array or object nested at most depth deep, each level's brackets matched around runs of
+  # anything but brackets and strings taken whole. unambiguous, a match fails without backtracking
+  # over the alternatives
+  pattern = ''
+  for _ in range(depth):
+    value = _STRING_PATTERN if not pattern else f'{_STRING_PATTERN}|{pattern}'
+    pattern = r'[\[{][^"\[\]{}]*(?:(?:' + value + r')[^"\[\]{}]*)*[\]}]'
+  return pattern
+
+
+_CONTAINER = re.compile(_container_pattern(SKIP_DEPTH))
 
 
 
@@ -54,6 +268,117 @@ def filter_processed_data(docs: List[Dict[str, str]], get_only: Set[str]) -> Lis
 
 
 
+def offsets_path(proc_loc) -> Path:
+  """
+  returns:  path of the offset index of the jsonl at proc_loc
+  """
+  return Path(f"{proc_loc}{OFFSETS_SUFFIX}")
+
+
+
+class OffsetWriter:
+  """
+  outfile:      text file the jsonl is written to, opened for writing at its start with newline="\n"
+                and encoding="utf-8", so each line on disk is its utf-8 bytes and one "\n" byte
+  proc_loc:     its path, the offset index is written to offsets_path(proc_loc) on close()
+  desc:         writes one json line per doc and keeps the byte offset and length of each, by id.
+                the index is written to a temporary file and renamed into place once the jsonl is
+                complete, so an interrupted run leaves no index that is missing docs. it records the
+                size and modification time of the jsonl, an index left from an older output is
+                ignored. nothing is written for outputs that are not regular files, e.g. /dev/null
+  """
+  def __init__(self, outfile: IO[str], proc_loc) -> None:
+    self.outfile = outfile
+    self.proc_loc = proc_loc
+    self.entries: List[Tuple[str, int, int]] = []
+    self.offset = 0
+
+  def write(self, doc_id: str, line: str) -> None:
+    """
+    line:      the json of the doc, without its newline. json.dumps() escapes non ascii characters
+               by default, so its length in characters is most often its length in bytes
+    """
+    length = len(line) if line.isascii() else len(line.encode('utf-8'))
+    self.outfile.write(line)
+    self.outfile.write("\n")
+    self.entries.append((doc_id, self.offset, length))
+    self.offset += length + 1
+
+  def close(self) -> None:
+    """
+    desc:      flushes the jsonl and writes its index, call once the last doc is written
+    """
+    self.outfile.flush()
+    if not os.path.isfile(self.proc_loc):
+      return
+    stat = os.stat(self.proc_loc)
+    header = {'format_version': OFFSETS_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    path = offsets_path(self.proc_loc)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as index_file:
+      index_file.write(json.dumps(header) + "\n")
+      index_file.writelines(f"{doc_id}\t{offset}\t{length}\n" for doc_id, offset, length in self.entries)
+    os.replace(tmp_path, path)
+
+
+
+class OffsetIndex:
+  """
+  proc_loc:     path of the jsonl
+  offsets:      id -> (byte offset, length) of each of its lines with that id, in file order
+  desc:         random access to the docs of a jsonl written by CTProc.process_data() through an
+                OffsetWriter, the jsonl is memory mapped and only the lines of the ids asked
+                for are read and parsed
+  """
+  def __init__(self, proc_loc, offsets: Dict[str, List[Tuple[int, int]]]) -> None:
+    self.proc_loc = proc_loc
+    self.offsets = offsets
+
+  def __len__(self) -> int:
+    return len(self.offsets)
+
+  def __contains__(self, doc_id: str) -> bool:
+    return doc_id in self.offsets
+
+  @classmethod
+  def load(cls, proc_loc) -> Optional["OffsetIndex"]:
+    """
+    returns:   the index beside proc_loc, None when it has none or it was written for another
+               version of the file
+    """
+    path = offsets_path(proc_loc)
+    if not path.is_file():
+      return None
+    with open(path, 'r', encoding='utf-8') as index_file:
+      header = json.loads(index_file.readline())
+      stat = os.stat(proc_loc)
+      if (header.get('format_version') != OFFSETS_VERSION) or (header['size'] != stat.st_size) or (header['mtime_ns'] != stat.st_mtime_ns):
+        logger.info(f"ignoring stale offset index {path}")
+        return None
+      offsets: Dict[str, List[Tuple[int, int]]] = {}
+      for line in index_file:
+        doc_id, offset, length = line.rstrip("\n").split("\t")
+        offsets.setdefault(doc_id, []).append((int(offset), int(length)))
+    return cls(proc_loc, offsets)
+
+  def read(self, doc_ids: Iterable[str], fields: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """
+    doc_ids:   ids of the docs to read, those the jsonl doesn't have are skipped
+    fields:    fields of the docs to keep, see iter_processed_data(), None for all of them
+    returns:   the docs, in file order, as get_processed_data() would filter them
+    """
+    spans = sorted(span for doc_id in set(doc_ids) for span in self.offsets.get(doc_id, ()))
+    if not spans:
+      return []
+    tree = field_tree(fields) if fields is not None else None
+    with open(self.proc_loc, 'rb') as json_file, mmap.mmap(json_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+      lines = (mapped[offset:offset + length] for offset, length in spans)
+      if tree is None:
+        return [json.loads(line) for line in lines]
+      return [project_json(line.decode('utf-8'), tree) for line in lines]
+
+
+
 # -------------------------------------------------------------------------------------- #
 # text processing utils
 # -------------------------------------------------------------------------------------- #
@@ -73,7 +398,7 @@ def check_word(word: str, words_to_remove: Set[str] = REMOVE_WORDS) -> bool:
   w = word.strip(":-,") 
 
   # ex. DISEASE
-  if re.match(r'[A-Z][A-Z][A-Z][A-Z][A-Z][A-Z]+(?: [A-Z]+)?', w):
+  if ALL_CAPS_PATTERN.match(w):
     return False
 
   if w.lower() in words_to_remove:
@@ -81,6 +406,19 @@ def check_word(word: str, words_to_remove: Set[str] = REMOVE_WORDS) -> bool:
 
   return True
 
+
+
+def keep_word(word: str) -> bool:
+  """
+  desc:    check_word() with the default words to remove, cached by word
+  """
+  verdict = _word_verdicts.get(word)
+  if verdict is None:
+    if len(_word_verdicts) >= WORD_CACHE_SIZE:
+      _word_verdicts.clear()
+    verdict = _word_verdicts[word] = check_word(word)
+  return verdict
+
   
 
 def fix_sentence(sent: str) -> str:
@@ -90,11 +428,14 @@ def fix_sentence(sent: str) -> str:
   returns: a list of sentences without filler information (not necessarily one criteria per sent however)
   """
   #include_pattern = re.compile(".*(?:(?:(?:[Ee]|[Ii])(?:(?:x|n)(?:clu(?:(?:de)|(?:sion))))|(?:(?:ne)?ligibility))(?: criteria)? (.*)")
-  return ' '.join([w for w in sent.split() if check_word(w)]).strip('.,;:')
+  return ' '.join([w for w in sent.split() if keep_word(w)]).strip('.,;:')
  
 
 def remove_leading_number(s: str) -> str:
-  m = re.match(r'\d+. *(?P<crit>.*)', s)
+  # only a decimal digit (what \d matches) can start a match
+  if not s[:1].isdecimal():
+    return s
+  m = LEADING_NUMBER_PATTERN.match(s)
   if m is not None:
     s = m['crit']
   return s
@@ -105,15 +446,37 @@ def clean_sentences(sent_list: List[str]):
   sent_list:   list of sentence strings
   desc:        removes a bunch of large spaces and newline characters from the text 
   """
-  new_sents = []
-  for sent in sent_list:
-    for s in re.split(r"- ", sent):
-      s = fix_sentence(s)
-      s = remove_leading_number(s)
-      if len(s) > 2 and s not in SKIP_CRIT:
-        new_sents.append(s)
+  return clean_sentences_batch([sent_list])[0]
+
 
-  return new_sents
+
+def clean_sentences_batch(sent_lists: Iterable[List[str]]) -> List[List[str]]:
+  """
+  sent_lists:  lists of sentence strings, e.g. the inclusion and exclusion criteria of a doc
+  returns:     clean_sentences() of each list, in one pass with the cleaning steps inlined
+  """
+  verdicts = _word_verdicts
+  cleaned = []
+  for sent_list in sent_lists:
+    new_sents = []
+    for sent in sent_list:
+      for s in sent.split("- "):
+        words = s.split()
+        kept = []
+        for w in words:
+          verdict = verdicts.get(w)
+          if verdict is None:
+            verdict = keep_word(w)
+          if verdict:
+            kept.append(w)
+        s = ' '.join(kept).strip('.,;:')
+        if s[:1].isdecimal():
+          s = remove_leading_number(s)
+        if len(s) > 2 and s not in SKIP_CRIT:
+          new_sents.append(s)
+    cleaned.append(new_sents)
+
+  return cleaned
   
 
 
@@ -0,0 +1,68 @@
+import pickle
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from ctproc.alias_table import AliasTable, build_alias_table
+from ctproc.ctbase import CTBase, NLPTools
+
+
+KB = {
+    'C0032961': ['Pregnancy', 'Gestation', 'Pregnant'],
+    'C0008059': ['Child', 'Children'],
+    'C0011849': ['Diabetes Mellitus'],
+    'C0000001': [],
+    'C0042812': ['Acuity, Visual', 'Sehschärfe', 'Resolving power of eye'],
+}
+
+
+class TestAliasTable(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name, 'aliases.bin')
+        self.assertEqual(build_alias_table(KB.items(), self.path, max_aliases=2), len(KB))
+        self.table = AliasTable(self.path)
+
+    def tearDown(self):
+        del self.table
+        self.tmp.cleanup()
+
+    def test_lookup(self):
+        self.assertEqual(len(self.table), len(KB))
+        self.assertEqual(self.table.max_aliases, 2)
+        for cui, aliases in KB.items():
+            self.assertEqual(self.table.get(cui), aliases[:2], cui)
+            self.assertEqual(self.table.get(cui, 1), aliases[:1], cui)
+
+    def test_unicode(self):
+        self.assertEqual(self.table.get('C0042812'), ['Acuity, Visual', 'Sehschärfe'])
+
+    def test_missing(self):
+        self.assertIsNone(self.table.get('C9999999'))
+        self.assertIsNone(self.table.get('C00328'))
+        self.assertIsNone(self.table.get('C00329610000'))
+        self.assertNotIn('C9999999', self.table)
+        self.assertIn('C0000001', self.table)
+
+    def test_pickles_as_path(self):
+        table = pickle.loads(pickle.dumps(self.table))
+        self.assertEqual(table.get('C0008059'), ['Child', 'Children'])
+
+    def test_rejects_other_files(self):
+        other = Path(self.tmp.name, 'other.bin')
+        other.write_bytes(b'\0' * 64)
+        with self.assertRaises(ValueError):
+            AliasTable(other)
+
+    def test_entities_read_table_before_kb(self):
+        kb = {'C0032961': SimpleNamespace(aliases=['from kb']), 'C1111111': SimpleNamespace(aliases=['only in kb', 'x', 'y'])}
+        linker = SimpleNamespace(kb=SimpleNamespace(cui_to_entity=kb))
+        base = CTBase('1', NLPTools(NLP=None, linker=linker, STOP_WORDS=set(), alias_table=self.table))
+        self.assertEqual(base.get_aliases('C0032961', 2), ['Pregnancy', 'Gestation'])
+        self.assertEqual(base.get_aliases('C1111111', 2), ['only in kb', 'x'])
+
+
+if __name__ == "__main__":
+    unittest.main()
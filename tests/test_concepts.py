@@ -0,0 +1,268 @@
+import json
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+from ctproc.concepts import ConceptIndex, ConceptMatrices, ExclusionScreen, TopicMatrix, doc_concepts, topic_concepts
+from ctproc.ctbase import CTEntity
+from tests.test_doc import test_doc
+
+
+def make_cuis(n_cuis):
+    return [f"C{i:07d}" for i in range(n_cuis)]
+
+
+CUIS = make_cuis(300)
+
+
+def random_entity(rng, cuis=CUIS):
+    # cuis drawn skewed, so some are in many trials and most in few
+    cui = cuis[min(int(rng.expovariate(8 / len(cuis))), len(cuis) - 1)]
+    return CTEntity(
+        raw_text=cui.lower(), label="ENTITY", start=0, end=len(cui),
+        cui={'val': cui, 'score': round(rng.uniform(0.7, 1.0), 4)}, alias_expansion=[], negation=rng.random() < 0.2,
+    )
+
+
+def random_ent_sents(rng, cuis=CUIS, max_sents=6):
+    return [[random_entity(rng, cuis) for _ in range(rng.randint(0, 5))] for _ in range(rng.randint(0, max_sents))]
+
+
+def random_concept_docs_and_topics(n_docs, n_topics, seed=0, cuis=CUIS):
+    # docs and topics as dicts, their entities as json writes them (lists) like utils.get_processed_data()
+    # reads them back
+    rng = random.Random(seed)
+    docs = [{'id': f"NCT{i:08d}", 'inc_ents': random_ent_sents(rng, cuis), 'exc_ents': random_ent_sents(rng, cuis)} for i in range(n_docs)]
+    topics = [{'id': str(i), 'ent_sents': random_ent_sents(rng, cuis, max_sents=10)} for i in range(n_topics)]
+    return json.loads(json.dumps(docs)), json.loads(json.dumps(topics))
+
+
+def loop_candidates(docs, topics, match='any', exclude=True):
+    # the string scan of include_cuis / exclude_cuis the index replaces
+    result = {}
+    for topic in topics:
+        cuis = {concept.cui for concept in topic_concepts(topic)}
+        found = []
+        for doc in docs:
+            include_cuis = set(" ".join(concept.cui for concept in doc_concepts(doc, 'include')).split())
+            exclude_cuis = set(" ".join(concept.cui for concept in doc_concepts(doc, 'exclude')).split())
+            hit = bool(cuis & include_cuis) if match == 'any' else bool(cuis) and cuis <= include_cuis
+            if hit and not (exclude and cuis & exclude_cuis):
+                found.append(doc['id'])
+        result[topic['id']] = found
+    return result
+
+
+def best_scores(concepts):
+    best = {}
+    for concept in concepts:
+        best[concept.cui] = max(best.get(concept.cui, 0.), concept.score)
+    return best
+
+
+def loop_concept_scores(docs, topics, criteria='include'):
+    # the python overlap of topic and trial cuis, one pair at a time
+    scores = {}
+    for topic in topics:
+        topic_scores = best_scores(topic_concepts(topic))
+        for doc in docs:
+            doc_scores = best_scores(doc_concepts(doc, criteria))
+            shared = topic_scores.keys() & doc_scores.keys()
+            if shared:
+                scores[topic['id'], doc['id']] = sum(topic_scores[cui] * doc_scores[cui] for cui in shared)
+    return scores
+
+
+def loop_screen(docs, topics):
+    # each topic against each trial's exclusion criteria, one mention at a time
+    result = {}
+    for topic in topics:
+        affirmed = {concept.cui for concept in topic_concepts(topic) if not concept.negation}
+        result[topic['id']] = [
+            doc['id'] for doc in docs
+            if not any(concept.cui in affirmed and not concept.negation for concept in doc_concepts(doc, 'exclude'))
+        ]
+    return result
+
+
+class TestConcepts(unittest.TestCase):
+
+    def test_entity_forms(self):
+        as_dicts = json.loads(json.dumps(test_doc.__dict__, default=lambda o: o.__dict__))
+        self.assertEqual(doc_concepts(as_dicts, 'include'), doc_concepts(test_doc, 'include'))
+        self.assertEqual([concept.cui for concept in doc_concepts(test_doc, 'exclude')], ['C0205409', 'C0442887'])
+        filtered = test_doc.get_filtered_doc_as_dict()
+        self.assertEqual(filtered['include_cuis'], 'C4288071 C0149721')
+        self.assertEqual([concept.cui for concept in doc_concepts(filtered, 'include')], ['C4288071', 'C0149721'])
+        self.assertEqual(doc_concepts({'id': 'x'}, 'include'), [])
+
+
+class TestConceptIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.docs, cls.topics = random_concept_docs_and_topics(500, 30)
+        cls.index = ConceptIndex.from_docs(cls.docs)
+
+    def assertCandidates(self, found, expected):
+        self.assertEqual({topic_id: list(ids) for topic_id, ids in found.items()}, expected)
+
+    def test_matches_loop(self):
+        for match in ('any', 'all'):
+            for exclude in (True, False):
+                found = self.index.query_topics(self.topics, match=match, exclude=exclude)
+                self.assertCandidates(found, loop_candidates(self.docs, self.topics, match, exclude))
+
+    def test_set_operations(self):
+        cuis = CUIS[:3] + ["C9999999"]
+        include = [{concept.cui for concept in doc_concepts(doc, 'include')} for doc in self.docs]
+        exclude = [{concept.cui for concept in doc_concepts(doc, 'exclude')} for doc in self.docs]
+        union = self.index.union(cuis)
+        self.assertEqual(list(union), [i for i, doc_cuis in enumerate(include) if doc_cuis & set(cuis)])
+        self.assertEqual(list(self.index.intersection(CUIS[:2])), [i for i, doc_cuis in enumerate(include) if set(CUIS[:2]) <= doc_cuis])
+        self.assertEqual(len(self.index.intersection(cuis)), 0)
+        self.assertEqual(len(self.index.intersection([])), 0)
+        self.assertEqual(list(self.index.difference(union, CUIS[:5])), [i for i in union if not exclude[i] & set(CUIS[:5])])
+        self.assertTrue(np.all(np.diff(self.index.postings(CUIS[0])) > 0))
+
+    def test_filtered_docs(self):
+        filtered = [
+            {'nct_id': doc['id'], 'include_cuis': " ".join(c.cui for c in doc_concepts(doc, 'include')), 'exclude_cuis': " ".join(c.cui for c in doc_concepts(doc, 'exclude'))}
+            for doc in self.docs
+        ]
+        index = ConceptIndex.from_docs(filtered)
+        self.assertCandidates(index.query_topics(self.topics), loop_candidates(self.docs, self.topics))
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.index.save(tmp)
+            for mapped in (True, False):
+                loaded = ConceptIndex.load(tmp, mmap=mapped)
+                self.assertEqual(loaded.cuis, self.index.cuis)
+                for match in ('any', 'all'):
+                    expected = self.index.query_topics(self.topics, match=match)
+                    self.assertCandidates(loaded.query_topics(self.topics, match=match), {topic_id: list(ids) for topic_id, ids in expected.items()})
+
+    def test_empty(self):
+        index = ConceptIndex.from_docs([])
+        self.assertEqual(index.query([["C0000001"]]).shape, (1, 0))
+        with tempfile.TemporaryDirectory() as tmp:
+            index.save(tmp)
+            self.assertEqual(len(ConceptIndex.load(tmp)), 0)
+
+    def test_bad_arguments(self):
+        with self.assertRaises(ValueError):
+            self.index.query([CUIS[:2]], match='some')
+        with self.assertRaises(ValueError):
+            self.index.postings(CUIS[0], criteria='inclusion')
+
+
+class TestConceptMatrices(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.docs, cls.topics = random_concept_docs_and_topics(400, 25, seed=1)
+        cls.matrices = ConceptMatrices.from_docs(cls.docs)
+
+    def as_dict(self, topics, scores):
+        scores = scores.tocoo()
+        return {(topics.topic_ids[row], self.matrices.trial_ids[col]): score for row, col, score in zip(scores.row, scores.col, scores.data)}
+
+    def assertScores(self, found, expected):
+        self.assertEqual(found.keys(), expected.keys())
+        for key, score in expected.items():
+            self.assertAlmostEqual(found[key], score, places=5)
+
+    def test_matches_loop(self):
+        topics = self.matrices.topic_matrix(self.topics)
+        self.assertEqual(topics.topic_ids, [topic['id'] for topic in self.topics])
+        for criteria in ('include', 'exclude'):
+            found = self.as_dict(topics, self.matrices.scores(topics, criteria))
+            self.assertScores(found, loop_concept_scores(self.docs, self.topics, criteria))
+
+    def test_cosine(self):
+        topics = self.matrices.topic_matrix(self.topics)
+        found = self.as_dict(topics, self.matrices.scores(topics, cosine=True))
+        for (topic_id, trial_id), score in self.as_dict(topics, self.matrices.scores(topics)).items():
+            topic_norm = np.linalg.norm(list(best_scores(topic_concepts(self.topics[int(topic_id)])).values()))
+            doc = self.docs[int(trial_id[3:])]
+            doc_norm = np.linalg.norm(list(best_scores(doc_concepts(doc, 'include')).values()))
+            self.assertAlmostEqual(found[topic_id, trial_id], score / topic_norm / doc_norm, places=5)
+        self.assertTrue(all(score <= 1 + 1e-6 for score in found.values()))
+
+    def test_shared_vocabulary(self):
+        self.assertEqual(self.matrices.cuis, sorted(self.matrices.cuis))
+        self.assertEqual(self.matrices.include.shape[1], self.matrices.exclude.shape[1])
+        unknown = {'id': 'x', 'ent_sents': [[{'cui': {'val': 'C9999999', 'score': 1.}, 'negation': False}]]}
+        self.assertEqual(self.matrices.topic_matrix([unknown]).matrix.nnz, 0)
+        other = ConceptMatrices.from_docs(self.docs[:10])
+        with self.assertRaises(ValueError):
+            other.scores(self.matrices.topic_matrix(self.topics))
+
+    def test_save_load(self):
+        topics = self.matrices.topic_matrix(self.topics)
+        with tempfile.TemporaryDirectory() as tmp:
+            self.matrices.save(f"{tmp}/trials")
+            topics.save(f"{tmp}/topics")
+            matrices = ConceptMatrices.load(f"{tmp}/trials")
+            loaded_topics = TopicMatrix.load(f"{tmp}/topics")
+        self.assertEqual(loaded_topics.topic_ids, topics.topic_ids)
+        for criteria in ('include', 'exclude'):
+            expected = self.matrices.scores(topics, criteria)
+            self.assertEqual((matrices.scores(loaded_topics, criteria) != expected).nnz, 0)
+
+    def test_empty(self):
+        matrices = ConceptMatrices.from_docs([])
+        self.assertEqual(matrices.scores(matrices.topic_matrix(self.topics)).shape, (len(self.topics), 0))
+
+
+class TestExclusionScreen(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.docs, cls.topics = random_concept_docs_and_topics(400, 25, seed=2)
+        cls.screen = ExclusionScreen.from_docs(cls.docs)
+
+    def test_matches_loop(self):
+        found = self.screen.query_topics(self.topics)
+        self.assertEqual({topic_id: list(ids) for topic_id, ids in found.items()}, loop_screen(self.docs, self.topics))
+        self.assertTrue(any(len(ids) < len(self.docs) for ids in found.values()))
+
+    def test_negation(self):
+        def entity(cui, negation):
+            return CTEntity('x', 'ENTITY', 0, 1, {'val': cui, 'score': 1.}, [], negation)
+        docs = [
+            {'id': 'stroke', 'exc_ents': [[entity('C1', False)]]},
+            {'id': 'no stroke', 'exc_ents': [[entity('C1', True)]]},
+            {'id': 'unknown', 'exc_ents': [[entity('C1', None)]]},
+            {'id': 'other', 'exc_ents': [[entity('C2', False)]]},
+        ]
+        screen = ExclusionScreen.from_docs(docs)
+        self.assertEqual(screen.affirmed.toarray().tolist(), [[True, False], [False, False], [True, False], [False, True]])
+        self.assertEqual(screen.negated.toarray().tolist(), [[False, False], [True, False], [False, False], [False, False]])
+        topics = [
+            {'id': 'has stroke', 'ent_sents': [[entity('C1', False)]]},
+            {'id': 'no stroke', 'ent_sents': [[entity('C1', True)]]},
+            {'id': 'nothing', 'ent_sents': []},
+        ]
+        found = screen.query_topics(topics)
+        self.assertEqual(list(found['has stroke']), ['no stroke', 'other'])
+        self.assertEqual(list(found['no stroke']), ['stroke', 'no stroke', 'unknown', 'other'])
+        self.assertEqual(list(found['nothing']), ['stroke', 'no stroke', 'unknown', 'other'])
+        _, affirmed, negated = screen.topic_matrices(topics)
+        self.assertEqual((affirmed.nnz, negated.nnz), (1, 1))
+
+    def test_candidates(self):
+        rng = random.Random(3)
+        ids = [doc['id'] for doc in self.docs]
+        candidates = {topic['id']: rng.sample(ids, 100) + ['NCT_unknown'] for topic in self.topics}
+        expected = loop_screen(self.docs, self.topics)
+        found = self.screen.query_topics(self.topics, candidates)
+        for topic_id, trial_ids in found.items():
+            self.assertEqual(list(trial_ids), [trial_id for trial_id in expected[topic_id] if trial_id in candidates[topic_id]])
+
+
+if __name__ == "__main__":
+    unittest.main()
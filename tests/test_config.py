@@ -44,6 +44,14 @@ class TestCTConfig(unittest.TestCase):
         cfg = CTConfig(data_path="test.zip", skip_ids={"NCT00154479"})
         self.assertIn("NCT00154479", cfg.skip_ids)
 
+    def test_positional_fields_kept(self):
+        # fields added since are appended after trec_or_kz, the positions of the original ones don't move
+        original = ('data_path', 'id_to_print', 'nlp', 'write_file', 'max_trials', 'start', 'get_only', 'skip_ids',
+                    'disable_tqdm', 'remove_stops', 'add_ents', 'max_aliases', 'expand', 'concat', 'is_topic', 'trec_or_kz')
+        self.assertEqual(CTConfig._fields[:len(original)], original)
+        cfg = CTConfig("test.zip", None, False, Path("out.jsonl"), 10)
+        self.assertEqual(cfg.max_trials, 10)
+
     def test_is_namedtuple(self):
         cfg = CTConfig(data_path="test.zip")
         self.assertIsInstance(cfg, tuple)
@@ -0,0 +1,94 @@
+import random
+import re
+import unittest
+from pathlib import Path
+from zipfile import ZipFile
+
+from lxml import etree
+
+from ctproc.eligibility import process_eligibility_naive, split_exc_headers
+from ctproc.regex_patterns import EXC_HEADER_PATTERN
+from ctproc.utils import clean_sentences
+from tests import test_elig
+
+
+test_doc_folder_path = Path(__file__).parent.joinpath("ct_doc_test_data.zip").as_posix()
+
+
+def legacy_process_eligibility_naive(elig_text):
+    """the nested re.split version process_eligibility_naive replaced"""
+    inc_crit, exc_crit = [], []
+    for h, chunk in enumerate(re.split(r'(?:[Ee]xclu(?:de|sion) criteria:?)|(?:[Ii]neligibility [Cc]riteria:?)', elig_text, flags=re.IGNORECASE)):
+        for s in re.split(r'\n\n', chunk):
+            for ss in re.split(r'- ', s):
+                ss = re.sub(r'\n   +', ' ', ss).strip()
+                if len(ss) > 0:
+                    if h == 0:
+                        inc_crit.append(ss)
+                    else:
+                        exc_crit.append(ss)
+    return clean_sentences(inc_crit), clean_sentences(exc_crit)
+
+
+def corpus_textblocks():
+    with ZipFile(test_doc_folder_path) as zf:
+        for name in zf.namelist():
+            if name.endswith('xml'):
+                el = etree.fromstring(zf.read(name)).find('eligibility/criteria/textblock')
+                if el is not None:
+                    yield el.text
+
+
+# pieces that exercise every separator, their near misses, and case folding quirks
+FUZZ_PIECES = [
+    'Exclusion Criteria:', 'exclusion criteria', 'EXCLUDE CRITERIA:', 'Ineligibility Criteria', 'ineligibility criteria:',
+    'eXcLuDe CrItErIa', 'INELIGIBILITY CRITERIA:', 'exclusion criteriacriteria', 'ineligibility exclusion criteria',
+    'Inclusion Criteria:', 'exclusion  criteria', 'excluſion criteria', 'EXCLUSİON CRİTERİA', 'ıneligibility criteria',
+    'Exclusion\ncriteria', 'criteria', 'CRITERIA:', 'exclu', 'sion ',
+    '\n\n', '\n', '\n\n\n', '- ', '-', ' -  ', '--', '\n    ', '\n   ', '\n  ', '   ', ' ',
+    'age 18', 'pregnant', '1.', '12) ', 'or', 'the', 'patients with diabetes', ':', 'x',
+]
+
+
+class TestEligibility(unittest.TestCase):
+
+    def test_fixtures(self):
+        raw_texts = [value for name, value in vars(test_elig).items() if name.endswith('_raw')]
+        self.assertGreater(len(raw_texts), 5)
+        for text in raw_texts + ['', '   ', 'Exclusion Criteria:']:
+            self.assertEqual(process_eligibility_naive(text), legacy_process_eligibility_naive(text))
+
+
+    def test_corpus_parity(self):
+        n = 0
+        for text in corpus_textblocks():
+            self.assertEqual(process_eligibility_naive(text), legacy_process_eligibility_naive(text))
+            n += 1
+        self.assertGreater(n, 0)
+
+
+    def test_fuzz_parity(self):
+        rng = random.Random(0)
+        for _ in range(2000):
+            text = ''.join(rng.choice(FUZZ_PIECES) for _ in range(rng.randint(0, 40)))
+            self.assertEqual(process_eligibility_naive(text), legacy_process_eligibility_naive(text), repr(text))
+
+
+    def test_split_exc_headers(self):
+        rng = random.Random(1)
+        for ascii_only in [True, False]:
+            pieces = [p for p in FUZZ_PIECES if p.isascii() or not ascii_only]
+            for _ in range(2000):
+                text = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 40)))
+                self.assertEqual(split_exc_headers(text), EXC_HEADER_PATTERN.split(text), repr(text))
+
+
+    def test_exclusion_after_first_header(self):
+        inc, exc = process_eligibility_naive('Inclusion Criteria:\n\n- adults\n\nExclusion Criteria:\n\n- children\n\nexclusion criteria\n\n- pregnancy')
+        self.assertEqual(inc, ['adults'])
+        self.assertEqual(exc, ['children', 'pregnancy'])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
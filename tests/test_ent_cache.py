@@ -0,0 +1,172 @@
+import copy
+import tempfile
+import unittest
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from ctproc.ctbase import CTEntity, ParsedText
+from ctproc.ent_cache import TOUCH_BATCH, EntityCache, normalize_text, remap_parsed, serialize_parsed
+
+from . import test_nlp_batch
+
+
+def _parsed(text):
+    ent = CTEntity(raw_text=text, label='ENTITY', start=0, end=len(text), cui={'val': 'C0032961', 'score': 0.75},
+                   alias_expansion=['pregnancy', 'gestation'], negation=True)
+    return ParsedText(sents=[text], ents=[ent])
+
+
+def _put_from_worker(cache, text):
+    cache.put_many({('v', text): _parsed(text)})
+    return cache.get_many([('v', 'shared')])[('v', 'shared')].sents
+
+
+class TestEntityCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name, 'ents.sqlite')
+        self.cache = EntityCache(self.path, version='model-1')
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        self.cache.put_many({('v', 'Pregnant women'): _parsed('Pregnant women')})
+        got = self.cache.get_many([('v', 'Pregnant women'), ('v', 'Children')])
+        self.assertEqual(got, {('v', 'Pregnant women'): _parsed('Pregnant women')})
+        self.assertIsInstance(got[('v', 'Pregnant women')].ents[0], CTEntity)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(self.cache.hit_rate(), 0.5)
+
+    def test_key_covers_variant_and_version(self):
+        self.cache.put_many({('v', 'Children'): _parsed('Children')})
+        self.assertEqual(self.cache.get_many([('other', 'Children')]), {})
+        self.assertEqual(self.cache.get_many([('v', 'Child')]), {})
+        other_model = EntityCache(self.path, version='model-2')
+        self.assertEqual(other_model.get_many([('v', 'Children')]), {})
+        other_model.close()
+
+    def test_shared_between_runs(self):
+        self.cache.put_many({('v', 'Children'): _parsed('Children')})
+        self.cache.close()
+        reopened = EntityCache(self.path, version='model-1')
+        self.assertIn(('v', 'Children'), reopened.get_many([('v', 'Children')]))
+        self.assertEqual(reopened.stats()['total_hits'], 1)
+        reopened.close()
+
+    def test_shared_between_processes(self):
+        self.cache.put_many({('v', 'shared'): _parsed('shared')})
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            results = list(pool.map(_put_from_worker, [self.cache] * 4, [f'text {i}' for i in range(4)]))
+        self.assertEqual(results, [['shared']] * 4)
+        self.assertEqual(len(self.cache.get_many([('v', f'text {i}') for i in range(4)])), 4)
+
+    def test_evicts_least_recently_used(self):
+        one_entry = len(serialize_parsed(_parsed('text 00'), 'text 00'))
+        cache = EntityCache(Path(self.tmp.name, 'small.sqlite'), version='model-1', max_bytes=10 * one_entry)
+        for i in range(10):
+            cache.put_many({('v', f'text {i:02d}'): _parsed(f'text {i:02d}')})
+        cache.get_many([('v', 'text 00')])   # refresh the oldest entry
+        cache.put_many({('v', 'text 10'): _parsed('text 10')})
+
+        self.assertLessEqual(cache.total_bytes(), 10 * one_entry)
+        self.assertIn(('v', 'text 00'), cache.get_many([('v', 'text 00')]))
+        self.assertEqual(cache.get_many([('v', 'text 01')]), {})
+        self.assertIn(('v', 'text 10'), cache.get_many([('v', 'text 10')]))
+        cache.close()
+
+
+class TestNormalizedKeys(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = EntityCache(Path(self.tmp.name, 'ents.sqlite'), version='model-1')
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def test_normalize_text(self):
+        self.assertEqual(normalize_text("  Pregnant\n\tWomen  or  Infants "), "pregnant women or infants")
+        self.assertEqual(normalize_text("Pregnant\n\tWomen"), "pregnant women")
+        self.assertEqual(len(normalize_text("İ")), 1)
+
+    def test_variant_hits_with_its_own_offsets(self):
+        text = "History of  Stroke or MI"
+        ents = [
+            CTEntity('Stroke', 'ENTITY', 12, 18, {'val': 'C0038454', 'score': 0.9}, ['CVA'], False),
+            CTEntity('MI', 'ENTITY', 22, 24, {'val': 'C0027051', 'score': 0.8}, [], None),
+        ]
+        self.cache.put_many({('v', text): ParsedText(sents=[text], ents=ents)})
+
+        variant = "  history of stroke\nor mi "
+        got = self.cache.get_many([('v', variant), ('v', text)])
+        self.assertEqual(got[('v', text)], ParsedText(sents=[text], ents=ents))
+        moved = got[('v', variant)]
+        self.assertEqual(moved.sents, ["history of stroke\nor mi"])
+        self.assertEqual([(ent.raw_text, variant[ent.start:ent.end], ent.cui['val']) for ent in moved.ents],
+                         [('stroke', 'stroke', 'C0038454'), ('mi', 'mi', 'C0027051')])
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 0))
+
+    def test_remap_needs_kept_characters(self):
+        # a span starting on stripped whitespace can't be placed in the variant
+        ent = CTEntity(' x', 'ENTITY', 0, 2, {'val': 'C1', 'score': 1.}, [], None)
+        self.assertIsNone(remap_parsed(ParsedText(sents=[], ents=[ent]), " x", "x"))
+
+    def test_lookups_only_read(self):
+        self.cache.put_many({('v', 'Children'): _parsed('Children')})
+        writes = []
+        self.cache.conn.set_trace_callback(lambda statement: writes.append(statement) if not statement.startswith('SELECT') else None)
+        for _ in range(10):
+            self.cache.get_many([('v', 'Children'), ('v', 'Adults')])
+        self.assertEqual(writes, [])
+        self.cache.conn.set_trace_callback(None)
+        self.assertEqual((self.cache.stats()['total_hits'], self.cache.stats()['total_misses']), (10, 10))
+
+    def test_last_used_written_in_batches(self):
+        self.cache.put_many({('v', f'text {i}'): _parsed(f'text {i}') for i in range(TOUCH_BATCH)})
+        before = dict(self.cache.conn.execute("SELECT key, last_used FROM ents"))
+        self.cache.get_many([('v', f'text {i}') for i in range(TOUCH_BATCH - 1)])
+        self.assertEqual(dict(self.cache.conn.execute("SELECT key, last_used FROM ents")), before)
+        self.cache.get_many([('v', f'text {TOUCH_BATCH - 1}')])
+        after = dict(self.cache.conn.execute("SELECT key, last_used FROM ents"))
+        self.assertTrue(all(after[key] > used for key, used in before.items()))
+
+
+class TestCachedTransform(test_nlp_batch.TestBatchedNLP):
+    # the batching tests again, with every lookup going through the cache
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        cache = EntityCache(Path(self.tmp.name, 'ents.sqlite'), version='fake')
+        self.proc.nlp_tools = self.proc.nlp_tools._replace(ent_cache=cache)
+        for doc in self.docs:
+            doc.nlp_tools = self.proc.nlp_tools
+
+    def tearDown(self):
+        self.proc.nlp_tools.ent_cache.close()
+        self.tmp.cleanup()
+
+    def test_second_pass_skips_pipeline(self):
+        first = list(self.proc.transform_ct_objects(copy.copy(doc) for doc in self.docs))
+        nlp = self.proc.nlp_tools.NLP
+        n_pipes = nlp.n_pipes
+
+        second = list(self.proc.transform_ct_objects(copy.copy(doc) for doc in self.docs))
+        self.assertEqual([doc.inc_ents for doc in second], [doc.inc_ents for doc in first])
+        self.assertEqual([doc.exc_ents for doc in second], [doc.exc_ents for doc in first])
+        self.assertEqual(nlp.n_pipes, n_pipes)
+        self.assertEqual(nlp.n_calls, 0)
+        self.assertGreater(self.proc.nlp_tools.ent_cache.hits, 0)
+
+    def test_unbatched_path_uses_cache(self):
+        list(self.proc.transform_ct_objects(copy.copy(doc) for doc in self.docs))
+        self.proc.transform_ct_object(copy.copy(self.docs[0]))
+        self.assertEqual(self.proc.nlp_tools.NLP.n_calls, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
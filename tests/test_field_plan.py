@@ -0,0 +1,110 @@
+import io
+import unittest
+from pathlib import Path
+from zipfile import ZipFile
+
+from lxml import etree
+
+from ctproc.field_plan import CT_DOC_FIELDS, FieldExtractor, FieldPlan, FieldSpec
+
+
+test_doc_folder_path = Path(__file__).parent.joinpath("ct_doc_test_data.zip").as_posix()
+
+
+def per_field_lookup(xml_bytes, fields=CT_DOC_FIELDS):
+    """the find/findall lookups process_ct_doc_file did before the field plan"""
+    root = etree.parse(io.BytesIO(xml_bytes)).getroot()
+    result = {}
+    for name, spec in fields.items():
+        if spec.multi:
+            result[name] = [el.text for el in root.findall(spec.path)]
+        else:
+            el = root.find(spec.path)
+            result[name] = None if el is None else el.text
+    return result
+
+
+SMALL_DOC = b"""<?xml version="1.0" encoding="UTF-8"?>
+<clinical_study>
+  <id_info><org_study_id>x</org_study_id><nct_id>NCT00000001</nct_id></id_info>
+  <condition>Asthma</condition>
+  <condition>COPD &amp; Emphysema</condition>
+  <intervention>
+    <intervention_type>Drug</intervention_type>
+    <intervention_name>Albuterol</intervention_name>
+  </intervention>
+  <intervention>
+    <intervention_type>Device</intervention_type>
+    <intervention_name><![CDATA[Inhaler <spacer>]]></intervention_name>
+  </intervention>
+  <eligibility>
+    <criteria>
+      <textblock>
+        Inclusion Criteria:
+
+          -  adults<!-- a comment ends element.text -->and more
+      </textblock>
+    </criteria>
+    <gender>All</gender>
+    <minimum_age>18 Years</minimum_age>
+  </eligibility>
+  <location><facility><name>A</name></facility></location>
+</clinical_study>
+"""
+
+
+class TestFieldExtractorParity(unittest.TestCase):
+
+    def setUp(self):
+        self.extractor = FieldExtractor(FieldPlan())
+
+    def test_test_corpus(self):
+        with ZipFile(test_doc_folder_path) as zf:
+            names = [n for n in zf.namelist() if n.endswith('xml')]
+            self.assertGreater(len(names), 0)
+            for name in names:
+                xml_bytes = zf.read(name)
+                with zf.open(name) as f:
+                    self.assertEqual(self.extractor.extract(f), per_field_lookup(xml_bytes), name)
+
+    def test_small_doc(self):
+        fields = self.extractor.extract(io.BytesIO(SMALL_DOC))
+        self.assertEqual(fields, per_field_lookup(SMALL_DOC))
+        self.assertEqual(fields['condition'], ['Asthma', 'COPD & Emphysema'])
+        self.assertEqual(fields['intervention_name'], ['Albuterol', 'Inhaler <spacer>'])
+        self.assertIsNone(fields['maximum_age'])
+
+    def test_nested_wanted_paths(self):
+        fields = {'outer': FieldSpec('a', multi=True), 'inner': FieldSpec('a/b', multi=True)}
+        xml = b"<r><a>x<b>y</b>z</a><a/></r>"
+        extractor = FieldExtractor(FieldPlan(fields))
+        self.assertEqual(extractor.extract(io.BytesIO(xml)), per_field_lookup(xml, fields))
+
+    def test_parser_reused_across_docs(self):
+        for _ in range(3):
+            self.assertEqual(self.extractor.extract(io.BytesIO(SMALL_DOC)), per_field_lookup(SMALL_DOC))
+
+
+class TestEarlyStop(unittest.TestCase):
+
+    def test_stops_after_eligibility(self):
+        # everything after <location> is garbage, it must never be parsed
+        truncated = SMALL_DOC.split(b"<location>")[0] + b"<location><broken"
+        extractor = FieldExtractor(FieldPlan(), chunk_size=64)
+        fields = extractor.extract(io.BytesIO(truncated))
+        self.assertEqual(fields, per_field_lookup(SMALL_DOC))
+
+    def test_stops_reading_member(self):
+        tail = b"<location><facility><name>x</name></facility></location>" * 5000
+        xml = SMALL_DOC.replace(b"</clinical_study>", tail + b"</clinical_study>")
+        reader = io.BytesIO(xml)
+        FieldExtractor(FieldPlan(), chunk_size=256).extract(reader)
+        self.assertLess(reader.tell(), len(xml) // 10)
+
+    def test_malformed_complete_doc_raises(self):
+        with self.assertRaises(etree.XMLSyntaxError):
+            FieldExtractor(FieldPlan()).extract(io.BytesIO(b"<clinical_study><id_info><nct_id>N"))
+
+
+if __name__ == "__main__":
+    unittest.main()
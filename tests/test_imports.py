@@ -0,0 +1,38 @@
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+
+test_doc_folder_path = Path(__file__).parent.joinpath("ct_doc_test_data.zip").as_posix()
+
+
+# runs in a fresh interpreter, so modules imported by other tests don't count. the output path is argv[1]
+NO_NLP_RUN = f"""
+import sys, time
+t0 = time.perf_counter()
+from ctproc import CTConfig, CTProc
+elapsed = time.perf_counter() - t0
+config = CTConfig({test_doc_folder_path!r}, disable_tqdm=True, write_file=sys.argv[1])
+n_docs = len(list(CTProc(config).process_data()))
+print(n_docs, elapsed, sorted(m for m in sys.modules if m.split('.')[0] in ('spacy', 'negspacy', 'scispacy', 'tqdm')))
+"""
+
+
+class TestImports(unittest.TestCase):
+
+    def test_no_nlp_run_skips_nlp_stack(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            write_file = Path(tmpdir, "out.jsonl")
+            out = subprocess.run([sys.executable, "-c", NO_NLP_RUN, str(write_file)], check=True, capture_output=True, text=True)
+            n_docs, elapsed, loaded = out.stdout.strip().split(' ', 2)
+            self.assertGreater(int(n_docs), 0)
+            self.assertTrue(write_file.is_file())
+        self.assertEqual(loaded, '[]')
+        self.assertLess(float(elapsed), 2.0)   # generous, typically well under 0.2s
+
+
+
+if __name__ == "__main__":
+    unittest.main()
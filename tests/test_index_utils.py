@@ -0,0 +1,48 @@
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+from ctproc.index_utils import bool_csr, distinct, get_field, read_lines, renumber_sorted, rows_csr
+
+
+
+class TestIndexUtils(unittest.TestCase):
+
+    def test_get_field(self):
+        self.assertEqual(get_field({'id': 'NCT00000001'}, 'id'), 'NCT00000001')
+        self.assertEqual(get_field(SimpleNamespace(id='NCT00000001'), 'id'), 'NCT00000001')
+        self.assertIsNone(get_field({}, 'id'))
+        self.assertIsNone(get_field(SimpleNamespace(), 'id'))
+
+    def test_read_lines(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, 'lines.txt')
+            for lines in ([], [''], ['a', 'β', '']):
+                path.write_text('\n'.join(lines), encoding='utf-8')
+                self.assertEqual(read_lines(path, len(lines)), lines)
+
+    def test_renumber_sorted(self):
+        ids = {'C3': 0, 'C1': 1, 'C2': 2}
+        keys, renumber = renumber_sorted(ids)
+        self.assertEqual(keys, ['C1', 'C2', 'C3'])
+        self.assertEqual([keys[renumber[number]] for number in ids.values()], list(ids))
+
+    def test_csr(self):
+        rows = [np.array([0, 3], dtype=np.int32), np.array([], dtype=np.int32), np.array([1], dtype=np.int32)]
+        matrix = rows_csr(rows, 4)
+        self.assertEqual(matrix.indices.dtype, matrix.indptr.dtype)
+        self.assertEqual(matrix.toarray().tolist(), [[True, False, False, True], [False] * 4, [False, True, False, False]])
+        self.assertEqual(bool_csr(np.zeros(0, dtype=np.int32), np.zeros(2, dtype=np.int64), 3).shape, (2, 3))
+        self.assertEqual(rows_csr([], 3).shape, (0, 3))
+
+    def test_distinct(self):
+        self.assertEqual(distinct([np.array([5, 1, 5]), np.array([3, 1])], 6).tolist(), [1, 3, 5])
+        self.assertEqual(distinct([], 6).tolist(), [])
+
+
+
+if __name__ == "__main__":
+    unittest.main()
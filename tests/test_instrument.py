@@ -0,0 +1,99 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from ctproc.ctconfig import CTConfig
+from ctproc.instrument import NO_INSTRUMENT, Instrument
+from ctproc.proc import CTProc
+from ctproc.utils import offsets_path
+
+
+test_doc_folder_path = Path(__file__).parent.joinpath("ct_doc_test_data.zip").as_posix()
+test_topic_path = Path(__file__).parent.joinpath("ct_topic_test_data.xml").as_posix()
+
+
+class TestInstrument(unittest.TestCase):
+
+    def test_nested_stages_are_exclusive(self):
+        inst = Instrument()
+        with inst.stage('outer', 'doc'):
+            time.sleep(0.02)
+            with inst.stage('inner', 'doc'):
+                time.sleep(0.05)
+        stats = inst.stats()
+        self.assertGreaterEqual(stats.seconds['inner'], 0.05)
+        self.assertLess(stats.seconds['outer'], 0.05)
+        self.assertEqual(stats.calls, {'outer': 1, 'inner': 1})
+        self.assertEqual(set(inst.pop_doc_times('doc')), {'outer', 'inner'})
+
+    def test_rekey_merges_and_callbacks(self):
+        inst = Instrument(keep_doc_timings=True)
+        seen = []
+        inst.add_callback(lambda doc_id, times: seen.append((doc_id, sorted(times))))
+        doc = object()
+        with inst.stage('parse', 'member.xml'):
+            pass
+        with inst.stage('eligibility', doc):
+            pass
+        inst.rekey('member.xml', doc)
+        inst.end_doc(doc, 'NCT1')
+        self.assertEqual(seen, [('NCT1', ['eligibility', 'parse'])])
+        self.assertEqual(inst.doc_timings[0][0], 'NCT1')
+
+    def test_disabled_is_inert(self):
+        with NO_INSTRUMENT.stage('parse', 'doc'):
+            NO_INSTRUMENT.count('docs')
+        self.assertEqual(NO_INSTRUMENT.stats().seconds, {})
+        with self.assertRaises(ValueError):
+            NO_INSTRUMENT.add_callback(print)
+
+
+class TestInstrumentedProc(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.tmp = tempfile.mkstemp(suffix=".jsonl")
+        os.close(fd)
+
+    def tearDown(self):
+        Path(self.tmp).unlink()
+        offsets_path(self.tmp).unlink(missing_ok=True)
+
+    def _run(self, data_path=test_doc_folder_path, **kwargs):
+        proc = CTProc(CTConfig(data_path, disable_tqdm=True, write_file=Path(self.tmp), instrument=True, **kwargs))
+        seen = []
+        proc.instrument.add_callback(lambda doc_id, times: seen.append((doc_id, times)))
+        docs = list(proc.process_data())
+        return proc, docs, seen
+
+    def test_doc_stages(self):
+        proc, docs, seen = self._run()
+        stats = proc.instrument.stats()
+        for stage in ('decompress', 'parse_xml', 'eligibility', 'write'):
+            self.assertIn(stage, stats.seconds)
+        self.assertEqual(stats.counters['docs'], len(docs))
+        self.assertEqual([doc_id for doc_id, _ in seen], [doc.id for doc in docs])
+        for _, times in seen:
+            self.assertIn('parse_xml', times)
+            self.assertIn('write', times)
+
+    def test_parallel_stats_merged(self):
+        serial, docs, _ = self._run()
+        parallel, _, seen = self._run(workers=2, shard_size=1)
+        self.assertEqual(parallel.instrument.stats().counters, serial.instrument.stats().counters)
+        self.assertEqual(parallel.instrument.stats().calls['parse_xml'], len(docs))
+        self.assertTrue(all('eligibility' in times for _, times in seen))
+
+    def test_topic_stages(self):
+        proc, topics, seen = self._run(test_topic_path, is_topic=True)
+        self.assertEqual(proc.instrument.stats().calls['age_gender'], len(topics))
+        self.assertEqual(len(seen), len(topics))
+
+    def test_off_by_default(self):
+        proc = CTProc(CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=Path(self.tmp)))
+        self.assertIs(proc.instrument, NO_INSTRUMENT)
+
+
+if __name__ == "__main__":
+    unittest.main()
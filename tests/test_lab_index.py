@@ -0,0 +1,153 @@
+import random
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from ctproc.ctconfig import CTConfig
+from ctproc.proc import CTProc
+from ctproc.lab import LabConstraint, LabIndex, LabValue, extract_lab_constraints, get_lab_test, to_canonical
+
+
+test_doc_folder_path = Path(__file__).parent.joinpath("ct_doc_test_data.zip").as_posix()
+
+
+def satisfies(constraint, value):
+    low, high, low_inclusive, high_inclusive = constraint.bounds()
+    above = value >= low if low_inclusive else value > low
+    below = value <= high if high_inclusive else value < high
+    return above and below
+
+
+def loop_ruled_out(trials, values):
+    # the python loop the index replaces
+    out = []
+    for trial_id, inc, exc in trials:
+        failed = any(c.analyte in values and c.threshold is not None and not satisfies(c, values[c.analyte]) for c in inc)
+        excluded = any(c.analyte in values and c.threshold is not None and satisfies(c, values[c.analyte]) for c in exc)
+        out.append(failed or excluded)
+    return out
+
+
+class TestExtractLabConstraints(unittest.TestCase):
+
+    def _one(self, text):
+        constraints = extract_lab_constraints(text)
+        self.assertEqual(len(constraints), 1, constraints)
+        return constraints[0]
+
+    def test_symbol_comparators(self):
+        self.assertEqual(self._one("Hemoglobin >= 9 g/dL").comparator, ">=")
+        self.assertEqual(self._one("ANC ≥ 1500/mm3").comparator, ">=")
+        self.assertEqual(self._one("Creatinine > 1.5 mg/dL").comparator, ">")
+        self.assertEqual(self._one("Bilirubin ≤ 1.5 mg/dL").comparator, "<=")
+        self.assertEqual(self._one("INR < 1.5").comparator, "<")
+
+    def test_word_comparators(self):
+        self.assertEqual(self._one("Platelets at least 100,000/mm3").comparator, ">=")
+        self.assertEqual(self._one("SGOT no greater than 2.5 times upper limit of normal").comparator, "<=")
+        self.assertEqual(self._one("Serum creatinine less than 1.5 mg/dL").comparator, "<")
+        self.assertEqual(self._one("Hemoglobin greater than or equal to 10 g/dL").comparator, ">=")
+
+    def test_postfix_comparators(self):
+        self.assertEqual(self._one("Hemoglobin 9 g/dL or more").comparator, ">=")
+        self.assertEqual(self._one("Hb 10 or less").comparator, "<=")
+
+    def test_range(self):
+        constraint = self._one("Hemoglobin: 9-12 g/dL")
+        self.assertEqual((constraint.comparator, constraint.threshold, constraint.threshold_high), ("between", 9.0, 12.0))
+
+    def test_no_comparator(self):
+        self.assertEqual(extract_lab_constraints("WBC 3000"), [])
+
+    def test_si_unit_normalized(self):
+        constraint = self._one("Platelets at least 100 x 10^9/L")
+        self.assertEqual(constraint.unit, "/mm3")
+        self.assertAlmostEqual(constraint.threshold, 100000.0)
+        constraint = self._one("Creatinine less than 110 μmol/L")
+        self.assertEqual(constraint.unit, "mg/dL")
+        self.assertAlmostEqual(constraint.threshold, 110 * 113.12 / 1e4)
+
+    def test_unknown_unit(self):
+        self.assertIsNone(self._one("Hemoglobin >= 9 mmol/L").threshold)
+
+    def test_uln_resolved(self):
+        constraint = self._one("AST less than 2.5 times ULN")
+        self.assertEqual(constraint.uln_multiple, 2.5)
+        self.assertAlmostEqual(constraint.threshold, 2.5 * get_lab_test("AST").conventional_range.high)
+
+    def test_uln_without_range(self):
+        self.assertIsNone(self._one("CRP less than 2 times ULN").threshold)
+
+    def test_reuses_extracted_values(self):
+        text = "Hemoglobin >= 9 g/dL"
+        self.assertEqual(extract_lab_constraints(text, []), [])
+
+
+class TestLabIndex(unittest.TestCase):
+
+    def _index(self):
+        trials = [
+            ("NCT1", extract_lab_constraints("Hemoglobin >= 9 g/dL"), []),
+            ("NCT2", [], extract_lab_constraints("Creatinine > 1.5 mg/dL")),
+            ("NCT3", extract_lab_constraints("Platelets > 100,000/mm3"), extract_lab_constraints("AST greater than 2 times ULN")),
+            ("NCT4", [], []),
+        ]
+        return LabIndex.from_constraints(trials)
+
+    def test_screen(self):
+        index = self._index()
+        self.assertEqual(list(index.screen_ids({"Hgb": 8.0})), ["NCT2", "NCT3", "NCT4"])
+        self.assertEqual(list(index.screen_ids({"Hgb": 9.0})), ["NCT1", "NCT2", "NCT3", "NCT4"])
+        self.assertEqual(list(index.screen_ids({"Creatinine": 1.5})), ["NCT1", "NCT2", "NCT3", "NCT4"])
+        self.assertEqual(list(index.screen_ids({"Creatinine": 1.6})), ["NCT1", "NCT3", "NCT4"])
+        self.assertEqual(list(index.screen_ids({"Platelets": 100000, "SGOT": 20})), ["NCT1", "NCT2", "NCT4"])
+        self.assertEqual(list(index.screen_ids({"SGOT": 81})), ["NCT1", "NCT2", "NCT4"])
+
+    def test_unknown_analytes_rule_out_nothing(self):
+        index = self._index()
+        self.assertTrue(index.screen({}).all())
+        self.assertTrue(index.screen({"not a lab": 1.0}).all())
+
+    def test_patient_lab_values(self):
+        index = self._index()
+        labs = [LabValue(analyte="Creatinine", value=150.0, unit="μmol/L"), LabValue(analyte="AST", value=3.0, unit="x ULN")]
+        self.assertEqual(index.patient_values(labs), {"Creatinine": to_canonical(get_lab_test("Creatinine"), 150.0, "μmol/L")})
+        self.assertEqual(list(index.screen_ids(labs)), ["NCT1", "NCT3", "NCT4"])
+
+    def test_unresolved_constraints_left_out(self):
+        index = LabIndex.from_constraints([("NCT1", [LabConstraint("Hemoglobin", ">=", None)], [])])
+        self.assertEqual(index.n_constraints(), 0)
+
+    def test_matches_loop(self):
+        rng = random.Random(0)
+        analytes = ["Hemoglobin", "Creatinine", "Platelet count", "AST", "Bilirubin"]
+        comparators = ["<", "<=", ">", ">=", "=", "between"]
+
+        def constraint():
+            threshold = float(rng.randint(0, 20))
+            return LabConstraint(rng.choice(analytes), rng.choice(comparators), threshold, threshold + rng.randint(0, 5))
+
+        trials = [(f"NCT{i}", [constraint() for _ in range(rng.randint(0, 3))], [constraint() for _ in range(rng.randint(0, 3))])
+                  for i in range(500)]
+        index = LabIndex.from_constraints(trials)
+        for _ in range(50):
+            values = {analyte: float(rng.randint(-1, 26)) for analyte in rng.sample(analytes, rng.randint(0, len(analytes)))}
+            self.assertEqual(list(index.ruled_out(values)), loop_ruled_out(trials, values))
+
+    def test_from_docs(self):
+        config = CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=Path("/dev/null"), add_labs=True)
+        docs = list(CTProc(config).process_data())
+        index = LabIndex.from_docs(docs)
+        self.assertEqual(list(index.trial_ids), [doc.id for doc in docs])
+
+        for doc in docs:
+            del doc.inc_labs, doc.exc_labs
+        extracted = LabIndex.from_docs(docs)
+        self.assertEqual(index.columns.keys(), extracted.columns.keys())
+        for analyte, cols in index.columns.items():
+            np.testing.assert_array_equal(cols.low, extracted.columns[analyte].low)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import random
+import re
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+from zipfile import ZipFile
+
+from lxml import etree
+
+from ctproc.lab import AnalyteMatcher, extract_lab_values, get_lab_test, load_analyte_table
+from ctproc.lab import patterns
+from ctproc.lab.extractor import _extract_value
+from ctproc.lab.matcher import fold_case
+from ctproc.lab.reference_ranges import LAB_TESTS
+
+
+TEST_DIR = Path(__file__).parent
+
+
+def regex_extract_lab_values(text):
+    """extract_lab_values as it was with the analyte regex alternation"""
+    results = []
+    for m in patterns._build_analyte_pattern().finditer(text):
+        lab_test = get_lab_test(m.group(1))
+        if lab_test is not None:
+            extracted = _extract_value(text, lab_test, m.start(), m.end())
+            if extracted:
+                results.append(extracted)
+    return results
+
+
+def corpus_texts():
+    with ZipFile(TEST_DIR.joinpath("ct_doc_test_data.zip")) as zf:
+        for name in zf.namelist():
+            if name.endswith('xml'):
+                el = etree.fromstring(zf.read(name)).find('eligibility/criteria/textblock')
+                if el is not None:
+                    yield el.text
+    for topic in etree.parse(str(TEST_DIR.joinpath("ct_topic_test_data.xml"))).getroot():
+        yield topic.text
+
+
+class TestFoldCase(unittest.TestCase):
+
+    def test_matches_re_ignorecase(self):
+        probes = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZİıſKµμΣςͅẛ"
+        chars = [chr(c) for c in range(0x10000) if not 0xd800 <= c < 0xe000]
+        chars = [c for c in chars if c.lower() != c or c.upper() != c or fold_case(c) != c]
+        for p in probes:
+            pattern = re.compile(re.escape(p), re.IGNORECASE)
+            expected = {c for c in chars if pattern.fullmatch(c)}
+            self.assertEqual({c for c in chars if fold_case(c) == fold_case(p)}, expected, p)
+
+    def test_keeps_length(self):
+        text = "".join(chr(c) for c in range(0x3000) if not 0xd800 <= c < 0xe000)
+        self.assertEqual(len(fold_case(text)), len(text))
+
+
+class TestAnalyteMatcher(unittest.TestCase):
+
+    def assert_same_spans(self, names, text):
+        pattern = re.compile(
+            rf"(?<![a-zA-Z])({'|'.join(sorted(map(re.escape, names), key=len, reverse=True))})(?![a-zA-Z])",
+            re.IGNORECASE,
+        )
+        self.assertEqual(list(AnalyteMatcher(names).finditer(text)), [m.span(1) for m in pattern.finditer(text)], repr(text))
+
+    def test_longest_match_with_boundaries(self):
+        names = ["Hemoglobin", "Hemoglobin A1c", "A1c", "AST", "PT", "PTT"]
+        matcher = AnalyteMatcher(names)
+        self.assertEqual(list(matcher.finditer("HEMOGLOBIN a1c 7%")), [(0, 14)])
+        self.assertEqual(list(matcher.finditer("Hemoglobin A1cx")), [(0, 10)])
+        self.assertEqual(list(matcher.finditer("at least PTT, PT and 2AST")), [(9, 12), (14, 16), (22, 25)])
+        self.assertEqual(list(AnalyteMatcher([]).finditer("AST")), [])
+
+    def test_fuzz_parity(self):
+        rng = random.Random(0)
+        names = ["AST", "ALT", "PT", "PTT", "aPTT", "Hb", "Hemoglobin", "Hemoglobin A1c", "A1c", "25-OH Vitamin D",
+                 "Vit D", "IGF-1", "IGF1", "Kappa", "sIgA", "Σ-test", "µg"]
+        pieces = names + [n.upper() for n in names] + [n.lower() for n in names] + [
+            " ", "-", "x", "1", "s", "ſ", "ı", "İ", "K", "μ", "ς", ":", "\n", "é", "AS", "PTTT"]
+        for _ in range(3000):
+            text = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 12)))
+            self.assert_same_spans(names, text)
+
+    def test_lab_tests_parity(self):
+        texts = list(corpus_texts())
+        texts += [f"{name}: 1.5 mg/dL, {name.upper()} <= 2 x ULN" for name in patterns._analyte_names()]
+        for text in texts:
+            self.assertEqual(extract_lab_values(text), regex_extract_lab_values(text))
+            self.assert_same_spans(patterns._analyte_names(), text)
+
+
+class TestLoadAnalyteTable(unittest.TestCase):
+
+    def setUp(self):
+        self.lab_tests = dict(LAB_TESTS)
+        self.aliases = {id(lt): list(lt.aliases) for lt in LAB_TESTS.values()}
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        for lt in self.lab_tests.values():
+            lt.aliases[:] = self.aliases[id(lt)]
+        LAB_TESTS.clear()
+        LAB_TESTS.update(self.lab_tests)
+        patterns.reset_analyte_matcher()
+        self.tmp.cleanup()
+
+    def write(self, name, content):
+        path = Path(self.tmp.name, name)
+        path.write_text(content, encoding="utf-8")
+        return path
+
+    def test_load_tsv(self):
+        path = self.write("analytes.tsv", "name\taliases\tunit\nLipase\tLPS|serum lipase\tU/L\nHemoglobin\tHaemoglobin\t\n\t\t\n")
+        self.assertEqual(load_analyte_table(path), 1)
+        self.assertEqual(get_lab_test("LPS").name, "Lipase")
+        self.assertEqual(get_lab_test("haemoglobin").name, "Hemoglobin")
+        self.assertEqual(get_lab_test("haemoglobin").default_unit, "g/dL")
+
+        vals = extract_lab_values("serum lipase < 3 x ULN and haemoglobin >= 9")
+        self.assertEqual([(v.analyte, v.value, v.unit) for v in vals], [("Lipase", 3.0, "x ULN"), ("Hemoglobin", 9.0, "g/dL")])
+        self.assertEqual(extract_lab_values("LPS 60"), regex_extract_lab_values("LPS 60"))
+
+    def test_load_loinc_columns(self):
+        path = self.write("loinc.csv", 'LOINC_NUM,COMPONENT,SHORTNAME,LONG_COMMON_NAME,EXAMPLE_UCUM_UNITS\n'
+                                       '4542-7,Haptoglobin,Haptoglob SerPl-mCnc,"Haptoglobin [Mass/volume] in Serum or Plasma",mg/dL\n')
+        self.assertEqual(load_analyte_table(path), 1)
+        self.assertEqual(get_lab_test("haptoglob serpl-mcnc").name, "Haptoglobin")
+        self.assertEqual(extract_lab_values("Haptoglobin: 120")[0].unit, "mg/dL")
+
+    def test_env_table(self):
+        path = self.write("analytes.csv", "name,unit\nFibrinogen,mg/dL\n")
+        with mock.patch.dict(os.environ, {patterns.ANALYTE_TABLE_ENV: str(path)}), \
+                mock.patch.object(patterns, "_env_table_loaded", False):
+            patterns.reset_analyte_matcher()
+            self.assertEqual(extract_lab_values("fibrinogen 300")[0].unit, "mg/dL")
+
+
+if __name__ == "__main__":
+    unittest.main()
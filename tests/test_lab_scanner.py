@@ -0,0 +1,152 @@
+import random
+import re
+import unittest
+
+from ctproc.lab import extract_lab_values
+from ctproc.lab.patterns import get_analyte_matcher, _analyte_names
+from ctproc.lab.reference_ranges import get_lab_test
+from ctproc.lab.types import LabValue
+from tests.test_lab_matcher import corpus_texts
+
+
+# the filler stripping loop and re.match calls extract_lab_values used before the value scanner
+_LEGACY_FILLER_WORDS = re.compile(
+    r"^(?:count|level|of|is|was|"
+    r"at\s+least|greater\s+than(?:\s+or\s+equal\s+to)?|"
+    r"less\s+than(?:\s+or\s+equal\s+to)?|"
+    r"no\s+greater\s+than|no\s+less\s+than|no\s+more\s+than|"
+    r"equal\s+to|above|below|over|under|approximately"
+    r")[\s:]*",
+    re.IGNORECASE,
+)
+_LEGACY_FILLER_SYMBOLS = re.compile(r"^(?:\([A-Z]{2,6}\)\s*)?[\s:]*(?:≥|>=|≤|<=|>|<|=)?\s*")
+_LEGACY_UNIT_PATTERN = (
+    r"(?:\s*"
+    r"(?:g/[dD][lL]|mg/[dD][lL]|mg/dL|mL/min|IU/L|U/L|mIU/L|mU/L|"
+    r"ng/mL|ng/dL|pg/mL|μg/L|μg/dL|µg/L|µg/dL|"
+    r"mmol/L|μmol/L|µmol/L|nmol/L|pmol/L|mEq/L|"
+    r"x\s*10[\^]?\d+/[Ll]|/mm3|/mm\^3|/μL|/µL|"
+    r"mm/h|mm\s*Hg|mmHg|sec|fL|EU|%)"
+    r")?"
+)
+
+
+def legacy_parse_number(text):
+    m = re.match(r"\s*(\d[\d,]*\.?\d*)", text)
+    if m:
+        return float(m.group(1).replace(",", "")), text[m.end():]
+    return None
+
+
+def legacy_parse_unit(text):
+    m = re.match(_LEGACY_UNIT_PATTERN, text.strip())
+    if m and m.group():
+        return m.group().strip()
+    return ""
+
+
+def legacy_extract_value(after, lab_test, match_start, match_end, full_text):
+    cleaned = after.strip()
+    changed = True
+    while changed:
+        changed = False
+        result = _LEGACY_FILLER_SYMBOLS.sub("", cleaned).strip()
+        if result != cleaned:
+            cleaned = result
+            changed = True
+        result = _LEGACY_FILLER_WORDS.sub("", cleaned, count=1).strip()
+        if result != cleaned:
+            cleaned = result
+            changed = True
+
+    num = legacy_parse_number(cleaned)
+    if num is None:
+        return None
+    val, rest = num
+
+    uln_match = re.match(
+        r"\s*(?:x\s+|times?\s+)?(?:the\s+)?(?:upper\s+limit\s+of\s+normal|ULN|institutional\s+normal)",
+        rest, re.IGNORECASE,
+    )
+    if uln_match:
+        end_pos = match_end + len(after) - len(cleaned) + len(str(val)) + uln_match.end()
+        return LabValue(analyte=lab_test.name, value=val, unit="x ULN", start=match_start, end=end_pos,
+                        raw_text=full_text[match_start:end_pos].strip())
+
+    range_match = re.match(r"\s*[-–]\s*", rest)
+    if range_match:
+        num2 = legacy_parse_number(rest[range_match.end():])
+        if num2:
+            val2, rest3 = num2
+            unit = legacy_parse_unit(rest3) or lab_test.default_unit
+            end_pos = match_end + len(after) - len(rest3)
+            return LabValue(analyte=lab_test.name, value=val, value_high=val2, unit=unit, start=match_start,
+                            end=end_pos, raw_text=full_text[match_start:end_pos].strip())
+
+    unit = legacy_parse_unit(rest) or lab_test.default_unit
+    end_pos = match_end + len(after) - len(rest) + (len(unit) if unit in rest else 0)
+    return LabValue(analyte=lab_test.name, value=val, unit=unit, start=match_start, end=end_pos,
+                    raw_text=full_text[match_start:end_pos].strip())
+
+
+def legacy_extract_lab_values(text):
+    results = []
+    for start, end in get_analyte_matcher().finditer(text):
+        lab_test = get_lab_test(text[start:end])
+        if lab_test is not None:
+            extracted = legacy_extract_value(text[end:end + 150], lab_test, start, end, text)
+            if extracted:
+                results.append(extracted)
+    return results
+
+
+# pieces of what follows an analyte name, including near misses of every pattern
+FILLERS = [
+    "", " ", "  ", ":", ": ", " :", "\n", "\t", "\xa0", "(LDH)", "(LD)", "(ABCDEFG)", "(ldh)", ">", ">=", "≥", "≤", "<=",
+    "<", "=", "=>", "count", "level", "of", "is", "was", "at least", "at  least", "greater than", "greater than or equal to",
+    "less than or equal to", "no greater than", "no more than", "equal to", "above", "below", "over", "under",
+    "approximately", "Approximately", "LEVEL", "isolated", "overt", "levels", "the", "x",
+]
+NUMBERS = ["1", "1.5", "100,000", "1,500", "3500", "2.", "0", "12,", "1,,2", "١٢", "9.2.1", "5x", "1e3", ".5"]
+AFTERS = [
+    "", " ", "g/dL", " mg/dL", "mg/dl", "MG/DL", " x ULN", " x  uln", "ULN", " times upper limit of normal",
+    " times the ULN", " x the upper limit of normal", "x institutional normal", " time ULN", "-", " - ", "–", "-12",
+    " - 12 g/dL", "–12%", "- x", " x 10^9/L", "x10^3/L", " x 10 9/L", " /mm3", "/μL", " mm Hg", "mmHg", "sec", "%", "fL",
+    " mIU/L", " mU/L", " IU/L", " µg/dL", " μmol/L", ", ", ".", " and ", " or ", " of normal",
+]
+
+
+def make_text(rng, names):
+    parts = [rng.choice(["", "Patients with ", "- ", "1. "]), rng.choice(names)]
+    for _ in range(rng.randint(0, 4)):
+        parts.append(rng.choice(FILLERS) + rng.choice(["", " ", " "]))
+    parts += [rng.choice(NUMBERS + [""]), rng.choice(AFTERS), rng.choice(AFTERS)]
+    if rng.random() < 0.3:
+        parts.append(" " * rng.randint(0, 160) + rng.choice(names) + " " + rng.choice(NUMBERS))
+    if rng.random() < 0.2:
+        parts.append(" " * rng.randint(100, 200))
+    return "".join(parts)
+
+
+class TestValueScanner(unittest.TestCase):
+
+    def test_fuzz_parity(self):
+        rng = random.Random(0)
+        names = sorted(_analyte_names())
+        for _ in range(5000):
+            text = make_text(rng, names)
+            self.assertEqual(extract_lab_values(text), legacy_extract_lab_values(text), repr(text))
+
+    def test_corpus_parity(self):
+        for text in corpus_texts():
+            self.assertEqual(extract_lab_values(text), legacy_extract_lab_values(text))
+
+    def test_window_edges(self):
+        # values pushed to the edge of the 150 character window, and past it
+        for n in range(140, 152):
+            for text in [f"Hemoglobin{' ' * n}9.2 g/dL", f"Hemoglobin{' ' * n}9.2 g/dL   ", f"Hemoglobin:{' ' * n}2 x ULN"]:
+                self.assertEqual(extract_lab_values(text), legacy_extract_lab_values(text), n)
+
+
+if __name__ == "__main__":
+    unittest.main()
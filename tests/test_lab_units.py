@@ -0,0 +1,139 @@
+import random
+import unittest
+
+import numpy as np
+
+from ctproc.lab import get_lab_test, to_canonical, reference_range, normalize_values, evaluate_values
+from ctproc.lab.reference_ranges import LAB_TESTS
+from ctproc.lab.units import HIGH, LOW, NORMAL, UNKNOWN, canonical_unit, unit_factors, unit_key
+
+
+def loop_evaluate(analytes, values, units, demographics):
+    # one value at a time, what evaluate_values() does in one call
+    normalized, flags = [], []
+    for analyte, value, unit, demographic in zip(analytes, values, units, demographics):
+        lab_test = get_lab_test(analyte)
+        value = None if lab_test is None else to_canonical(lab_test, value, unit)
+        bounds = None if lab_test is None else reference_range(lab_test, demographic)
+        normalized.append(np.nan if value is None else value)
+        if value is None or bounds is None:
+            flags.append(UNKNOWN)
+        else:
+            flags.append(LOW if value < bounds[0] else HIGH if value > bounds[1] else NORMAL)
+    return normalized, flags
+
+
+class TestUnitKey(unittest.TestCase):
+
+    def test_spellings(self):
+        for unit in ["x10^9/L", "x 10^9/L", "x10⁹/L", "10^9/L", "x10e9/L", "×10^9/L", "G/L"]:
+            self.assertEqual(unit_key(unit), "x10^9/l", unit)
+        for unit in ["/mm3", "/mm^3", "/μL", "/µL", "/uL", "cells/mm3"]:
+            self.assertEqual(unit_key(unit), "/mm3", unit)
+        for unit in ["μmol/L", "µmol/L", "umol/L"]:
+            self.assertEqual(unit_key(unit), "μmol/l", unit)
+        self.assertEqual(unit_key("mcg/dL"), "μg/dl")
+        self.assertEqual(unit_key("IU/L"), unit_key("U/L"))
+        self.assertEqual(unit_key("g/L"), "g/l")
+
+
+class TestToCanonical(unittest.TestCase):
+
+    def assertConverts(self, analyte, value, unit, expected, places=3):
+        lab_test = get_lab_test(analyte)
+        self.assertAlmostEqual(to_canonical(lab_test, value, unit), expected, places=places, msg=f"{analyte} {value} {unit}")
+
+    def test_counts(self):
+        self.assertConverts("Platelets", 100, "x10^9/L", 100000)
+        self.assertConverts("ANC", 1.5, "x 10^9/L", 1500)
+        self.assertConverts("WBC", 5, "x10^3/uL", 5000)
+        self.assertConverts("Platelets", 150000, "/μL", 150000)
+
+    def test_giga_per_microliter(self):
+        # 10^9/μL is 10^15/L, a million times 10^9/L
+        self.assertEqual(unit_key("x10^9/μL"), "x10^9/μl")
+        platelets = get_lab_test("Platelets")
+        self.assertAlmostEqual(to_canonical(platelets, 1e-4, "x10^9/μL"), to_canonical(platelets, 100, "x10^9/L"))
+        self.assertAlmostEqual(to_canonical(platelets, 1e-4, "x10^9/μL"), to_canonical(platelets, 100000, "/mm3"))
+        self.assertConverts("Platelets", 1e-4, "x10^9/uL", 100000)
+
+    def test_molar(self):
+        self.assertConverts("Creatinine", 88.4, "μmol/L", 1.0, places=2)
+        self.assertConverts("Bilirubin", 17.1, "μmol/L", 1.0, places=2)
+        self.assertConverts("Glucose", 5.55, "mmol/L", 100, places=0)
+        self.assertConverts("Calcium", 2.5, "mmol/L", 10.02, places=2)
+        self.assertConverts("Cholesterol", 5.17, "mmol/L", 200, places=0)
+
+    def test_equivalents(self):
+        self.assertConverts("Sodium", 140, "mmol/L", 140)
+        self.assertConverts("Calcium", 5, "mEq/L", 10.02, places=2)
+
+    def test_mass(self):
+        self.assertConverts("Hemoglobin", 120, "g/L", 12)
+        self.assertConverts("Albumin", 35, "g/L", 3.5)
+        self.assertConverts("TSH", 2, "uIU/mL", 2)
+
+    def test_reference_ranges_agree(self):
+        # the top of the SI range converted is near the top of the conventional range for every
+        # curated analyte, near as the curated ranges are rounded and not always from one source
+        for lab_test in {id(lt): lt for lt in LAB_TESTS.values()}.values():
+            si, conv = lab_test.si_range, lab_test.conventional_range
+            if si is None or conv is None or not si.high or not conv.high:
+                continue
+            factor = unit_factors(lab_test).get(unit_key(si.unit))
+            self.assertIsNotNone(factor, lab_test.name)
+            self.assertLess(abs(si.high * factor - conv.high) / conv.high, 0.25, lab_test.name)
+
+    def test_default_unit(self):
+        self.assertEqual(to_canonical(get_lab_test("Hemoglobin"), 9, ""), 9)
+
+    def test_unknown_unit(self):
+        self.assertIsNone(to_canonical(get_lab_test("Hemoglobin"), 9, "mm/h"))
+        self.assertIsNone(to_canonical(get_lab_test("Hemoglobin"), 9, "mmol/L"))
+
+    def test_canonical_unit_factor_one(self):
+        for lab_test in LAB_TESTS.values():
+            self.assertEqual(unit_factors(lab_test)[unit_key(canonical_unit(lab_test))], 1.)
+
+
+class TestEvaluateValues(unittest.TestCase):
+
+    def test_flags(self):
+        normalized, flags = evaluate_values(
+            ["Hgb", "Hgb", "Creatinine", "CRP", "not a lab", "Platelets", "HDL"],
+            [13, 13, 200, 5, 1, 90, 80],
+            ["g/dL", "g/dL", "umol/L", "mg/L", "", "x10^9/L", "mg/dL"],
+            ["Male", "female", None, None, None, None, None],
+        )
+        self.assertEqual(list(flags), [LOW, NORMAL, HIGH, UNKNOWN, UNKNOWN, LOW, NORMAL])
+        self.assertEqual(flags.dtype, np.int8)
+        self.assertTrue(np.isnan(normalized[4]))
+        self.assertEqual(normalized[5], 90000)
+
+    def test_no_demographics(self):
+        _, flags = evaluate_values(["Hemoglobin"], [17.0], ["g/dL"])
+        self.assertEqual(list(flags), [NORMAL])
+
+    def test_empty(self):
+        normalized, flags = evaluate_values([], [], [])
+        self.assertEqual((len(normalized), len(flags)), (0, 0))
+        self.assertEqual(len(normalize_values([], [], [])), 0)
+
+    def test_matches_loop(self):
+        rng = random.Random(0)
+        analytes = ["Hemoglobin", "Hgb", "Creatinine", "Platelets", "ANC", "Calcium", "Sodium", "TSH", "CRP", "Hematocrit", "nope"]
+        units = ["", "g/dL", "g/L", "mg/dL", "μmol/L", "mmol/L", "mEq/L", "x10^9/L", "/mm3", "%", "mIU/L", "furlongs"]
+        demographics = [None, "Male", "Female", "children", "newborn", "All"]
+        n = 5000
+        args = (
+            [rng.choice(analytes) for _ in range(n)], [rng.uniform(0, 300) for _ in range(n)],
+            [rng.choice(units) for _ in range(n)], [rng.choice(demographics) for _ in range(n)],
+        )
+        normalized, flags = evaluate_values(*args)
+        loop_normalized, loop_flags = loop_evaluate(*args)
+        np.testing.assert_array_equal(normalized, loop_normalized)
+        self.assertEqual(list(flags), loop_flags)
+
+
+if __name__ == "__main__":
+    unittest.main()
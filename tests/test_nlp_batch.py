@@ -0,0 +1,101 @@
+import copy
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from zipfile import ZipFile
+
+from ctproc.ctbase import NLPTools
+from ctproc.ctconfig import CTConfig
+from ctproc.cttopic import CTTopic
+from ctproc.proc import CTProc
+
+
+test_doc_folder_path = Path(__file__).parent.joinpath("ct_doc_test_data.zip").as_posix()
+
+
+class FakeSpan:
+    # stands in for a spaCy Doc/Span: a single entity covering the first word of the text
+    def __init__(self, text):
+        self.text = text
+        word = text.split()[0] if text.split() else ''
+        start = text.find(word)
+        ent = SimpleNamespace(
+            text=word, label_='ENTITY', start_char=start, end_char=start + len(word),
+            _=SimpleNamespace(kb_ents=[(f'C{len(word):07d}', 1.0)], negex=False),
+        )
+        self.ents = [ent] if word else []
+        self.sents = [self]
+
+
+class FakeNLP:
+    def __init__(self):
+        self.n_calls = 0
+        self.n_pipes = 0
+
+    def __call__(self, text):
+        self.n_calls += 1
+        return FakeSpan(text)
+
+    def pipe(self, texts, as_tuples=False, batch_size=None):
+        self.n_pipes += 1
+        for text, context in texts:
+            yield FakeSpan(text), context
+
+
+class FakeKB:
+    def __getitem__(self, cui):
+        return SimpleNamespace(aliases=[cui.lower(), 'alias'])
+
+
+def fake_nlp_tools():
+    return NLPTools(NLP=FakeNLP(), linker=SimpleNamespace(kb=SimpleNamespace(cui_to_entity=FakeKB())), STOP_WORDS=set())
+
+
+class TestBatchedNLP(unittest.TestCase):
+
+    def setUp(self):
+        self.proc = CTProc(CTConfig(test_doc_folder_path, disable_tqdm=True))
+        self.proc.config = self.proc.config._replace(nlp=True, add_ents=True, expand=True, nlp_batch_size=8)
+        self.proc.nlp_tools = fake_nlp_tools()
+
+        with ZipFile(test_doc_folder_path) as zip_reader:
+            built = [self.proc.build_doc_helper(ct_file, zip_reader) for ct_file in zip_reader.namelist()]
+        self.docs = [doc for doc in built if doc is not None]
+        self.assertGreater(len(self.docs), 1)
+
+    def test_docs_match_per_sentence_calls(self):
+        expected = [self.proc.transform_ct_object(copy.copy(doc)) for doc in self.docs]
+        expected_aliased = [doc.elig_crit.inc_aliased_crit for doc in expected]
+        nlp = self.proc.nlp_tools.NLP
+        n_sents = nlp.n_calls
+        nlp.n_calls = 0
+
+        batched = list(self.proc.transform_ct_objects(copy.copy(doc) for doc in self.docs))
+        self.assertEqual(nlp.n_calls, 0)
+        self.assertLess(nlp.n_pipes, n_sents)
+        self.assertEqual([doc.id for doc in batched], [doc.id for doc in expected])
+        for got, want, want_aliased in zip(batched, expected, expected_aliased):
+            self.assertEqual(got.inc_ents, want.inc_ents)
+            self.assertEqual(got.exc_ents, want.exc_ents)
+            self.assertEqual(got.elig_crit.inc_aliased_crit, want_aliased)
+
+    def test_one_pipe_call_per_batch(self):
+        n_texts = sum(len(doc.get_nlp_texts(self.proc.config)) for doc in self.docs)
+        self.proc.config = self.proc.config._replace(nlp_batch_size=n_texts)
+        list(self.proc.transform_ct_objects(self.docs))
+        self.assertEqual(self.proc.nlp_tools.NLP.n_pipes, 1)
+
+    def test_topics(self):
+        self.proc.config = self.proc.config._replace(is_topic=True)
+        topics = [('1', 'A 19-year-old male came to clinic.'), ('2', 'A 40-year-old woman with asthma.')]
+        batched = list(self.proc.build_topics(topics))
+        expected = [self.proc.build_topic(topic_id, text) for topic_id, text in topics]
+        for got, want in zip(batched, expected):
+            self.assertIsInstance(got, CTTopic)
+            self.assertEqual(got.text_sents, want.text_sents)
+            self.assertEqual(got.ent_sents, want.ent_sents)
+            self.assertEqual((got.age, got.gender), (want.age, want.gender))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+from types import SimpleNamespace
+
+from ctproc.ctbase import CTBase, NLPTools
+from ctproc.ctconfig import CTConfig
+from ctproc.proc import CTProc, add_negex
+
+try:
+    import spacy
+    import negspacy.negation     # noqa: F401
+except ImportError:
+    spacy = None
+
+
+def _proc(**kwargs):
+    # nlp=False so nothing is loaded, the plan is computed from the config alone
+    proc = CTProc(CTConfig("test.zip", **kwargs))
+    proc.config = proc.config._replace(nlp=True)
+    return proc
+
+
+class TestNLPComponents(unittest.TestCase):
+
+    def test_stop_words_only(self):
+        proc = _proc(add_ents=False, remove_stops=True)
+        self.assertFalse(proc.uses_ents())
+        self.assertFalse(proc.uses_negation())
+        self.assertEqual(set(proc.get_nlp_excludes()), {'tagger', 'attribute_ruler', 'lemmatizer', 'parser', 'ner', 'tok2vec'})
+
+    def test_doc_ents(self):
+        proc = _proc(add_ents=True)
+        self.assertTrue(proc.uses_ents())
+        self.assertTrue(proc.uses_negation())
+        self.assertEqual(set(proc.get_nlp_excludes()), {'tagger', 'attribute_ruler', 'lemmatizer', 'parser'})
+
+    def test_ents_without_negation(self):
+        proc = _proc(add_ents=True, add_negation=False)
+        self.assertTrue(proc.uses_ents())
+        self.assertFalse(proc.uses_negation())
+
+    def test_expand_needs_linker(self):
+        self.assertTrue(_proc(add_ents=False, expand=True).uses_ents())
+
+    def test_topics_keep_parser(self):
+        excludes = _proc(add_ents=False, is_topic=True).get_nlp_excludes()
+        self.assertNotIn('parser', excludes)
+        self.assertNotIn('tok2vec', excludes)
+        self.assertIn('ner', excludes)
+
+
+class FakePipeline:
+
+    def __init__(self, pipe_names):
+        self.pipe_names = list(pipe_names)
+
+    def add_pipe(self, name):
+        self.pipe_names.append(name)
+
+
+class TestNegexPipe(unittest.TestCase):
+
+    def test_doc_pipeline_gets_sentencizer(self):
+        # doc runs exclude the parser, negex still needs sentence boundaries
+        self.assertIn('parser', _proc(add_ents=True).get_nlp_excludes())
+        NLP = FakePipeline(['tok2vec', 'ner', 'scispacy_linker'])
+        add_negex(NLP)
+        self.assertEqual(NLP.pipe_names, ['tok2vec', 'ner', 'scispacy_linker', 'sentencizer', 'negex'])
+
+    def test_topic_pipeline_keeps_parser(self):
+        NLP = FakePipeline(['tok2vec', 'parser', 'ner', 'scispacy_linker'])
+        add_negex(NLP)
+        self.assertEqual(NLP.pipe_names, ['tok2vec', 'parser', 'ner', 'scispacy_linker', 'negex'])
+
+    @unittest.skipIf(spacy is None, "spacy and negspacy are not installed")
+    def test_real_pipeline_without_parser(self):
+        NLP = spacy.blank("en")
+        NLP.add_pipe("entity_ruler").add_patterns([{"label": "ENTITY", "pattern": "pregnancy"}])
+        add_negex(NLP)
+        doc = NLP("no pregnancy. history of pregnancy")
+        self.assertEqual([ent._.negex for ent in doc.ents], [True, False])
+
+
+class TestEntityNegation(unittest.TestCase):
+
+    def _spacy_ent(self, **extensions):
+        kb = SimpleNamespace(cui_to_entity={'C0032961': SimpleNamespace(aliases=['pregnancy'])})
+        base = CTBase('1', NLPTools(NLP=None, linker=SimpleNamespace(kb=kb), STOP_WORDS=set()))
+        ent = SimpleNamespace(text='pregnant', label_='ENTITY', start_char=0, end_char=8,
+                              _=SimpleNamespace(kb_ents=[('C0032961', 1.0)], **extensions))
+        return base.proc_spacy_ent(ent)
+
+    def test_negex_value(self):
+        self.assertTrue(self._spacy_ent(negex=True).negation)
+
+    def test_no_negex_in_pipeline(self):
+        self.assertIsNone(self._spacy_ent().negation)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+from ctproc.ctconfig import CTConfig
+from ctproc.proc import CTProc
+from ctproc.utils import OffsetIndex, OffsetWriter, get_processed_data, offsets_path
+
+
+test_doc_folder_path = Path(__file__).parent.joinpath("ct_doc_test_data.zip").as_posix()
+test_topic_path = Path(__file__).parent.joinpath("ct_topic_test_data.xml").as_posix()
+
+
+def random_docs(n_docs, seed=0):
+    """small docs with non ascii text, nested fields and repeated ids, as a jsonl output may have"""
+    rng = random.Random(seed)
+    words = ['diabetes', 'café', 'β-blocker', 'HbA1c', '≥ 7%', 'naïve', '"quoted"', 'tab\there', 'new\nline']
+    docs = []
+    for i in range(n_docs):
+        doc_id = f"NCT{rng.randrange(n_docs // 2 + 1):08d}"
+        docs.append({
+            'id': doc_id,
+            'elig_min_age': rng.choice([None, 18.0, 0.5]),
+            'elig_crit': {'include_criteria': [' '.join(rng.choices(words, k=rng.randrange(6))) for _ in range(rng.randrange(4))]},
+        })
+    return docs
+
+
+def write_docs(docs, path, ensure_ascii=True):
+    with open(path, "w", newline="\n", encoding="utf-8") as outfile:
+        writer = OffsetWriter(outfile, path)
+        for doc in docs:
+            writer.write(doc['id'], json.dumps(doc, ensure_ascii=ensure_ascii))
+        writer.close()
+
+
+
+class TestOffsetIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name, "out.jsonl")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_read_matches_scan(self):
+        docs = random_docs(200)
+        write_docs(docs, self.path)
+        self.assertTrue(offsets_path(self.path).is_file())
+        all_ids = sorted({doc['id'] for doc in docs})
+        rng = random.Random(1)
+        for k in (0, 1, 5, len(all_ids)):
+            get_only = set(rng.sample(all_ids, k)) | {'NCT_MISSING'}
+            expected = [doc for doc in docs if doc['id'] in get_only]
+            self.assertEqual(OffsetIndex.load(self.path).read(get_only), expected)
+            self.assertEqual(get_processed_data(self.path, get_only=get_only), expected)
+
+    def test_non_ascii_lines(self):
+        docs = random_docs(100, seed=4)
+        write_docs(docs, self.path, ensure_ascii=False)
+        get_only = {doc['id'] for doc in docs[::5]}
+        self.assertEqual(OffsetIndex.load(self.path).read(get_only), [doc for doc in docs if doc['id'] in get_only])
+
+    def test_lines_are_plain_jsonl(self):
+        docs = random_docs(50)
+        write_docs(docs, self.path)
+        self.assertEqual(get_processed_data(self.path), docs)
+
+    def test_empty_output(self):
+        write_docs([], self.path)
+        self.assertEqual(get_processed_data(self.path, get_only={'NCT00000001'}), [])
+
+    def test_stale_index_ignored(self):
+        docs = random_docs(40)
+        write_docs(docs, self.path)
+        rewritten = docs[::-1] + random_docs(3, seed=2)
+        with open(self.path, "w") as outfile:
+            for doc in rewritten:
+                outfile.write(json.dumps(doc) + "\n")
+        self.assertIsNone(OffsetIndex.load(self.path))
+        get_only = {doc['id'] for doc in docs[:5]}
+        self.assertEqual(get_processed_data(self.path, get_only=get_only), [doc for doc in rewritten if doc['id'] in get_only])
+
+    def test_no_index_for_devices(self):
+        with open(os.devnull, "w") as outfile:
+            writer = OffsetWriter(outfile, os.devnull)
+            writer.write('NCT00000001', '{}')
+            writer.close()
+        self.assertFalse(offsets_path(os.devnull).exists())
+
+
+
+class TestProcessDataOffsets(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name, "out.jsonl")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_docs(self):
+        config = CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=self.path)
+        doc_ids = [doc.id for doc in CTProc(config).process_data()]
+        index = OffsetIndex.load(self.path)
+        self.assertEqual(len(index), len(set(doc_ids)))
+        scanned = [json.loads(line) for line in self.path.read_text().splitlines()]
+        get_only = set(doc_ids[::3])
+        self.assertEqual(index.read(get_only), [doc for doc in scanned if doc['id'] in get_only])
+
+    def test_offsets_match_bytes_on_disk(self):
+        config = CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=self.path)
+        list(CTProc(config).process_data())
+        data = self.path.read_bytes()
+        self.assertNotIn(b"\r", data)
+        spans = sorted(span for spans in OffsetIndex.load(self.path).offsets.values() for span in spans)
+        self.assertEqual(spans[-1][0] + spans[-1][1] + 1, len(data))
+        for offset, length in spans:
+            self.assertEqual(data[offset + length:offset + length + 1], b"\n")
+            json.loads(data[offset:offset + length])
+
+    def test_topics(self):
+        config = CTConfig(test_topic_path, disable_tqdm=True, write_file=self.path, is_topic=True)
+        topic_ids = [topic.id for topic in CTProc(config).process_data()]
+        self.assertEqual([topic['id'] for topic in get_processed_data(self.path, get_only={topic_ids[-1]})], [topic_ids[-1]])
+
+    def test_disabled(self):
+        config = CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=self.path, write_offsets=False)
+        list(CTProc(config).process_data())
+        self.assertFalse(offsets_path(self.path).exists())
+
+    def test_partial_run_has_no_index(self):
+        config = CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=self.path)
+        docs = CTProc(config).process_data()
+        next(docs)
+        docs.close()
+        self.assertFalse(offsets_path(self.path).exists())
+
+
+
+if __name__ == "__main__":
+    unittest.main()
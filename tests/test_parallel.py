@@ -0,0 +1,130 @@
+import os
+import time
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+from zipfile import ZipFile
+
+from ctproc.ctconfig import CTConfig
+from ctproc.proc import CTProc
+from ctproc import parallel
+from ctproc.ent_cache import EntityCache
+from ctproc.instrument import StageStats
+from ctproc.parallel import imap_shards, shard_members
+from ctproc.utils import offsets_path
+
+from tests.test_nlp_batch import fake_nlp_tools
+
+
+test_doc_folder_path = Path(__file__).parent.joinpath("ct_doc_test_data.zip").as_posix()
+
+
+def _slow_first(shard):
+    # first shard finishes last, so completion order differs from input order
+    if shard[0] == 0:
+        time.sleep(0.3)
+    return shard
+
+
+class TestShardMembers(unittest.TestCase):
+
+    def test_contiguous_shards(self):
+        self.assertEqual(shard_members(["a", "b", "c", "d", "e"], 2), [["a", "b"], ["c", "d"], ["e"]])
+
+    def test_empty(self):
+        self.assertEqual(shard_members([], 4), [])
+
+    def test_nonpositive_shard_size(self):
+        self.assertEqual(shard_members(["a", "b"], 0), [["a"], ["b"]])
+
+
+class TestImapShards(unittest.TestCase):
+
+    def test_preserves_input_order(self):
+        shards = [[i] for i in range(6)]
+        results = list(imap_shards(_slow_first, shards, workers=3, preserve_order=True))
+        self.assertEqual(results, shards)
+
+    def test_completion_order(self):
+        shards = [[i] for i in range(6)]
+        results = list(imap_shards(_slow_first, shards, workers=3, preserve_order=False))
+        self.assertEqual(sorted(results), shards)
+        self.assertNotEqual(results[0], [0])
+
+
+class TestParallelDocProc(unittest.TestCase):
+
+    def _run(self, **kwargs):
+        config = CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=Path(self.tmp), **kwargs)
+        return [(doc.id, doc.condition, doc.elig_crit.include_criteria, doc.elig_crit.exclude_criteria,
+                 doc.elig_min_age, doc.elig_max_age) for doc in CTProc(config).process_data()]
+
+    def setUp(self):
+        fd, self.tmp = tempfile.mkstemp(suffix=".jsonl")
+        os.close(fd)
+
+    def tearDown(self):
+        Path(self.tmp).unlink()
+        offsets_path(self.tmp).unlink(missing_ok=True)
+
+    def test_matches_serial(self):
+        serial = self._run()
+        parallel = self._run(workers=2, shard_size=1)
+        self.assertGreater(len(serial), 0)
+        self.assertEqual(serial, parallel)
+
+    def test_unordered_same_docs(self):
+        serial = self._run()
+        parallel = self._run(workers=2, shard_size=1, preserve_order=False)
+        self.assertEqual(sorted(serial), sorted(parallel))
+
+    def test_writes_same_jsonl(self):
+        self._run()
+        serial_lines = Path(self.tmp).read_text().splitlines()
+        self._run(workers=2, shard_size=1)
+        self.assertEqual(serial_lines, Path(self.tmp).read_text().splitlines())
+
+
+class TestWorkerEntityCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_path = Path(self.tmpdir.name, "ents.sqlite")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_shard_writes_and_returns_counts(self):
+        # a worker's state, as _init_doc_worker() sets it, with a fake pipeline
+        proc = CTProc(CTConfig(test_doc_folder_path, disable_tqdm=True))
+        proc.config = proc.config._replace(nlp=True, add_ents=True, ent_cache=self.cache_path)
+        proc.nlp_tools = fake_nlp_tools()._replace(ent_cache=EntityCache(self.cache_path, version='fake'))
+        with ZipFile(test_doc_folder_path) as zip_reader, \
+                mock.patch.object(parallel, '_WORKER_PROC', proc), mock.patch.object(parallel, '_WORKER_ZIP', zip_reader):
+            members = zip_reader.namelist()
+            first = parallel._process_doc_shard(members)[4]
+            second = parallel._process_doc_shard(members)[4]
+        proc.nlp_tools.ent_cache.close()
+
+        self.assertEqual(first[0], 0)
+        self.assertGreater(first[1], 0)
+        self.assertEqual(second, (first[1], 0))
+        # the counts were written by the worker, with nothing left in its memory
+        stats = EntityCache(self.cache_path, version='fake').stats()
+        self.assertEqual((stats['total_hits'], stats['total_misses']), (first[1], first[1]))
+
+    def test_parent_merges_counts(self):
+        shards = [(1, [], StageStats({}, {}, {}), [], (3, 1)), (1, [], StageStats({}, {}, {}), [], (2, 4))]
+        fd, tmp = tempfile.mkstemp(suffix=".jsonl", dir=self.tmpdir.name)
+        os.close(fd)
+        config = CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=Path(tmp), nlp=False, workers=2,
+                          ent_cache=self.cache_path, write_offsets=False)
+        proc = CTProc(config)
+        with mock.patch('ctproc.proc.map_doc_shards', return_value=iter(shards)):
+            self.assertEqual(list(proc.process_data()), [])
+        self.assertEqual(proc.worker_cache_counts, [5, 5])
+
+
+if __name__ == "__main__":
+    unittest.main()
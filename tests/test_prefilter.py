@@ -0,0 +1,94 @@
+import random
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from ctproc.ctconfig import CTConfig
+from ctproc.proc import CTProc
+from ctproc.prefilter import DemographicIndex, gender_code
+
+
+test_doc_folder_path = Path(__file__).parent.joinpath("ct_doc_test_data.zip").as_posix()
+test_topic_path = Path(__file__).parent.joinpath("ct_topic_test_data.xml").as_posix()
+
+
+def loop_prefilter(docs, topics):
+    # the topics x docs double loop the index replaces
+    result = {}
+    for topic in topics:
+        result[topic['id']] = [
+            doc['id'] for doc in docs
+            if (topic['age'] is None or doc['elig_min_age'] <= topic['age'] <= doc['elig_max_age'])
+            and (gender_code(doc['elig_gender']) == 0 or gender_code(topic['gender']) in (0, gender_code(doc['elig_gender'])))
+        ]
+    return result
+
+
+def random_docs_and_topics(n_docs, n_topics, seed=0):
+    rng = random.Random(seed)
+    genders = ["All", "Male", "Female"]
+    docs = []
+    for i in range(n_docs):
+        min_age = rng.choice([0., 18., 18., 21., 40., 65., rng.uniform(0, 80)])
+        max_age = rng.choice([999., 999., 65., 75., 17., min_age + rng.uniform(0, 40)])
+        docs.append({'id': f"NCT{i:08d}", 'elig_min_age': min_age, 'elig_max_age': max_age, 'elig_gender': rng.choice(genders)})
+    topics = [
+        {'id': str(i), 'age': rng.choice([None, 18., 65., float(rng.randint(0, 90)), rng.uniform(0, 90)]), 'gender': rng.choice(genders + [None])}
+        for i in range(n_topics)
+    ]
+    return docs, topics
+
+
+class TestDemographicIndex(unittest.TestCase):
+
+    def test_matches_loop(self):
+        docs, topics = random_docs_and_topics(3000, 100)
+        index = DemographicIndex.from_docs(docs)
+        expected = loop_prefilter(docs, topics)
+        found = index.query_topics(topics)
+        self.assertEqual({topic_id: list(ids) for topic_id, ids in found.items()}, expected)
+
+    def test_bounds_inclusive(self):
+        index = DemographicIndex(["a", "b", "c"], [18., 0., 65.], [65., 17., 999.], ["All", "All", "All"])
+        self.assertEqual(list(index.candidates(18.)), [0])
+        self.assertEqual(list(index.candidates(65.)), [0, 2])
+        self.assertEqual(list(index.candidates(17.)), [1])
+        self.assertEqual(list(index.candidates(None)), [0, 1, 2])
+        self.assertEqual(list(index.candidates(float('nan'))), [0, 1, 2])
+
+    def test_gender(self):
+        index = DemographicIndex(["a", "b", "c"], [0., 0., 0.], [999., 999., 999.], ["All", "Male", "Female"])
+        self.assertEqual(list(index.candidates(30., "Male")), [0, 1])
+        self.assertEqual(list(index.candidates(30., "female")), [0, 2])
+        self.assertEqual(list(index.candidates(30., "All")), [0, 1, 2])
+        self.assertEqual(list(index.candidates(30., None)), [0, 1, 2])
+
+    def test_query_matrix(self):
+        docs, topics = random_docs_and_topics(500, 20, seed=1)
+        index = DemographicIndex.from_docs(docs)
+        matrix = index.query([topic['age'] for topic in topics], [topic['gender'] for topic in topics])
+        self.assertEqual(matrix.shape, (len(topics), len(docs)))
+        dense = matrix.toarray()
+        for i, topic in enumerate(topics):
+            self.assertEqual(list(np.flatnonzero(dense[i])), list(index.candidates(topic['age'], topic['gender'])))
+
+    def test_empty(self):
+        index = DemographicIndex([], [], [], [])
+        self.assertEqual(index.query([30.], ["Male"]).shape, (1, 0))
+        self.assertEqual(index.query([]).shape, (0, 0))
+
+    def test_processed_docs_and_topics(self):
+        doc_config = CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=Path("/dev/null"))
+        docs = list(CTProc(doc_config).process_data())
+        topic_config = CTConfig(test_topic_path, disable_tqdm=True, write_file=Path("/dev/null"), is_topic=True)
+        topics = list(CTProc(topic_config).process_data())
+
+        found = DemographicIndex.from_docs(docs).query_topics(topics)
+        doc_dicts = [vars(doc) for doc in docs]
+        topic_dicts = [{'id': topic.id, 'age': topic.age, 'gender': topic.gender} for topic in topics]
+        self.assertEqual({topic_id: list(ids) for topic_id, ids in found.items()}, loop_prefilter(doc_dicts, topic_dicts))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import os
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from ctproc.ctconfig import CTConfig
+from ctproc.proc import CTProc
+from ctproc.cttopic import CTTopic
+from ctproc.lab import LabIndex, LabValue, extract_lab_constraints, extract_lab_values, extract_lab_values_batch
+from ctproc.lab.reference_ranges import LAB_TESTS
+from ctproc.lab.patterns import reset_analyte_matcher
+from ctproc.utils import offsets_path
+
+
+test_doc_folder_path = Path(__file__).parent.joinpath("ct_doc_test_data.zip").as_posix()
+test_topic_path = Path(__file__).parent.joinpath("ct_topic_test_data.xml").as_posix()
+
+
+class TestExtractLabValuesBatch(unittest.TestCase):
+
+    def test_matches_one_at_a_time(self):
+        texts = ["Creatinine: 0.9 mg/dL", "", "no labs here", "Hemoglobin < 9 g/dL and platelets 100,000/uL"]
+        self.assertEqual(extract_lab_values_batch(texts), [extract_lab_values(text) for text in texts])
+
+    def test_empty(self):
+        self.assertEqual(extract_lab_values_batch([]), [])
+
+
+class TestProcLabs(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.tmp = tempfile.mkstemp(suffix=".jsonl")
+        os.close(fd)
+
+    def tearDown(self):
+        Path(self.tmp).unlink()
+        offsets_path(self.tmp).unlink(missing_ok=True)
+
+    def _docs(self, **kwargs):
+        config = CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=Path(self.tmp), add_labs=True, **kwargs)
+        return list(CTProc(config).process_data())
+
+    def test_doc_labs_per_criterion(self):
+        docs = self._docs()
+        self.assertGreater(len(docs), 0)
+        for doc in docs:
+            self.assertEqual(doc.inc_labs, [extract_lab_values(crit) for crit in doc.elig_crit.include_criteria])
+            self.assertEqual(doc.exc_labs, [extract_lab_values(crit) for crit in doc.elig_crit.exclude_criteria])
+        self.assertTrue(any(labs for doc in docs for labs in doc.inc_labs + doc.exc_labs))
+
+    def test_doc_labs_written(self):
+        docs = self._docs()
+        lines = [json.loads(line) for line in Path(self.tmp).read_text().splitlines()]
+        for doc, line in zip(docs, lines):
+            self.assertEqual(line['inc_labs'], [[vars(val) for val in labs] for labs in doc.inc_labs])
+            self.assertEqual(line['exc_labs'], [[vars(val) for val in labs] for labs in doc.exc_labs])
+
+    def test_off_by_default(self):
+        config = CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=Path(self.tmp))
+        for doc in CTProc(config).process_data():
+            self.assertFalse(hasattr(doc, 'inc_labs'))
+
+    def test_parallel_matches_serial(self):
+        serial = [(doc.id, doc.inc_labs, doc.exc_labs) for doc in self._docs()]
+        parallel = [(doc.id, doc.inc_labs, doc.exc_labs) for doc in self._docs(workers=2, shard_size=1)]
+        self.assertEqual(serial, parallel)
+
+    def test_instrumented_stage(self):
+        config = CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=Path(self.tmp), add_labs=True, instrument=True)
+        proc = CTProc(config)
+        list(proc.process_data())
+        self.assertIn('labs', proc.instrument.stats().seconds)
+
+    def test_topic_labs(self):
+        config = CTConfig(test_topic_path, disable_tqdm=True, write_file=Path(self.tmp), add_labs=True, is_topic=True)
+        topics = list(CTProc(config).process_data())
+        self.assertGreater(len(topics), 0)
+        for topic in topics:
+            self.assertEqual(topic.lab_sents, [extract_lab_values(topic.raw_text)])
+
+    def test_topic_labs_off_by_default(self):
+        config = CTConfig(test_topic_path, disable_tqdm=True, write_file=Path(self.tmp), is_topic=True)
+        for topic in CTProc(config).process_data():
+            self.assertFalse(hasattr(topic, 'lab_sents'))
+        for line in Path(self.tmp).read_text().splitlines():
+            self.assertNotIn('lab_sents', json.loads(line))
+
+    def test_topic_labs_per_sentence(self):
+        topic = CTTopic(id='1', raw_text="Creatinine: 0.9 mg/dL. TSH: 2.35 mU/L")
+        topic.text_sents = ["Creatinine: 0.9 mg/dL.", "No complaints.", "TSH: 2.35 mU/L"]
+        topic.add_lab_values()
+        self.assertEqual([[val.analyte for val in labs] for labs in topic.lab_sents], [["Creatinine"], [], ["TSH"]])
+        self.assertIsInstance(topic.lab_sents[0][0], LabValue)
+
+
+class TestProcAnalyteTable(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = dict(LAB_TESTS)
+        self.saved_aliases = {id(t): list(t.aliases) for t in LAB_TESTS.values()}
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        for lab_test in LAB_TESTS.values():
+            if id(lab_test) in self.saved_aliases:
+                lab_test.aliases[:] = self.saved_aliases[id(lab_test)]
+        LAB_TESTS.clear()
+        LAB_TESTS.update(self.saved)
+        reset_analyte_matcher()
+        self.tmpdir.cleanup()
+
+    def test_table_loaded_by_config(self):
+        table = Path(self.tmpdir.name, "analytes.csv")
+        table.write_text("name,aliases,unit\nHaptoglobin,Hp,mg/dL\n")
+        config = CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=Path(self.tmpdir.name, "out.jsonl"),
+                          add_labs=True, analyte_table=table, max_trials=1)
+        proc = CTProc(config)
+        vals = extract_lab_values("Haptoglobin 25 mg/dL", proc.analyte_table)
+        self.assertEqual([(val.analyte, val.value) for val in vals], [("Haptoglobin", 25.0)])
+
+    def test_table_scoped_to_proc(self):
+        table = Path(self.tmpdir.name, "analytes.csv")
+        table.write_text("name,aliases,unit\nHaptoglobin,Hp,mg/dL\nHemoglobin,Haemoglobin,\n")
+        config = CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=Path(self.tmpdir.name, "out.jsonl"),
+                          add_labs=True, analyte_table=table, max_trials=1)
+        proc = CTProc(config)
+        self.assertEqual(LAB_TESTS, self.saved)
+        self.assertNotIn("Haemoglobin", LAB_TESTS["hemoglobin"].aliases)
+        self.assertEqual(extract_lab_values("Haptoglobin 25 mg/dL haemoglobin 9"), [])
+        vals = extract_lab_values("Haptoglobin 25 mg/dL haemoglobin 9", proc.analyte_table)
+        self.assertEqual([(val.analyte, val.value) for val in vals], [("Haptoglobin", 25.0), ("Hemoglobin", 9.0)])
+
+        # a CTProc without the table still finds only the built-in lab tests
+        plain = CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=Path(self.tmpdir.name, "plain.jsonl"), add_labs=True)
+        for doc in CTProc(plain).process_data():
+            self.assertEqual(doc.inc_labs, [extract_lab_values(crit) for crit in doc.elig_crit.include_criteria])
+
+    def test_table_constraints_reach_index(self):
+        table = Path(self.tmpdir.name, "analytes.csv")
+        table.write_text("name,aliases,unit\nHaptoglobin,Hp,mg/dL\n")
+        config = CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=Path(self.tmpdir.name, "out.jsonl"),
+                          add_labs=True, analyte_table=table, max_trials=1)
+        proc = CTProc(config)
+        criteria = ["Haptoglobin >= 25 mg/dL", "Hp below 300 mg/dL"]
+        self.assertEqual(extract_lab_constraints(criteria[0]), [])
+        constraints = extract_lab_constraints(criteria[0], table=proc.analyte_table)
+        self.assertEqual([(c.analyte, c.comparator, c.threshold) for c in constraints], [("Haptoglobin", ">=", 25.0)])
+
+        doc = SimpleNamespace(
+            id="NCT1", elig_crit=SimpleNamespace(include_criteria=criteria, exclude_criteria=[]),
+            inc_labs=[extract_lab_values(crit, proc.analyte_table) for crit in criteria], exc_labs=[],
+        )
+        index = LabIndex.from_docs([doc], proc.analyte_table)
+        self.assertEqual(index.n_constraints(), 2)
+        self.assertEqual(list(index.screen_ids({"hp": 10.0})), [])
+        self.assertEqual(list(index.screen_ids({"Haptoglobin": 100.0})), ["NCT1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import gzip
+import json
+import random
+import tempfile
+import tracemalloc
+import unittest
+from pathlib import Path
+
+from ctproc.ctconfig import CTConfig
+from ctproc.proc import CTProc
+from ctproc.utils import field_tree, get_processed_data, iter_processed_data, project_json
+
+from tests.test_offsets import random_docs, write_docs
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+test_doc_folder_path = Path(__file__).parent.joinpath("ct_doc_test_data.zip").as_posix()
+
+EVAL_FIELDS = ['id', 'elig_min_age', 'elig_max_age', 'elig_gender', 'elig_crit.include_criteria', 'elig_crit.exclude_criteria']
+
+
+def loop_project(value, tree):
+    """the fields of the tree kept from a fully parsed value"""
+    if not isinstance(value, dict):
+        return value
+    return {key: val if tree[key] is None else loop_project(val, tree[key]) for key, val in value.items() if key in tree}
+
+
+def random_value(rng, depth=0):
+    roll = rng.random()
+    if depth > 3 or roll < 0.4:
+        return rng.choice([None, True, False, 0, -2.5e3, 1e-7, "", "a[b]{c}", 'say "no"\\', "café ≥ 7%", "\n\t"])
+    if roll < 0.7:
+        return [random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+    return {rng.choice('abcde'): random_value(rng, depth + 1) for _ in range(rng.randrange(4))}
+
+
+
+class TestProjectJson(unittest.TestCase):
+
+    def test_fuzz_matches_loads(self):
+        rng = random.Random(0)
+        for _ in range(3000):
+            obj = {'id': 'NCT00000001', **{key: random_value(rng) for key in rng.sample('abcde', 3)}}
+            fields = rng.sample(['a', 'b', 'c.a', 'c.b', 'd.e.a', 'e', 'missing'], rng.randrange(4))
+            tree = field_tree(fields)
+            line = json.dumps(obj, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 1]))
+            self.assertEqual(project_json(line, tree), loop_project(obj, tree))
+
+    def test_field_tree(self):
+        self.assertEqual(field_tree([]), {'id': None})
+        self.assertEqual(field_tree(['elig_crit.include_criteria', 'elig_gender']), {'id': None, 'elig_crit': {'include_criteria': None}, 'elig_gender': None})
+        self.assertEqual(field_tree(['elig_crit', 'elig_crit.include_criteria']), {'id': None, 'elig_crit': None})
+        self.assertEqual(field_tree(['elig_crit.include_criteria', 'elig_crit']), {'id': None, 'elig_crit': None})
+
+    def test_skipped_values_not_parsed(self):
+        # a skipped value is only bracket counted, it isn't turned into objects
+        line = '{"id": "NCT00000001", "inc_ents": [[1, 2] [3]], "elig_gender": "All"}'
+        self.assertEqual(project_json(line, field_tree(['elig_gender'])), {'id': 'NCT00000001', 'elig_gender': 'All'})
+
+    def test_malformed(self):
+        for line in ('{"id": "a"', '{"id" "a"}', '{"x": [1, 2', '{"x": "a, "id": 1}', '{id: 1}'):
+            with self.assertRaises(json.JSONDecodeError):
+                project_json(line, field_tree(['y']))
+
+
+
+class TestIterProcessedData(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name, "out.jsonl")
+        self.docs = random_docs(300)
+        write_docs(self.docs, self.path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _gzip(self):
+        path = Path(self.tmpdir.name, "out.jsonl.gz")
+        with gzip.open(path, 'wb') as outfile:
+            outfile.write(self.path.read_bytes())
+        return path
+
+    def test_lazy(self):
+        docs = iter_processed_data(self.path)
+        self.assertEqual(next(docs), self.docs[0])
+        self.assertEqual(list(docs), self.docs[1:])
+
+    def test_fields(self):
+        tree = field_tree(['elig_min_age', 'elig_crit.include_criteria'])
+        expected = [loop_project(doc, tree) for doc in self.docs]
+        self.assertEqual(list(iter_processed_data(self.path, fields=['elig_min_age', 'elig_crit.include_criteria'])), expected)
+        self.assertEqual(get_processed_data(self.path, fields=['elig_min_age', 'elig_crit.include_criteria']), expected)
+
+    def test_get_only(self):
+        get_only = {doc['id'] for doc in self.docs[::7]}
+        expected = [doc for doc in self.docs if doc['id'] in get_only]
+        self.assertEqual(list(iter_processed_data(self.path, get_only=get_only)), expected)
+        self.assertEqual(get_processed_data(self.path, get_only=get_only, fields=['elig_min_age']), [{'id': doc['id'], 'elig_min_age': doc['elig_min_age']} for doc in expected])
+
+    def test_gzip(self):
+        path = self._gzip()
+        self.assertEqual(list(iter_processed_data(path)), self.docs)
+        self.assertEqual(get_processed_data(path, get_only={self.docs[3]['id']}), [doc for doc in self.docs if doc['id'] == self.docs[3]['id']])
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_zstd(self):
+        path = Path(self.tmpdir.name, "out.jsonl.zst")
+        path.write_bytes(zstandard.ZstdCompressor().compress(self.path.read_bytes()))
+        self.assertEqual(list(iter_processed_data(path, fields=['elig_min_age'])), [{'id': doc['id'], 'elig_min_age': doc['elig_min_age']} for doc in self.docs])
+
+    @unittest.skipIf(zstandard is not None, "zstandard is installed")
+    def test_zstd_missing(self):
+        path = Path(self.tmpdir.name, "out.jsonl.zst")
+        path.write_bytes(b'\x28\xb5\x2f\xfd' + bytes(16))
+        with self.assertRaisesRegex(ImportError, "zstandard"):
+            list(iter_processed_data(path))
+
+    def test_blank_lines_skipped(self):
+        self.path.write_text('\n' + self.path.read_text() + '\n\n')
+        self.assertEqual(list(iter_processed_data(self.path)), self.docs)
+
+    def test_constant_memory(self):
+        # peak memory of a pass is that of a doc at a time, not of the corpus
+        path = Path(self.tmpdir.name, "big.jsonl")
+        write_docs(random_docs(5000, seed=3), path)
+        for read_path in (path, self._gzip()):
+            tracemalloc.start()
+            for _ in iter_processed_data(read_path):
+                pass
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.assertLess(peak, path.stat().st_size // 4)
+
+    def test_processed_docs(self):
+        config = CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=self.path, write_offsets=False)
+        list(CTProc(config).process_data())
+        full = get_processed_data(self.path)
+        tree = field_tree(EVAL_FIELDS)
+        self.assertEqual(list(iter_processed_data(self.path, fields=EVAL_FIELDS)), [loop_project(doc, tree) for doc in full])
+        for doc in iter_processed_data(self.path, fields=EVAL_FIELDS):
+            self.assertEqual(set(doc), {'id', 'elig_min_age', 'elig_max_age', 'elig_gender', 'elig_crit'})
+            self.assertEqual(set(doc['elig_crit']), {'include_criteria', 'exclude_criteria'})
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,262 @@
+import json
+import math
+import mmap
+import random
+import tempfile
+import unittest
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from ctproc.ctconfig import CTConfig
+from ctproc.prefilter import DemographicIndex
+from ctproc.proc import CTProc
+from ctproc.retrieval import BM25Index, analyze, build_field_indexes, field_text, load_field_indexes, read_json_collection, stem
+from ctproc.retrieval.bm25 import LENGTH_TABLE, length_norms
+from tests.test_prefilter import random_docs_and_topics
+
+
+test_doc_folder_path = Path(__file__).parent.joinpath("ct_doc_test_data.zip").as_posix()
+
+# hits of pyserini's LuceneSearcher (set_bm25(0.9, 0.4)) over an index of the docs built by anserini's
+# IndexCollection. pyserini rounds the scores to 4 decimals and lowers tied ones by 1e-6 each
+pyserini_hits_path = Path(__file__).parent.joinpath("pyserini_bm25_hits.json")
+
+WORDS = (
+    "patient patients diabetes diabetic mellitus type insulin heart failure cardiac renal kidney liver "
+    "hepatic cancer tumor metastatic chemotherapy history of prior treatment with the and or not pregnant "
+    "women age years hemoglobin platelets creatinine infection hiv hepatitis study trial consent"
+).split()
+
+
+def loop_bm25(texts, query, k1=0.9, b=0.4):
+    # lucene's bm25, one document at a time in float64, what the index computes with sparse products
+    docs = [Counter(analyze(text)) for text in texts]
+    lengths = [sum(doc.values()) for doc in docs]
+    doc_count = sum(1 for length in lengths if length)
+    avgdl = sum(lengths) / doc_count
+    scores = {}
+    for term, qtf in Counter(analyze(query)).items():
+        df = sum(1 for doc in docs if term in doc)
+        if df == 0:
+            continue
+        idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+        for i, doc in enumerate(docs):
+            if term in doc:
+                dl = LENGTH_TABLE[length_norms(np.array([lengths[i]]))[0]]
+                tf = doc[term]
+                scores[i] = scores.get(i, 0.) + qtf * idf * tf / (tf + k1 * (1 - b + b * dl / avgdl))
+    return scores
+
+
+def random_texts(n_texts, seed=0, max_words=200):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(0, max_words))) for _ in range(n_texts)]
+
+
+class TestAnalyzer(unittest.TestCase):
+
+    def test_porter(self):
+        expected = {
+            "caresses": "caress", "ponies": "poni", "agreed": "agre", "plastered": "plaster", "motoring": "motor",
+            "hopping": "hop", "falling": "fall", "filing": "file", "happy": "happi", "relational": "relat",
+            "conditional": "condit", "vietnamization": "vietnam", "sensibiliti": "sensibl", "electrical": "electr",
+            "adoption": "adopt", "controll": "control", "generalization": "gener", "diabetes": "diabet", "as": "as",
+        }
+        self.assertEqual({word: stem(word) for word in expected}, expected)
+
+    def test_analyze(self):
+        self.assertEqual(
+            analyze("The patient's HbA1c is >= 7.5% and 100,000 cells/mm3, no history of myocardial infarctions"),
+            ["patient", "hba1c", "7.5", "100,000", "cell", "mm3", "histori", "myocardi", "infarct"],
+        )
+        self.assertEqual(analyze(""), [])
+        self.assertEqual(analyze(None), [])
+
+
+class TestLengthNorms(unittest.TestCase):
+
+    def test_exact_when_short(self):
+        lengths = np.arange(40)
+        self.assertEqual(list(LENGTH_TABLE[length_norms(lengths)]), list(lengths))
+
+    def test_rounds_down(self):
+        lengths = np.arange(1, 100000, 7)
+        decoded = LENGTH_TABLE[length_norms(lengths)]
+        self.assertTrue(np.all(decoded <= lengths))
+        self.assertTrue(np.all(decoded > lengths * 0.88))
+        self.assertTrue(np.all(np.diff(decoded) >= 0))
+
+
+class TestBM25Index(unittest.TestCase):
+
+    def assertMatchesLoop(self, index, texts, queries, k1=0.9, b=0.4):
+        for query, hits in zip(queries, index.search_batch(queries, k=len(texts))):
+            expected = loop_bm25(texts, query, k1, b)
+            self.assertEqual({hit.docid for hit in hits}, {str(i) for i in expected})
+            for hit in hits:
+                self.assertAlmostEqual(hit.score, expected[int(hit.docid)], delta=1e-5 * expected[int(hit.docid)])
+
+    def test_matches_loop(self):
+        texts = random_texts(300)
+        queries = random_texts(20, seed=1, max_words=30)
+        index = BM25Index.build([str(i) for i in range(len(texts))], texts)
+        self.assertMatchesLoop(index, texts, queries)
+
+    def test_parameters(self):
+        texts = random_texts(100, seed=2)
+        queries = random_texts(5, seed=3, max_words=10)
+        index = BM25Index.build([str(i) for i in range(len(texts))], texts, k1=1.2, b=0.75)
+        self.assertMatchesLoop(index, texts, queries, k1=1.2, b=0.75)
+
+    def test_ranking(self):
+        texts = ["heart failure", "diabetes", "diabetes diabetes insulin", "diabetes", "heart"]
+        index = BM25Index.build(["e", "d", "c", "b", "a"], texts)
+        hits = index.search("diabetes insulin")
+        self.assertEqual([hit.docid for hit in hits], ["c", "b", "d"])
+        self.assertTrue(hits[0].score > hits[1].score)
+        # ties in docid order as pyserini breaks them, not in document order, also when cut at k
+        self.assertEqual([hit.docid for hit in index.search("diabetes", k=2)], ["c", "b"])
+        self.assertEqual(index.search("unknown words"), [])
+
+    def test_matches_pyserini(self):
+        fixture = json.loads(pyserini_hits_path.read_text(encoding='utf-8'))
+        ids, texts = zip(*((doc['id'], doc['contents']) for doc in fixture['docs']))
+        index = BM25Index.build(ids, texts, k1=fixture['k1'], b=fixture['b'])
+        queries = list(fixture['hits'])
+        for query, hits in zip(queries, index.search_batch(queries, k=fixture['k'])):
+            expected = fixture['hits'][query]
+            self.assertEqual([hit.docid for hit in hits], [docid for docid, _ in expected], query)
+            for hit, (_, score) in zip(hits, expected):
+                self.assertAlmostEqual(hit.score, score, delta=1e-4)
+
+    def test_batches(self):
+        texts = random_texts(200, seed=4)
+        queries = random_texts(10, seed=5, max_words=20)
+        index = BM25Index.build([str(i) for i in range(len(texts))], texts)
+        self.assertEqual(index.search_batch(queries, k=50, batch_size=3), [index.search(query, k=50) for query in queries])
+
+    def test_save_load(self):
+        texts = random_texts(100, seed=6)
+        queries = random_texts(5, seed=7, max_words=20)
+        index = BM25Index.build([f"NCT{i:08d}" for i in range(len(texts))], texts)
+        with tempfile.TemporaryDirectory() as tmp:
+            index.save(tmp)
+            for mapped in (True, False):
+                loaded = BM25Index.load(tmp, mmap=mapped)
+                self.assertEqual(loaded.search_batch(queries), index.search_batch(queries))
+                self.assertEqual((loaded.k1, loaded.b, loaded.doc_count), (index.k1, index.b, index.doc_count))
+            data = BM25Index.load(tmp).postings.data
+            while not isinstance(data, mmap.mmap):
+                data = data.base
+            self.assertIsNotNone(data)
+
+    def test_empty(self):
+        index = BM25Index.build([], [])
+        self.assertEqual(index.search("diabetes"), [])
+        with tempfile.TemporaryDirectory() as tmp:
+            index.save(tmp)
+            self.assertEqual(len(BM25Index.load(tmp)), 0)
+
+    def test_json_collection(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(Path(tmp) / "docs.jsonl", "w") as f:
+                for doc_id, contents in [("NCT1", "type 2 diabetes"), ("NCT2", "heart failure")]:
+                    f.write(json.dumps({"id": doc_id, "contents": contents}) + "\n")
+            ids, texts = read_json_collection(tmp)
+        self.assertEqual(ids, ["NCT1", "NCT2"])
+        self.assertEqual(BM25Index.build(ids, texts).search("diabetic")[0].docid, "NCT1")
+
+
+class TestCandidates(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.texts = random_texts(2000, seed=8)
+        cls.ids = [f"NCT{i:08d}" for i in range(len(cls.texts))]
+        cls.queries = random_texts(20, seed=9, max_words=40)
+        cls.index = BM25Index.build(cls.ids, cls.texts)
+        cls.full = cls.index.search_batch(cls.queries, k=len(cls.texts))
+
+    def assertFiltered(self, hits, candidate_ids, full, k):
+        self.assertEqual(hits, [hit for hit in full if hit.docid in candidate_ids][:k])
+
+    def test_matches_filtered_search(self):
+        rng = random.Random(0)
+        candidates = [set(rng.sample(self.ids, rng.randint(0, 600))) for _ in self.queries]
+        for hits, candidate_ids, full in zip(self.index.search_batch(self.queries, k=50, candidates=candidates), candidates, self.full):
+            self.assertFiltered(hits, candidate_ids, full, 50)
+
+    def test_positions_and_unknown_ids(self):
+        positions = np.arange(0, len(self.ids), 3)
+        hits = self.index.search(self.queries[0], k=100, candidates=positions)
+        self.assertFiltered(hits, {self.ids[i] for i in positions}, self.full[0], 100)
+        hits = self.index.search(self.queries[0], k=100, candidates=["nope", self.ids[5], self.ids[5]])
+        self.assertFiltered(hits, {self.ids[5]}, self.full[0], 100)
+        self.assertEqual(self.index.search(self.queries[0], candidates=[]), [])
+
+    def test_all_or_few_candidates(self):
+        # many candidates are scored with the postings of the query terms, few with their own rows
+        for candidate_ids in (self.ids, self.ids[:10]):
+            for query, full in zip(self.queries[:5], self.full):
+                self.assertFiltered(self.index.search(query, k=100, candidates=candidate_ids), set(candidate_ids), full, 100)
+
+    def test_shared_candidates(self):
+        shared = np.asarray(self.ids[::2], dtype=object)
+        candidates = [shared] * len(self.queries)
+        found = self.index.search_batch(self.queries, k=20, batch_size=6, candidates=candidates)
+        for hits, full in zip(found, self.full):
+            self.assertFiltered(hits, set(shared), full, 20)
+
+    def test_prefilter_candidates(self):
+        docs, topics = random_docs_and_topics(len(self.ids), len(self.queries))
+        for doc, doc_id in zip(docs, self.ids):
+            doc['id'] = doc_id
+        eligible = DemographicIndex.from_docs(docs).query_topics(topics)
+        candidates = [eligible[topic['id']] for topic in topics]
+        found = self.index.search_batch(self.queries, k=30, candidates=candidates)
+        for hits, candidate_ids, full in zip(found, candidates, self.full):
+            self.assertFiltered(hits, set(candidate_ids), full, 30)
+
+    def test_loaded(self):
+        candidates = [self.ids[:500]] * 3
+        with tempfile.TemporaryDirectory() as tmp:
+            self.index.save(tmp)
+            loaded = BM25Index.load(tmp)
+            self.assertEqual(loaded.search_batch(self.queries[:3], candidates=candidates), self.index.search_batch(self.queries[:3], candidates=candidates))
+
+    def test_one_set_per_query(self):
+        with self.assertRaises(ValueError):
+            self.index.search_batch(self.queries, candidates=[self.ids])
+
+
+class TestFieldIndexes(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        config = CTConfig(test_doc_folder_path, disable_tqdm=True, write_file=Path("/dev/null"))
+        cls.docs = list(CTProc(config).process_data())
+
+    def test_fields(self):
+        doc = next(doc for doc in self.docs if doc.elig_crit.include_criteria)
+        self.assertEqual(field_text(doc, "include"), "\n".join(doc.elig_crit.include_criteria))
+        self.assertEqual(field_text(json.loads(json.dumps(doc, default=lambda o: o.__dict__)), "include"), field_text(doc, "include"))
+        self.assertEqual(field_text({"id": "x"}, "exclude"), "")
+
+    def test_build_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            indexes = build_field_indexes(self.docs, tmp)
+            self.assertEqual(set(indexes), {"contents", "include", "exclude"})
+            loaded = load_field_indexes(tmp)
+            for field, index in indexes.items():
+                texts = [field_text(doc, field) for doc in self.docs]
+                queries = [text for text in texts if text][:3]
+                self.assertEqual(loaded[field].search_batch(queries), index.search_batch(queries))
+                for query, hits in zip(queries, index.search_batch(queries, k=len(texts))):
+                    expected = loop_bm25(texts, query)
+                    self.assertEqual({hit.docid for hit in hits}, {self.docs[i].id for i in expected})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,72 @@
+import random
+import re
 import unittest
+from ctproc import utils
 from ctproc.utils import (
-    clean_sentences, convert_age_to_year, filter_words,
+    clean_sentences, clean_sentences_batch, convert_age_to_year, filter_words,
     remove_leading_number, fix_sentence, check_word,
 )
 from ctproc.skip_crit import SKIP_CRIT
 
 
+def legacy_clean_sentences(sent_list):
+    """clean_sentences, fix_sentence, check_word and remove_leading_number before clean_sentences_batch"""
+    def legacy_check_word(word):
+        w = word.strip(":-,")
+        if re.match(r'[A-Z][A-Z][A-Z][A-Z][A-Z][A-Z]+(?: [A-Z]+)?', w):
+            return False
+        return w.lower() not in ["criteria", "include", "exclude", "inclusion", "exclusion", "eligibility"]
+
+    new_sents = []
+    for sent in sent_list:
+        for s in re.split(r"- ", sent):
+            s = ' '.join([w for w in s.split() if legacy_check_word(w)]).strip('.,;:')
+            m = re.match(r'\d+. *(?P<crit>.*)', s)
+            if m is not None:
+                s = m['crit']
+            if len(s) > 2 and s not in SKIP_CRIT:
+                new_sents.append(s)
+    return new_sents
+
+
+# words and separators around every branch of the cleaning steps
+FUZZ_TOKENS = [
+    'Patients', 'with', 'diabetes', 'HIV', 'ECOG', 'DISEASE', 'DISEASES:', 'CHARACTERISTICS', 'ABCDEf', 'ÄBCDEFG',
+    'Inclusion', 'criteria:', 'EXCLUSION', 'exclusion,', '-exclude-', 'İnclusion', 'ELİGİBİLİTY', 'eligibility.',
+    '1.', '12.', '12', '1', '3x', '١٢.', '²', '0.5', 'mg/dL', 'may apply', 'PRIOR', 'Inclusion', '.', ',;', ':',
+    ' ', '  ', '- ', '-', ' - ', '\n', '\n   ', '\t', '\u2028', '\x85', '\xa0',
+]
+
+
+class TestCleanSentencesBatch(unittest.TestCase):
+
+    def test_fuzz_parity(self):
+        rng = random.Random(0)
+        sent_lists = [
+            [''.join(rng.choice(FUZZ_TOKENS) for _ in range(rng.randint(0, 25))) for _ in range(rng.randint(0, 4))]
+            for _ in range(3000)
+        ]
+        self.assertEqual(clean_sentences_batch(sent_lists), [legacy_clean_sentences(sents) for sents in sent_lists])
+        for sents in sent_lists[:500]:
+            self.assertEqual(clean_sentences(sents), legacy_clean_sentences(sents))
+
+
+    def test_skip_crit_parity(self):
+        sents = list(SKIP_CRIT) + [f"1. {skip}" for skip in SKIP_CRIT] + [f"- {skip}." for skip in SKIP_CRIT]
+        self.assertEqual(clean_sentences(sents), legacy_clean_sentences(sents))
+
+
+    def test_word_cache_bounded(self):
+        size = utils.WORD_CACHE_SIZE
+        try:
+            utils.WORD_CACHE_SIZE = 10
+            result = clean_sentences_batch([[' '.join(f"word{i}" for i in range(100))], ['DISEASE criteria kept']])
+            self.assertEqual(result, [[' '.join(f"word{i}" for i in range(100))], ['kept']])
+            self.assertLessEqual(len(utils._word_verdicts), 10)
+        finally:
+            utils.WORD_CACHE_SIZE = size
+
+
 class TestConvertAgeToYear(unittest.TestCase):
     """Age conversion using formats from actual ClinicalTrials.gov XML."""
 